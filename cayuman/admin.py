@@ -1,15 +1,37 @@
+from functools import wraps
+from typing import Dict
+from typing import Optional
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelectMultiple
 from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import Group
+from django.db.models import Exists
+from django.db.models import FilteredRelation
+from django.db.models import OuterRef
 from django.db.models import Q
+from django.db.models import Value
+from django.db.models.functions import Concat
 from django.urls import path
 from django.urls import reverse_lazy as reverse
 from django.utils.functional import lazy
 from django.utils.html import format_html
+from django.utils.http import urlencode
+from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
+from .caching import cycle_timetable_cache_key
+from .exports import Column
+from .exports import column_rows
+from .exports import instance_rows
+from .exports import roster_files
+from .exports import stream_csv
+from .exports import stream_zip
 from .forms import AdminMemberChangeForm
 from .forms import AdminStudentCycleForm
 from .forms import AdminWorkshopPeriodForm
+from .middleware import get_current_request
 from .models import Cycle
 from .models import Member
 from .models import Period
@@ -17,83 +39,159 @@ from .models import Schedule
 from .models import StudentCycle
 from .models import Workshop
 from .models import WorkshopPeriod
+from .occupancy import get_occupancy
+from .pagination import carried_count
+from .pagination import COUNT_VAR
+from .pagination import CURSOR_VAR
+from .pagination import keyset_page
+from .streaming import render_rows
+from .streaming import render_with_chunks
 
 
 # Setting the name of the django admin panel
 admin.site.site_header = "Cayuman"
 
+# Stands for each row's id in HTML rendered once for every row of a changelist
+OBJECT_ID_PLACEHOLDER = "__object_id__"
+
+
+def per_request(func):
+    """
+    Caches `func(*args)` on the current request, for values list display methods would otherwise compute once per row.
+    Outside requests it's just called
+    """
+
+    @wraps(func)
+    def wrapper(*args):
+        request = get_current_request()
+        if request is None:
+            return func(*args)
+        memo = request.__dict__.setdefault("_per_request_memo", {})
+        key = (func, *args)
+        if key not in memo:
+            memo[key] = func(*args)
+        return memo[key]
+
+    return wrapper
+
+
+@per_request
+def display_period() -> Period:
+    """Period list columns are about, the current or last one"""
+    return Period.objects.current_or_last()
+
+
+@per_request
+def schedules_count() -> int:
+    return Schedule.objects.count()
+
+
+@per_request
+def periods_dropdown(view: str, exclude_period_id: int) -> Optional[str]:
+    """Dropdown linking `view` for every period but `exclude_period_id`. Rows replace `OBJECT_ID_PLACEHOLDER` with their id"""
+    from django.template.loader import render_to_string
+
+    periods = Period.objects.exclude(id=exclude_period_id).order_by("-id")
+    if periods:
+        return render_to_string("admin/periods_dropdown.html", {"periods": periods, "obj": {"id": OBJECT_ID_PLACEHOLDER}, "view": view})
+    return None
+
+
+def row_periods_dropdown(view: str, obj) -> Optional[str]:
+    html = periods_dropdown(view, display_period().id)
+    return mark_safe(html.replace(OBJECT_ID_PLACEHOLDER, str(obj.id))) if html else None
+
+
+def autocomplete_source(request) -> Optional[str]:
+    """`model_name.field_name` an admin autocomplete request looks options up for, None for other requests"""
+    match = getattr(request, "resolver_match", None)
+    if match is None or match.url_name != "autocomplete":
+        return None
+    return f"{request.GET.get('model_name')}.{request.GET.get('field_name')}"
+
+
+class FilteredAutocompleteSelectMultiple(AutocompleteSelectMultiple):
+    """Autocomplete widget sending `params` along with each lookup, so `get_search_results` can narrow options down"""
+
+    params: Dict[str, str] = {}
+
+    def get_url(self):
+        url = super().get_url()
+        return f"{url}?{urlencode(self.params)}" if self.params else url
+
 
 # actions
 def create_export_to_csv_action(fields):
-    """Factory function to create an export_to_csv admin action for specified fields."""
-    import csv
-    import re
-    from django.http import HttpResponse
-    from django.utils.html import strip_tags
+    """
+    Factory function to create an export_to_csv admin action for specified fields, streaming rows as they're read.
+    Fields can be names of admin display methods or model attributes, read from each instance, or `Column`s, all read
+    with a single `values()` query. `Column` lookups can use annotations added by the admin's `get_export_queryset`
+    """
+    use_values = all(isinstance(field, Column) for field in fields)
+
+    def get_header(modeladmin, field):
+        """Header of a field: its `Column` header, the short_description of admin methods or the model field verbose_name"""
+        if isinstance(field, Column):
+            return str(field.header)
+        try:
+            if hasattr(modeladmin, field):
+                field_obj = getattr(modeladmin, field)
+                if callable(field_obj) and hasattr(field_obj, "short_description"):
+                    return str(getattr(field_obj, "short_description"))
+            # This is used when field is neither a method nor directly available as a field
+            return str(modeladmin.model._meta.get_field(field).verbose_name)
+        except Exception:
+            # Fallback to field name if it's neither in model fields nor an annotated method
+            return field
 
     def export_to_csv(modeladmin, request, queryset):
-        meta = modeladmin.model._meta
-        response = HttpResponse(content_type="text/csv")
-        response["Content-Disposition"] = "attachment; filename={}.csv".format(meta)
-        writer = csv.writer(response)
-
-        # Fetch headers: use verbose_name from model field or short_description from admin methods
-        headers = []
-        for field in fields:
-            try:
-                if hasattr(modeladmin, field):
-                    field_obj = getattr(modeladmin, field)
-                    if callable(field_obj) and hasattr(field_obj, "short_description"):
-                        headers.append(getattr(field_obj, "short_description"))
-                    else:
-                        headers.append(modeladmin.model._meta.get_field(field).verbose_name)
-                else:
-                    # This is used when field is neither a method nor directly available as a field
-                    headers.append(modeladmin.model._meta.get_field(field).verbose_name)
-            except Exception:
-                # Fallback to field name if it's neither in model fields nor an annotated method
-                headers.append(field)
-
-        # Write a first row with header information
-        writer.writerow(headers)
-
-        for obj in queryset:
-            row = []
-            for field in fields:
-                field_value = getattr(modeladmin, field, None)
-                if callable(field_value):
-                    value = field_value(obj)
-                else:
-                    value = getattr(obj, field, None)
-                    if callable(value):
-                        value = value()
-
-                # Handle case where value might be HTML
-                if isinstance(value, str) and ("<" in value and ">" in value):
-                    # DIRTY HACK: turn </li><li> to ,
-                    if re.search(r"\s*</li>\s*<li>\s*", value):
-                        value = re.sub(r"\s*</li>\s*<li>\s*", ", ", value)
-                    value = strip_tags(value)  # Strips HTML to plain text
-                elif isinstance(value, bool):
-                    value = 1 if value else 0
-
-                row.append(value)
-            writer.writerow(row)
-
-        return response
+        headers = [get_header(modeladmin, field) for field in fields]
+        if use_values:
+            # Start over from the selected ids, so list columns annotations and prefetches don't weigh on the export
+            export_queryset = queryset.model._default_manager.filter(pk__in=queryset.values("pk")).order_by(*queryset.query.order_by)
+            if hasattr(modeladmin, "get_export_queryset"):
+                export_queryset = modeladmin.get_export_queryset(request, export_queryset)
+            rows = column_rows(export_queryset, fields)
+        else:
+            rows = instance_rows(queryset, fields, modeladmin)
+        return stream_csv(str(modeladmin.model._meta), headers, rows)
 
     export_to_csv.short_description = _("Export Selected to CSV")
     return export_to_csv
 
 
+def export_rosters(modeladmin, request, queryset):
+    """Streams a ZIP with a CSV roster per workshop period of the selected periods"""
+    return stream_zip("rosters", roster_files(queryset))
+
+
+export_rosters.short_description = _("Export workshop rosters (ZIP)")
+
+
 class MemberAdmin(UserAdmin):
     ordering = ("-date_joined",)
     list_display = ("id", "name", "cycle", "date_joined", "is_student", "is_teacher", "is_staff", "is_active", "impersonate")
     filter_horizontal = ("groups", "user_permissions")
     list_per_page = 20
+    # filtered changelists don't count the whole table too
+    show_full_result_count = False
 
     form = AdminMemberChangeForm
 
+    def get_queryset(self, request):
+        """Annotates roles and current cycle, so list columns don't query per row"""
+        return super().get_queryset(request).with_roles().with_current_cycle_name()
+
+    def get_search_results(self, request, queryset, search_term):
+        """Autocompletes only students for student cycles and only teachers for workshop periods, by name or RUT"""
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        source = autocomplete_source(request)
+        if source == "studentcycle.student":
+            queryset = queryset.filter(in_students_group=True)
+        elif source == "workshopperiod.teacher":
+            queryset = queryset.filter(in_teachers_group=True)
+        return queryset, may_have_duplicates
+
     @admin.display(description=_("Full Name"))
     def name(self, obj):
         return obj.get_full_name()
@@ -111,8 +209,8 @@ class MemberAdmin(UserAdmin):
 
     @admin.display(description=_("Cycle"))
     def cycle(self, obj):
-        if obj.is_student and obj.current_student_cycle:
-            return format_html("{}", obj.current_student_cycle.cycle.name)
+        if obj.is_student and obj.current_cycle_name:
+            return format_html("{}", obj.current_cycle_name)
         else:
             return format_html("{}", "-")
 
@@ -131,19 +229,12 @@ class CycleAdmin(admin.ModelAdmin):
 
     @admin.display(description=_("Timetable %s") % (lazy(Period.objects.current_or_last, Period)()))
     def this_period_timetable(self, obj):
-        period = Period.objects.current_or_last()
+        period = display_period()
         return format_html('<a href="{}">{}</a>'.format(reverse("admin:cayuman_cycle_timetable", args=[obj.id, period.id]), _("Timetable")))
 
     @admin.display(description=_("Other Periods Timetable"))
     def other_periods_timetable(self, obj):
-        from django.template.loader import render_to_string
-
-        current_period = Period.objects.current_or_last()
-        periods = Period.objects.exclude(id=current_period.id).order_by("-id")
-        if periods:
-            return format_html(
-                render_to_string("admin/periods_dropdown.html", {"periods": periods, "obj": obj, "view": "admin:cayuman_cycle_timetable"})
-            )
+        return row_periods_dropdown("admin:cayuman_cycle_timetable", obj)
 
     def get_urls(self):
         """Add url for custom `cycle` view"""
@@ -172,7 +263,6 @@ class CycleAdmin(admin.ModelAdmin):
         from django.contrib.admin.utils import unquote
         from django.core.exceptions import PermissionDenied
         from django.utils.text import capfirst
-        from django.template.response import TemplateResponse
 
         # Check permissions
         model = self.model
@@ -184,16 +274,13 @@ class CycleAdmin(admin.ModelAdmin):
             raise PermissionDenied
 
         period = Period.objects.get(id=period_id)
-
-        # Then get students for this object.
-        # workshop_periods = list(obj.workshop_periods.filter(period=period))
-        workshop_periods = obj.workshopperiod_set.filter(period=period)
+        timetable = self.cycle_timetable_html(obj, period)
 
         context = {
             **self.admin_site.each_context(request),
             "title": _("Timetable for %s during %s") % (obj, period),
             "subtitle": None,
-            "workshop_periods": workshop_periods,
+            "has_timetable": bool(timetable),
             "period": period,
             "module_name": str(capfirst(self.opts.verbose_name_plural)),
             "object": obj,
@@ -204,11 +291,30 @@ class CycleAdmin(admin.ModelAdmin):
 
         request.current_app = self.admin_site.name
 
-        return TemplateResponse(
-            request,
-            "admin/cycle_timetable_by_period.html",
-            context,
-        )
+        return render_with_chunks(request, "admin/cycle_timetable_by_period.html", context, "timetable", [timetable])
+
+    def cycle_timetable_html(self, cycle: Cycle, period: Period) -> str:
+        """
+        Timetable of `cycle` during `period`, empty if it has no workshop periods. Workshop periods are cached along
+        with everything they show until the offering or schedules change, and rendered on every view with their
+        current students counts, so enrollments don't clear the cache
+        """
+        from django.core.cache import cache
+        from django.template.loader import render_to_string
+
+        key = cycle_timetable_cache_key(cycle.id, period.id)
+        workshop_periods = cache.get(key)
+        if workshop_periods is None:
+            workshop_periods = list(cycle.workshopperiod_set.filter(period=period).with_display_relations())
+            cache.set(key, workshop_periods, settings.FRAGMENT_CACHE_TIMEOUT)
+        if not workshop_periods:
+            return ""
+
+        counts = WorkshopPeriod.objects.filter(id__in=[wp.id for wp in workshop_periods]).with_students_count()
+        students_counts = dict(counts.values_list("id", "students_count"))
+        for workshop_period in workshop_periods:
+            workshop_period.students_count = students_counts.get(workshop_period.id, 0)
+        return render_to_string("admin/cycle_timetable.html", {"workshop_periods": workshop_periods})
 
 
 admin.site.register(Cycle, CycleAdmin)
@@ -224,13 +330,73 @@ admin.site.register(Schedule, ScheduleAdmin)
 
 
 class PeriodAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "preview_date", "enrollment_start", "enrollment_end", "date_start", "date_end", "active")
+    list_display = ("id", "name", "preview_date", "enrollment_start", "enrollment_end", "date_start", "date_end", "active", "occupancy_link")
     list_per_page = 20
+    actions = [export_rosters]
 
     @admin.display(boolean=True, description=_("Active"))
     def active(self, obj):
         return obj.is_current()
 
+    @admin.display(description=_("Occupancy"))
+    def occupancy_link(self, obj):
+        return format_html('<a href="{}">{}</a>', reverse("admin:cayuman_period_occupancy", args=[obj.id]), _("Occupancy"))
+
+    def get_urls(self):
+        """Add url for custom `occupancy` view"""
+        from functools import update_wrapper
+
+        def wrap(view):
+            def wrapper(*args, **kwargs):
+                return self.admin_site.admin_view(view)(*args, **kwargs)
+
+            wrapper.model_admin = self
+            return update_wrapper(wrapper, view)
+
+        info = self.opts.app_label, self.opts.model_name
+        urls = super().get_urls()
+        new_urls = [
+            path(
+                "<path:object_id>/occupancy/",
+                wrap(self.occupancy_view),
+                name="%s_%s_occupancy" % info,  # cayuman_period_occupancy
+            ),
+        ]
+        return new_urls + urls
+
+    def occupancy_view(self, request, object_id, extra_context=None):
+        """Admin dashboard of how full workshop periods of a period are, per schedule and cycle"""
+        from django.contrib.admin.utils import unquote
+        from django.core.exceptions import PermissionDenied
+        from django.template.response import TemplateResponse
+        from django.utils.text import capfirst
+
+        # Check permissions
+        model = self.model
+        obj = self.get_object(request, unquote(object_id))
+        if obj is None:
+            return self._get_obj_does_not_exist_redirect(request, model._meta, object_id)
+
+        if not self.has_view_or_change_permission(request, obj):
+            raise PermissionDenied
+
+        context = {
+            **self.admin_site.each_context(request),
+            "title": _("Occupancy during %s") % obj,
+            "subtitle": None,
+            "occupancy": get_occupancy(obj),
+            "refresh": settings.OCCUPANCY_CACHE_TIMEOUT,
+            "module_name": str(capfirst(self.opts.verbose_name_plural)),
+            "object": obj,
+            "opts": self.opts,
+            "preserved_filters": self.get_preserved_filters(request),
+            **(extra_context or {}),
+        }
+
+        request.current_app = self.admin_site.name
+
+        return TemplateResponse(request, "admin/period_occupancy.html", context)
+
 
 admin.site.register(Period, PeriodAdmin)
 
@@ -272,7 +438,11 @@ class WorkshopPeriodAdmin(admin.ModelAdmin):
         "active",
     )
     list_per_page = 20
+    show_full_result_count = False
+    ordering = ("-period__date_start", "workshop__name", "id")
     filter_horizontal = ("cycles", "schedules")
+    autocomplete_fields = ["teacher"]
+    search_fields = ["workshop__name", "teacher__first_name", "teacher__last_name"]
     list_filter = [
         ("period", admin.RelatedOnlyFieldListFilter),
         ("teacher", admin.RelatedOnlyFieldListFilter),
@@ -301,8 +471,30 @@ class WorkshopPeriodAdmin(admin.ModelAdmin):
         # If the parameter is already there or there is no current period, just render the default view
         return super().changelist_view(request, extra_context)
 
+    def get_queryset(self, request):
+        """
+        Fetches everything list columns and CSV exports show, so they don't query per row. Autocomplete lookups only
+        show workshop periods names, so they skip counting students
+        """
+        queryset = super().get_queryset(request).with_display_relations()
+        if autocomplete_source(request):
+            return queryset
+        return queryset.with_students_count().with_period_is_current()
+
+    def get_search_results(self, request, queryset, search_term):
+        """Autocompletes student cycles workshop periods out of the displayed period, for the student cycle's cycle if given"""
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if autocomplete_source(request) == "studentcycle.workshop_periods":
+            queryset = queryset.filter(period=display_period())
+            cycle_id = request.GET.get("cycle", "")
+            if cycle_id.isdigit():
+                queryset = queryset.filter(cycles=cycle_id)
+        return queryset, may_have_duplicates
+
     @admin.display(boolean=True, description=_("Active"))
     def active(self, obj):
+        if hasattr(obj, "period_is_current"):
+            return obj.period_is_current
         return obj.period.is_current()
 
     @admin.display(description=_("Link"))
@@ -362,11 +554,10 @@ class WorkshopPeriodAdmin(admin.ModelAdmin):
 
     def workshop_period_students_view(self, request, object_id, extra_context=None):
         """Admin view student cycles per workshop period"""
-        from django.contrib.admin.views.main import PAGE_VAR
+        from django.contrib.admin.views.main import ALL_VAR
         from django.contrib.admin.utils import unquote
         from django.core.exceptions import PermissionDenied
         from django.utils.text import capfirst
-        from django.template.response import TemplateResponse
 
         # Check permissions
         model = self.model
@@ -377,22 +568,23 @@ class WorkshopPeriodAdmin(admin.ModelAdmin):
         if not self.has_view_or_change_permission(request, obj):
             raise PermissionDenied
 
-        # Then get students for this object.
-        students_list = obj.studentcycle_set.filter(student__is_active=True)
-
-        paginator = self.get_paginator(request, students_list, 100)
-        page_number = request.GET.get(PAGE_VAR, 1)
-        page_obj = paginator.get_page(page_number)
-        page_range = paginator.get_elided_page_range(page_obj.number)
+        # Then get students for this object, paginated by keyset so deep pages don't scan the ones before
+        students_list = obj.studentcycle_set.filter(student__is_active=True).select_related("student", "cycle")
+        keys = ("student__last_name", "id")
+        page = keyset_page(students_list, keys, request.GET.get(CURSOR_VAR), 100)
+        # The whole roster is rendered in chunks as it's read, see `render_with_chunks`
+        show_all = ALL_VAR in request.GET
 
         context = {
             **self.admin_site.each_context(request),
             "title": _("Student Cycles: %s") % (obj),
             "subtitle": None,
-            "students_list": page_obj,
-            "page_range": page_range,
-            "page_var": PAGE_VAR,
-            "pagination_required": paginator.count > 100,
+            "page": page,
+            "count": carried_count(students_list, request.GET.get(COUNT_VAR)),
+            "count_var": COUNT_VAR,
+            "cursor_var": CURSOR_VAR,
+            "all_var": ALL_VAR,
+            "pagination_required": not show_all and (page.next_cursor is not None or not page.is_first),
             "module_name": str(capfirst(self.opts.verbose_name_plural)),
             "object": obj,
             "opts": self.opts,
@@ -402,11 +594,10 @@ class WorkshopPeriodAdmin(admin.ModelAdmin):
 
         request.current_app = self.admin_site.name
 
-        return TemplateResponse(
-            request,
-            "admin/workshop_period_students.html",
-            context,
+        rows = render_rows(
+            "admin/workshop_period_students_rows.html", students_list.order_by(*keys).iterator(chunk_size=100) if show_all else page.object_list
         )
+        return render_with_chunks(request, "admin/workshop_period_students.html", context, "rows", rows)
 
 
 admin.site.register(WorkshopPeriod, WorkshopPeriodAdmin)
@@ -425,12 +616,10 @@ class StudentCycleStatusFilter(admin.SimpleListFilter):
         ]
 
     def queryset(self, request, queryset):
-        if not self.value():  # If no value is selected, default to current
-            return queryset.filter(id__in=[sc.id for sc in queryset if sc.is_current()])
-        elif self.value() == "current":
-            return queryset.filter(id__in=[sc.id for sc in queryset if sc.is_current()])
+        if not self.value() or self.value() == "current":  # If no value is selected, default to current
+            return queryset.filter_current()
         elif self.value() == "not_current":
-            return queryset.filter(id__in=[sc.id for sc in queryset if not sc.is_current()])
+            return queryset.filter_current(False)
         return queryset
 
     def choices(self, changelist):
@@ -451,13 +640,24 @@ class StudentCycleAdmin(admin.ModelAdmin):
     ordering = ("-date_joined",)
     list_display = ("id", "student", "cycle_html", "date_joined", "this_period_workshops_html", "other_periods_workshops", "active", "impersonate")
     list_per_page = 20
+    show_full_result_count = False
     list_filter = [StudentCycleStatusFilter, "cycle"]
     search_fields = ["student__first_name", "student__last_name", "cycle__name"]
-    filter_horizontal = ("workshop_periods",)
+    autocomplete_fields = ["student", "workshop_periods"]
     readonly_fields = ["student", "cycle"]
 
     form = AdminStudentCycleForm
-    actions = [create_export_to_csv_action(["student", "cycle", "date_joined", "this_period_workshops_list", "active"])]
+    actions = [
+        create_export_to_csv_action(
+            [
+                Column(_("Student"), "student_name", transform=str.strip),
+                Column(_("Cycle"), "cycle__name"),
+                Column(_("Date joined"), "date_joined"),
+                Column(lazy(lambda: _("Workshops %s") % display_period(), str)(), "display_period_workshops__workshop__name", many=True),
+                Column(_("Active"), "current", transform=int),
+            ]
+        )
+    ]
 
     def get_form(self, request, obj=None, **kwargs):
         """Setting form to edit/create StudentCycle entries restricting the workshop_periods shown as much as possible"""
@@ -470,11 +670,19 @@ class StudentCycleAdmin(admin.ModelAdmin):
             form.base_fields["workshop_periods"].queryset = WorkshopPeriod.objects.filter(
                 Q(period=period, cycles=obj.cycle) | Q(id__in=existing_workshop_period_ids)
             ).distinct()
+            # and look up only the cycle's ones
+            widget = form.base_fields["workshop_periods"].widget
+            getattr(widget, "widget", widget).params = {"cycle": obj.cycle_id}
         else:
             # if creating a new obj show workshop_periods only for current period
             form.base_fields["workshop_periods"].queryset = WorkshopPeriod.objects.filter(period=period)
         return form
 
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        if db_field.name == "workshop_periods":
+            kwargs["widget"] = FilteredAutocompleteSelectMultiple(db_field, self.admin_site, using=kwargs.get("using"))
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+
     def get_readonly_fields(self, request, obj=None):
         # Fields student and cycle are readonly if the object exists
         if obj:
@@ -484,51 +692,52 @@ class StudentCycleAdmin(admin.ModelAdmin):
             return []
 
     def get_queryset(self, request):
-        """By default remove students that are inactive"""
+        """
+        By default remove students that are inactive. Annotates everything list columns and CSV exports show about the
+        displayed period, so they don't query per row
+        """
         queryset = super().get_queryset(request)
-        return queryset.filter(student__is_active=True)
+        return (
+            queryset.filter(student__is_active=True)
+            .select_related("student", "cycle")
+            .with_current()
+            .with_period_workshops(display_period())
+            .annotate(student_is_student=Exists(Group.objects.filter(user=OuterRef("student"), name=settings.STUDENTS_GROUP)))
+        )
+
+    def get_export_queryset(self, request, queryset):
+        """Annotates what CSV exports read besides plain fields: names, the displayed period workshops and activeness"""
+        return (
+            queryset.with_current()
+            .alias(
+                display_period_workshops=FilteredRelation("workshop_periods", condition=Q(workshop_periods__period=display_period())),
+            )
+            .annotate(student_name=Concat("student__first_name", Value(" "), "student__last_name"))
+        )
 
     @admin.display(description=_("Cycle"))
     def cycle_html(self, obj):
-        period = Period.objects.current_or_last()
+        period = display_period()
         url = reverse("admin:cayuman_cycle_timetable", args=(obj.cycle.id, period.id))
-        return format_html(f'<a href="{url}">{obj.cycle}</a>')
+        return format_html('<a href="{}">{}</a>', url, obj.cycle)
 
     @admin.display(description=_("Workshops %s") % (lazy(Period.objects.current_or_last, Period)()))
     def this_period_workshops_html(self, obj):
         """Display function to use in Django admin list for this model"""
-        period = Period.objects.current_or_last()
-        wps = obj.workshop_periods.filter(period=period)
-        if wps:
-            if obj.is_schedule_full(period):
+        period = display_period()
+        if obj.period_workshops_count:
+            if obj.period_schedules_count == schedules_count():
                 text = _("Full schedule")
             else:
                 text = _("Partial schedule")
             url = reverse("admin:cayuman_studentcycle_workshops", kwargs={"object_id": obj.id, "period_id": period.id})
-            return format_html(f'<a href="{url}">{text} ({len(wps)})</a>')
+            return format_html('<a href="{}">{} ({})</a>', url, text, obj.period_workshops_count)
         else:
             return _("No workshops yet")
 
-    @admin.display(description=_("Workshops %s") % (lazy(Period.objects.current_or_last, Period)()))
-    def this_period_workshops_list(self, obj):
-        """Display function to use when exporting these entries to CSV"""
-        period = Period.objects.current_or_last()
-        wps = obj.workshop_periods.filter(period=period)
-        if wps:
-            return ", ".join([wp.workshop.name for wp in wps])
-        else:
-            return ""
-
     @admin.display(description=_("Other Periods Workshops"))
     def other_periods_workshops(self, obj):
-        from django.template.loader import render_to_string
-
-        current_period = Period.objects.current_or_last()
-        periods = Period.objects.exclude(id=current_period.id).order_by("-id")
-        if periods:
-            return format_html(
-                render_to_string("admin/periods_dropdown.html", {"periods": periods, "obj": obj, "view": "admin:cayuman_studentcycle_workshops"})
-            )
+        return row_periods_dropdown("admin:cayuman_studentcycle_workshops", obj)
 
     @admin.display(boolean=True, description=_("Active"))
     def active(self, obj):
@@ -558,7 +767,6 @@ class StudentCycleAdmin(admin.ModelAdmin):
 
     def student_cycle_workshop_periods_view(self, request, object_id, period_id, extra_context=None):
         """Admin view workshop periods per student cycle"""
-        from django.contrib.admin.views.main import PAGE_VAR
         from django.contrib.admin.utils import unquote
         from django.core.exceptions import PermissionDenied
         from django.utils.text import capfirst
@@ -575,25 +783,16 @@ class StudentCycleAdmin(admin.ModelAdmin):
 
         period = Period.objects.get(id=period_id)
 
-        # Then get students for this object.
-        workshop_periods = list(obj.workshop_periods.filter(period=period))
-        workshop_periods_list = list(obj.workshop_periods_by_period(period))
-
-        paginator = self.get_paginator(request, workshop_periods_list, 100)
-        page_number = request.GET.get(PAGE_VAR, 1)
-        page_obj = paginator.get_page(page_number)
-        page_range = paginator.get_elided_page_range(page_obj.number)
+        # Then get workshop periods for this object. There's at most one per schedule, so both the list and the
+        # timetable show them all, fetched along with their relations
+        workshop_periods = list(obj.workshop_periods.filter(period=period).with_display_relations().order_by("workshop__name", "id"))
 
         context = {
             **self.admin_site.each_context(request),
             "title": _("Workshop Periods %s for: %s") % (period, obj),
             "subtitle": None,
             "workshop_periods": workshop_periods,
-            "workshop_periods_list": page_obj,
             "period": period,
-            "page_range": page_range,
-            "page_var": PAGE_VAR,
-            "pagination_required": paginator.count > 100,
             "module_name": str(capfirst(self.opts.verbose_name_plural)),
             "object": obj,
             "opts": self.opts,
@@ -611,8 +810,37 @@ class StudentCycleAdmin(admin.ModelAdmin):
 
     @admin.display(description=_("Impersonate"))
     def impersonate(self, obj):
-        if obj.student.is_student:
+        if obj.student_is_student:
             return format_html('<a href="{}">{}</a>', reverse("impersonate-start", args=[obj.student.pk]), _("Impersonate"))
 
 
 admin.site.register(StudentCycle, StudentCycleAdmin)
+
+
+def template_profile_view(request):
+    """Superuser only page listing template render stats recorded while `TEMPLATE_PROFILING` is on"""
+    from django.conf import settings
+    from django.contrib import messages
+    from django.core.exceptions import PermissionDenied
+    from django.http import HttpResponseRedirect
+    from django.template.response import TemplateResponse
+
+    from .profiling import get_profile
+    from .profiling import reset_profile
+
+    if not request.user.is_superuser:
+        raise PermissionDenied
+
+    if request.method == "POST":
+        reset_profile()
+        messages.success(request, _("Template profile has been reset"))
+        return HttpResponseRedirect(reverse("template_profile"))
+
+    context = {
+        **admin.site.each_context(request),
+        "title": _("Template profile"),
+        "subtitle": None,
+        "profiling_enabled": settings.TEMPLATE_PROFILING,
+        "rows": get_profile(),
+    }
+    return TemplateResponse(request, "admin/template_profile.html", context)
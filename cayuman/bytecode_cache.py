@@ -0,0 +1,14 @@
+import os
+
+import jinja2
+
+
+class FileSystemBytecodeCache(jinja2.FileSystemBytecodeCache):
+    """
+    Jinja2 bytecode cache storing compiled templates in the directory given as `name` of the `bytecode_cache` option,
+    so new workers load templates precompiled by `manage.py precompile_templates` instead of compiling them again
+    """
+
+    def __init__(self, name: str):
+        os.makedirs(name, exist_ok=True)
+        super().__init__(directory=name)
@@ -0,0 +1,120 @@
+"""
+Helpers to build versioned cache keys.
+
+Cached fragments never get deleted explicitly. Instead, each key embeds one or more version numbers stored in the
+cache itself, and signal handlers bump those versions whenever the underlying data changes. As versions live in the
+cache framework, invalidation reaches every worker sharing the same cache backend.
+"""
+import hashlib
+from typing import Callable
+from typing import Iterable
+from typing import Tuple
+from typing import Union
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import translation
+
+KEY_PREFIX = "cayuman"
+
+# Names of global versions
+SCHEDULES_VERSION = "schedules"
+CATALOG_VERSION = "catalog"  # periods, cycles, workshops and workshop periods offering
+ENROLLMENTS_VERSION = "enrollments"  # workshop periods chosen by students
+
+
+def _version_key(name: str) -> str:
+    return f"{KEY_PREFIX}:version:{name}"
+
+
+def workshop_period_version_name(workshop_period_id: int) -> str:
+    """Name of the version bumped whenever a given workshop period (or anything it displays) changes"""
+    return f"workshop_period:{workshop_period_id}"
+
+
+def member_version_name(member_id: int) -> str:
+    """Name of the version bumped whenever a member's student cycles change"""
+    return f"member:{member_id}"
+
+
+def get_versions(*names: str) -> Tuple[int, ...]:
+    """Returns current versions for the given names in a single cache round trip, defaulting to 1"""
+    found = cache.get_many([_version_key(name) for name in names])
+    return tuple(found.get(_version_key(name), 1) for name in names)
+
+
+def bump_versions(*names: str) -> None:
+    """Increments the given versions so every key built with them becomes stale"""
+    for name in names:
+        key = _version_key(name)
+        # `add` is a no-op if the key already exists, so concurrent bumps are never lost
+        cache.add(key, 1, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Key was evicted between `add` and `incr`
+            cache.set(key, 2, timeout=None)
+
+
+def bump_workshop_period_versions(workshop_period_ids: Iterable[int]) -> None:
+    bump_versions(*[workshop_period_version_name(wp_id) for wp_id in workshop_period_ids])
+
+
+def make_key(namespace: str, *parts: Union[str, int]) -> str:
+    """Builds a cache key for `namespace` out of `parts` plus the active language, as fragments contain translated text"""
+    return ":".join([KEY_PREFIX, namespace, *[str(p) for p in parts], translation.get_language() or settings.LANGUAGE_CODE])
+
+
+def workshop_period_cache_key(workshop_period_id: int) -> str:
+    """Key of the cached body of the workshop period detail page"""
+    versions = get_versions(workshop_period_version_name(workshop_period_id), SCHEDULES_VERSION)
+    return make_key("workshop_period", workshop_period_id, *versions)
+
+
+def schedule_grid_cache_key() -> str:
+    """Key of the cached schedule grid. It holds no translated text, so it's shared by every language"""
+    (version,) = get_versions(SCHEDULES_VERSION)
+    return f"{KEY_PREFIX}:schedule_grid:{version}"
+
+
+def timetable_cache_key(name: str, workshop_periods: Iterable, **kwargs) -> str:
+    """
+    Key of a cached timetable named `name`. The same workshop periods laid out on the same schedule grid render the same
+    timetable whoever looks at it, so the key hashes their ids and versions, the grid version and the tag's `kwargs`
+    """
+    ids = sorted({wp.id for wp in workshop_periods})
+    versions = get_versions(SCHEDULES_VERSION, *[workshop_period_version_name(wp_id) for wp_id in ids])
+    params = sorted((k, str(v)) for k, v in kwargs.items())
+    digest = hashlib.md5(repr((ids, versions, params)).encode(), usedforsecurity=False).hexdigest()
+    return make_key("timetable", name, digest)
+
+
+def occupancy_cache_key(period_id: int) -> str:
+    """Key of the occupancy dashboard of a period. It's only kept for a short while, enrollments would bump any version all the time"""
+    return make_key("occupancy", period_id)
+
+
+def cycle_timetable_cache_key(cycle_id: int, period_id: int) -> str:
+    """Key of the workshop periods cached for the admin timetable of a cycle during a period, with their schedules"""
+    versions = get_versions(CATALOG_VERSION, SCHEDULES_VERSION)
+    return make_key("cycle_timetable_workshop_periods", cycle_id, period_id, *versions)
+
+
+def get_or_render_fragment(key: str, render: Callable[[], str]) -> str:
+    """
+    Returns the HTML fragment cached at `key`, calling `render` to fill it on misses. A compressed copy is kept alongside
+    and handed to `GZipMiddleware` for the current response (see `cayuman.compression`)
+    """
+    from cayuman.compression import deflate_fragment
+    from cayuman.middleware import add_compressed_fragment
+
+    deflated_key = f"{key}:deflated"
+    cached = cache.get_many([key, deflated_key])
+    html, deflated = cached.get(key), cached.get(deflated_key)
+    if html is None:
+        html = render()
+        deflated = deflate_fragment(html)
+        cache.set_many({key: html, deflated_key: deflated}, settings.FRAGMENT_CACHE_TIMEOUT)
+    if html and deflated is not None:
+        add_compressed_fragment(html, deflated)
+    return html
@@ -0,0 +1,60 @@
+"""
+Gzip responses reusing compressed cached fragments.
+
+A gzip body is a deflate stream, and deflate streams compressed separately can be chained as long as every one but
+the last ends on a byte boundary without a final block, which is what `Z_SYNC_FLUSH` does. So cached fragments
+(timetables, workshop period bodies) keep a deflated copy next to their HTML, and responses embedding them only
+compress the bytes around them. The CRC32 in the gzip trailer still covers the whole body, which is cheap next to
+compressing it.
+"""
+import secrets
+import string
+import struct
+import zlib
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+
+FRAGMENT_COMPRESS_LEVEL = 9  # paid once per cache fill
+RESPONSE_COMPRESS_LEVEL = 6  # paid per response, zlib's default
+
+
+def deflate(data: bytes, level: int = RESPONSE_COMPRESS_LEVEL) -> bytes:
+    """Raw deflate `data` without a final block, so more can be chained after it"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def deflate_fragment(html: str) -> bytes:
+    """Compressed copy of a cached fragment, to be kept next to it"""
+    return deflate(html.encode(), FRAGMENT_COMPRESS_LEVEL)
+
+
+def _gzip_header(max_random_bytes: Optional[int]) -> bytes:
+    """Gzip header. As Django does, a random length file name makes response sizes unpredictable (BREACH mitigation)"""
+    if not max_random_bytes:
+        return b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+    filename = "".join(secrets.choice(string.ascii_letters) for _ in range(secrets.randbelow(max_random_bytes) + 1))
+    return b"\x1f\x8b\x08\x08\x00\x00\x00\x00\x00\xff" + filename.encode() + b"\x00"
+
+
+def gzip_with_fragments(content: bytes, fragments: Iterable[Tuple[bytes, bytes]], max_random_bytes: Optional[int] = None) -> bytes:
+    """
+    Gzips `content`, splicing in the precompressed copy of each `(raw, deflated)` fragment found in it, in order.
+    Fragments not found, or overlapping a previous one, are just compressed along with the rest
+    """
+    # One compressor for every gap between fragments. Full flushes byte align its output and keep it from referring
+    # back to data before the fragments spliced in between
+    compressor = zlib.compressobj(RESPONSE_COMPRESS_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    parts = []
+    pos = 0
+    for raw, deflated in fragments:
+        start = content.find(raw, pos)
+        if start == -1 or not raw:
+            continue
+        parts.append(compressor.compress(content[pos:start]) + compressor.flush(zlib.Z_FULL_FLUSH))
+        parts.append(deflated)
+        pos = start + len(raw)
+    parts.append(compressor.compress(content[pos:]) + compressor.flush(zlib.Z_FINISH))
+    trailer = struct.pack("<II", zlib.crc32(content) & 0xFFFFFFFF, len(content) & 0xFFFFFFFF)
+    return b"".join([_gzip_header(max_random_bytes), *parts, trailer])
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from functools import cached_property
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from cayuman.models import Cycle
+    from cayuman.models import Member
+    from cayuman.models import Period
+    from cayuman.models import Schedule
+    from cayuman.models import StudentCycle
+    from cayuman.models import WorkshopPeriod
+
+
+class StudentContext:
+    """
+    Request-scoped view over a member's enrollment state for a given period.
+    Every value is computed at most once, so decorators, views, forms, permissions and templates
+    can ask for it as many times as they need without issuing repeated queries
+    """
+
+    def __init__(self, member: Member, period: Optional[Period]):
+        self.member = member
+        self.period = period
+
+    @cached_property
+    def is_student(self) -> bool:
+        return bool(self.member) and self.member.is_student
+
+    @cached_property
+    def student_cycle(self) -> Optional[StudentCycle]:
+        if not self.member:
+            return None
+        return self.member.current_student_cycle
+
+    @cached_property
+    def cycle(self) -> Optional[Cycle]:
+        return self.student_cycle.cycle if self.student_cycle else None
+
+    @cached_property
+    def is_schedule_full(self) -> bool:
+        if self.student_cycle and self.period:
+            return self.student_cycle.is_schedule_full(self.period)
+        return False
+
+    @cached_property
+    def is_enabled_to_enroll(self) -> bool:
+        """Same rules as `Member.is_enabled_to_enroll` but computed once"""
+        if not self.member or not self.period:
+            return False
+        if self.is_student:
+            if self.student_cycle:
+                return self.student_cycle.is_enabled_to_enroll(self.period)
+        elif self.member.is_superuser:
+            return not self.period.is_in_the_past()
+        return False
+
+    @cached_property
+    def available_workshop_periods_by_schedule(self) -> Dict[Schedule, List[WorkshopPeriod]]:
+        if self.student_cycle:
+            return self.student_cycle.available_workshop_periods_by_schedule(self.period)
+        return {}
+
+    def invalidate(self) -> None:
+        """Forget every memoized value, i.e. after the student's workshop periods have changed"""
+        for name in ("is_student", "student_cycle", "cycle", "is_schedule_full", "is_enabled_to_enroll", "available_workshop_periods_by_schedule"):
+            self.__dict__.pop(name, None)
+
+
+def get_student_context(member: Member, period: Optional[Period]) -> StudentContext:
+    """
+    Returns the request-scoped `StudentContext` attached to `member` by `CayumanMiddleware` when it matches `period`,
+    otherwise a fresh one (e.g. for members not coming from a request)
+    """
+    context = getattr(member, "student_context", None)
+    if context is not None and context.period == period:
+        return context
+    return StudentContext(member, period)
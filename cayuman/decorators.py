@@ -23,7 +23,7 @@ def studentcycle_required(view_func):
 
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
-        student_cycle = request.member.current_student_cycle
+        student_cycle = request.student_context.student_cycle
         if not student_cycle:
             messages.warning(request, _("Your student account is not associated with any Cycle. Please ask your teachers to fix this."))
             return HttpResponseRedirect(reverse("workshop_periods", kwargs={"period_id": request.period.id}))
@@ -43,11 +43,9 @@ def enrollment_access_required(view_func):
         if request.impersonator and request.impersonator.is_enabled_to_enroll(request.period):
             return view_func(request, *args, **kwargs)
 
-        student_cycle = request.member.current_student_cycle
-
         # check if student is enabled to enroll, otherwise redirect to weekly-schedule with a warning message
         if request.period.is_enabled_to_enroll():
-            if not student_cycle.is_enabled_to_enroll(request.period):
+            if not request.student_context.is_enabled_to_enroll:
                 messages.warning(
                     request, _("Online enrollment is no longer enabled. If you need to change your workshops please contact your teachers.")
                 )
@@ -62,3 +60,25 @@ def enrollment_access_required(view_func):
         return view_func(request, *args, **kwargs)
 
     return _wrapped_view
+
+
+def read_only_view(view_func):
+    """
+    Decorator marking a view as read only, so its queries are sent to the replica database when there's one.
+    Members that just saved something keep reading from the primary database for a few seconds (see `routers.stick_to_primary`)
+    """
+    from cayuman import routers
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if not routers.replica_enabled() or routers.is_sticky(request):
+            return view_func(request, *args, **kwargs)
+
+        with routers.use_replica():
+            response = view_func(request, *args, **kwargs)
+            # Template responses are rendered lazily, so render them while reads are still routed to the replica
+            if hasattr(response, "render") and not response.is_rendered:
+                response.render()
+        return response
+
+    return _wrapped_view
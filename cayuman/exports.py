@@ -0,0 +1,201 @@
+"""
+Streaming CSV exports.
+
+Rows are written as they're read from the database, in chunks, so exports run in constant memory whatever their size.
+Exports declared with `Column`s read plain values instead of model instances, in a single query. Several CSV files can
+be bundled in a ZIP archive, compressed as they're written.
+"""
+import csv
+import re
+import zipfile
+from dataclasses import dataclass
+from itertools import groupby
+from itertools import islice
+from operator import itemgetter
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from django.utils.html import strip_tags
+from django.utils.text import slugify
+from django.utils.translation import gettext as _
+
+from cayuman.models import StudentCycle
+from cayuman.models import WorkshopPeriod
+from cayuman.routers import use_replica
+
+CHUNK_SIZE = 500  # rows read from the database and sent to the client at a time
+
+
+@dataclass(frozen=True)
+class Column:
+    """
+    A CSV column read from `values()`: a field path (`student__first_name`) or an annotation of the exported queryset.
+    Values of `many` columns come from a to-many relation and are joined with ", ". `transform` formats each value
+    """
+
+    header: str
+    lookup: str
+    many: bool = False
+    transform: Optional[Callable[[Any], Any]] = None
+
+
+class Echo:
+    """File-like object returning what's written, so `csv.writer` hands rows back instead of buffering them"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def clean_value(value):
+    """Formats values coming from admin display methods as the CSV expects them: HTML as text and booleans as 1/0"""
+    if isinstance(value, str) and ("<" in value and ">" in value):
+        # DIRTY HACK: turn </li><li> to ,
+        if re.search(r"\s*</li>\s*<li>\s*", value):
+            value = re.sub(r"\s*</li>\s*<li>\s*", ", ", value)
+        return strip_tags(value)  # Strips HTML to plain text
+    elif isinstance(value, bool):
+        return 1 if value else 0
+    return value
+
+
+def column_rows(queryset: QuerySet, columns: Sequence[Column]) -> Iterator[List]:
+    """
+    Rows of `columns` values for `queryset`, read with a single query. `many` columns return a database row per related
+    value, so rows are ordered by primary key last and consecutive ones of the same entry are merged
+    """
+    lookups = [column.lookup for column in columns]
+    ordering = [*queryset.query.order_by, "pk"] if queryset.ordered else ["pk"]
+    values = queryset.prefetch_related(None).order_by(*ordering).values_list("pk", *lookups).iterator(chunk_size=CHUNK_SIZE)
+    for _pk, group in groupby(values, key=lambda row: row[0]):
+        group = list(group)
+        row = []
+        for i, column in enumerate(columns, start=1):
+            if column.many:
+                items = [item for item in dict.fromkeys(values_row[i] for values_row in group) if item is not None]
+                if column.transform:
+                    items = [column.transform(item) for item in items]
+                row.append(", ".join(str(item) for item in items))
+            else:
+                value = group[0][i]
+                row.append(column.transform(value) if column.transform else clean_value(value))
+        yield row
+
+
+def instance_rows(queryset: QuerySet, fields: Sequence[str], modeladmin) -> Iterator[List]:
+    """Rows of `fields` for `queryset`, read from admin display methods or model attributes of each instance"""
+    for obj in queryset.iterator(chunk_size=CHUNK_SIZE):
+        row = []
+        for field in fields:
+            field_value = getattr(modeladmin, field, None)
+            if callable(field_value):
+                value = field_value(obj)
+            else:
+                value = getattr(obj, field, None)
+                if callable(value):
+                    value = value()
+            row.append(clean_value(value))
+        yield row
+
+
+def csv_chunks(headers: Sequence[str], rows: Iterable[List]) -> Iterator[str]:
+    """CSV text of `headers` and `rows`, `CHUNK_SIZE` rows at a time"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(headers)
+    rows_iter = iter(rows)
+    while chunk := list(islice(rows_iter, CHUNK_SIZE)):
+        yield "".join(writer.writerow(row) for row in chunk)
+
+
+def stream_csv(filename: str, headers: Sequence[str], rows: Iterable[List]) -> StreamingHttpResponse:
+    """
+    Streams a CSV attachment, `CHUNK_SIZE` rows at a time. Rows are read from the replica database if there's one,
+    as it happens while the response is sent, outside views' `use_replica` blocks
+    """
+
+    def content():
+        with use_replica():
+            yield from csv_chunks(headers, rows)
+
+    response = StreamingHttpResponse(content(), content_type="text/csv")
+    response["Content-Disposition"] = f"attachment; filename={filename}.csv"
+    return response
+
+
+class ZipBuffer:
+    """Write-only file-like object keeping what `zipfile` writes until it's drained, to send archives as they're built"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def zip_chunks(files: Iterable[Tuple[str, Iterable[str]]]) -> Iterator[bytes]:
+    """Bytes of a ZIP archive of `files`, pairs of file name and text chunks, as each chunk is compressed"""
+    buffer = ZipBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, chunks in files:
+            with archive.open(name, "w") as entry:
+                for chunk in chunks:
+                    entry.write(chunk.encode())
+                    if data := buffer.drain():
+                        yield data
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def stream_zip(filename: str, files: Iterable[Tuple[str, Iterable[str]]]) -> StreamingHttpResponse:
+    """Streams a ZIP attachment of `files`, reading them from the replica database if there's one (see `stream_csv`)"""
+
+    def content():
+        with use_replica():
+            yield from zip_chunks(files)
+
+    response = StreamingHttpResponse(content(), content_type="application/zip")
+    response["Content-Disposition"] = f"attachment; filename={filename}.zip"
+    return response
+
+
+def roster_files(periods) -> Iterator[Tuple[str, Iterator[str]]]:
+    """
+    A CSV roster per workshop period of `periods` (a queryset or list): its active students, their cycle and the
+    workshop period schedules. Students of every workshop period are read in a single query ordered by workshop period
+    and split on the fly, so files must be consumed in order, as `zip_chunks` does
+    """
+    workshop_periods = (
+        WorkshopPeriod.objects.filter(period__in=periods).select_related("workshop", "period").prefetch_related("schedules").order_by("id")
+    )
+    enrollments = (
+        StudentCycle.workshop_periods.through.objects.filter(workshopperiod__period__in=periods, studentcycle__student__is_active=True)
+        .order_by("workshopperiod_id", "studentcycle__student__first_name", "studentcycle__student__last_name", "studentcycle_id")
+        .values_list("workshopperiod_id", "studentcycle__student__first_name", "studentcycle__student__last_name", "studentcycle__cycle__name")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    headers = [_("Student"), _("Cycle"), _("Schedules")]
+    enrolled = groupby(enrollments, key=itemgetter(0))
+    current = next(enrolled, None)
+    for wp in workshop_periods:
+        students = current[1] if current and current[0] == wp.id else ()
+        schedules = ", ".join(str(schedule) for schedule in wp.schedules.all())
+        rows = ([f"{first_name} {last_name}".strip(), cycle, schedules] for _wp_id, first_name, last_name, cycle in students)
+        yield f"{slugify(wp.period.name)}/{slugify(wp.workshop.name)}-{wp.id}.csv", csv_chunks(headers, rows)
+        if students:
+            current = next(enrolled, None)
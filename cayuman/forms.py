@@ -13,6 +13,7 @@ from django.forms import ModelForm
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
+from .context import get_student_context
 from .models import Member
 from .models import Period
 from .models import Schedule
@@ -242,7 +243,7 @@ class WorkshopSelectionForm(forms.Form):
         cleaned_data = super().clean()
 
         # get available workshops for this user
-        schedules = self.member.current_student_cycle.available_workshop_periods_by_schedule(self.period)
+        schedules = get_student_context(self.member, self.period).available_workshop_periods_by_schedule
         schedules_by_wp_id = dict()
 
         # walk through all expected schedules
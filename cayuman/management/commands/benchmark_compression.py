@@ -0,0 +1,64 @@
+"""Compares response sizes and gzip CPU time of representative pages, with and without precompressed cached fragments."""
+import timeit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.test import Client
+from django.urls import reverse
+from django.utils.text import compress_string
+
+from cayuman.compression import gzip_with_fragments
+from cayuman.models import Member
+from cayuman.models import Period
+from cayuman.models import WorkshopPeriod
+
+
+class Command(BaseCommand):
+    help = "Measure gzip sizes and times of pages embedding cached fragments, as served by GZipMiddleware."
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", help="Paths to measure. Defaults to a workshop period and an admin cycle timetable")
+        parser.add_argument("--username", help="Member to browse as. Defaults to the first superuser")
+        parser.add_argument("--iterations", type=int, default=200)
+
+    def default_paths(self):
+        period = Period.objects.current_or_last()
+        wp = WorkshopPeriod.objects.filter(period=period).prefetch_related("cycles").first() if period else None
+        if not wp:
+            raise CommandError("No workshop periods to benchmark, pass some paths")
+        paths = [reverse("workshop_period", args=[wp.id])]
+        if cycle := wp.cycles.first():
+            paths.append(reverse("admin:cayuman_cycle_timetable", args=[cycle.id, period.id]))
+        return paths
+
+    def handle(self, *args, **options):
+        if options["username"]:
+            member = Member.objects.filter(username=options["username"]).first()
+        else:
+            member = Member.objects.filter(is_superuser=True).first()
+        if not member:
+            raise CommandError("No member to browse as, pass an existing one with --username")
+
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        client.force_login(member)
+        n = options["iterations"]
+        for path in options["paths"] or self.default_paths():
+            client.get(path)  # fill caches
+            response = client.get(path)
+            if response.status_code != 200 or response.streaming:
+                self.stderr.write(f"{path}: skipped, got a {response.status_code}{' streaming' if response.streaming else ''} response")
+                continue
+            content = response.content
+            fragments = getattr(response.wsgi_request, "compressed_fragments", [])
+            fragments_size = sum(len(raw) for raw, _deflated in fragments)
+
+            self.stdout.write(f"{path}: {len(content)} bytes, {len(fragments)} cached fragments ({fragments_size} bytes)")
+            timings = [
+                ("django gzip", lambda: compress_string(content)),
+                ("gzip with cached fragments", lambda: gzip_with_fragments(content, fragments)),
+            ]
+            for name, func in timings:
+                size = len(func())
+                elapsed = timeit.timeit(func, number=n)
+                self.stdout.write(f"  {name}: {size} bytes ({size / len(content):.0%}), {elapsed / n * 1000:.3f} ms")
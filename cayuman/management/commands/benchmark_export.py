@@ -0,0 +1,80 @@
+"""Benchmarks the student cycles CSV export over synthetic rows, reading model instances versus declared `values()` columns."""
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from cayuman.admin import create_export_to_csv_action
+from cayuman.models import Cycle
+from cayuman.models import Member
+from cayuman.models import Period
+from cayuman.models import StudentCycle
+from cayuman.models import Workshop
+from cayuman.models import WorkshopPeriod
+
+USERNAME_PREFIX = "benchmark-export-"
+
+
+class Command(BaseCommand):
+    help = "Time CSV exports of synthetic student cycles, created in a transaction that's rolled back afterwards."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--workshops", type=int, default=3, help="Workshop periods each synthetic student is enrolled in")
+
+    def create_rows(self, period: Period, rows: int, workshops: int) -> None:
+        cycle = Cycle.objects.create(name="Benchmark cycle")
+        teacher = Member.objects.create(username=f"{USERNAME_PREFIX}teacher")
+        teacher.groups.add(Group.objects.get_or_create(name=settings.TEACHERS_GROUP)[0])
+        workshop_periods = [
+            WorkshopPeriod.objects.create(workshop=Workshop.objects.create(name=f"Benchmark {i}"), period=period, teacher=teacher)
+            for i in range(workshops)
+        ]
+        password = make_password(None)
+        students = Member.objects.bulk_create(
+            Member(username=f"{USERNAME_PREFIX}{i:06}", password=password, first_name=f"Student {i}", last_name="Benchmark") for i in range(rows)
+        )
+        student_cycles = StudentCycle.objects.bulk_create(StudentCycle(student=student, cycle=cycle) for student in students)
+        Through = StudentCycle.workshop_periods.through
+        Through.objects.bulk_create(
+            Through(studentcycle_id=student_cycle.id, workshopperiod_id=wp.id) for student_cycle in student_cycles for wp in workshop_periods
+        )
+
+    def measure(self, name: str, action, modeladmin, request, queryset) -> None:
+        tracemalloc.start()
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            size = sum(len(chunk) for chunk in action(modeladmin, request, queryset).streaming_content)
+        elapsed = time.perf_counter() - start
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(f"{name}: {elapsed:.3f} s, {len(queries)} queries, {peak / 1024 / 1024:.1f} MiB peak, {size} bytes")
+
+    def handle(self, *args, **options):
+        period = Period.objects.current_or_last()
+        if not period:
+            raise CommandError("No period to benchmark, create one first")
+
+        modeladmin = admin.site._registry[StudentCycle]
+        request = RequestFactory().get("/")
+        request.user = Member.objects.filter(is_superuser=True).first()
+        instances_action = create_export_to_csv_action(["student", "cycle", "date_joined", "active"])
+        columns_action = modeladmin.actions[0]
+
+        with transaction.atomic():
+            self.create_rows(period, options["rows"], options["workshops"])
+            queryset = modeladmin.get_queryset(request).filter(student__username__startswith=USERNAME_PREFIX)
+            self.stdout.write(f"{period}: {queryset.count()} student cycles, {options['workshops']} workshop periods each")
+
+            self.measure("model instances", instances_action, modeladmin, request, queryset)
+            self.measure("values() columns", columns_action, modeladmin, request, queryset)
+            transaction.set_rollback(True)
@@ -0,0 +1,61 @@
+"""Micro-benchmark for the `timetable` tag, as used by the weekly schedule (Jinja2) and the admin cycle timetable (Django templates)."""
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.template import engines
+from django.template import Template
+from jinja2 import Template as JinjaTemplate
+
+from cayuman.models import Period
+from cayuman.models import WorkshopPeriod
+from cayuman.templatetags.cayuman import BLOCK_TPL_DJANGO
+from cayuman.templatetags.cayuman import BLOCK_TPL_JINJA2
+
+WEEKLY_SCHEDULE_TPL = """
+{% timetable workshop_periods %}
+    {% if schedule in workshop_period.schedules.all() %}
+        {{workshop_period.workshop.name}}<br /><small>{{workshop_period.teacher.get_full_name()}}</small>
+    {% endif %}
+{% endtimetable %}"""
+
+CYCLE_TIMETABLE_TPL = """{% load cayuman %}
+{% timetable workshop_periods %}
+    {% if schedule in workshop_period.schedules.all %}
+        {{workshop_period.workshop.name}}<br /><small>{{workshop_period.teacher.get_full_name}}</small>
+    {% endif %}
+{% endtimetable %}"""
+
+
+class Command(BaseCommand):
+    help = "Time timetable renders for a period, and the template parsing they no longer pay for."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--period", type=int, help="Period id. Defaults to the current (or last) period")
+        parser.add_argument("--iterations", type=int, default=50)
+
+    def handle(self, *args, **options):
+        if options["period"]:
+            period = Period.objects.filter(id=options["period"]).first()
+        else:
+            period = Period.objects.current_or_last()
+        if not period:
+            raise CommandError("No period to benchmark, pass an existing one with --period")
+
+        n = options["iterations"]
+        workshop_periods = list(WorkshopPeriod.objects.filter(period=period))
+        context = {"workshop_periods": workshop_periods}
+        self.stdout.write(f"{period}: {len(workshop_periods)} workshop periods, {n} iterations")
+
+        weekly_schedule = engines["jinja2"].from_string(WEEKLY_SCHEDULE_TPL)
+        cycle_timetable = engines["django"].from_string(CYCLE_TIMETABLE_TPL)
+        timings = [
+            ("weekly schedule render (jinja2)", lambda: weekly_schedule.render(context)),
+            ("cycle timetable render (django)", lambda: cycle_timetable.render(context)),
+            ("block parse saved per jinja2 render", lambda: JinjaTemplate(BLOCK_TPL_JINJA2)),
+            ("block parse saved per django render", lambda: Template(BLOCK_TPL_DJANGO)),
+        ]
+        for name, func in timings:
+            func()  # warm up caches
+            elapsed = timeit.timeit(func, number=n)
+            self.stdout.write(f"{name}: {elapsed / n * 1000:.3f} ms")
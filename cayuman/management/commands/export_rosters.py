@@ -0,0 +1,30 @@
+"""Writes a ZIP with a CSV roster per workshop period of a period, as the periods admin "Export workshop rosters" action does."""
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils.text import slugify
+
+from cayuman.exports import roster_files
+from cayuman.exports import zip_chunks
+from cayuman.models import Period
+
+
+class Command(BaseCommand):
+    help = "Export a ZIP with the roster of every workshop period of a period."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--period", type=int, help="Period id. Defaults to the current (or last) period")
+        parser.add_argument("--output", help="ZIP file to write. Defaults to rosters-<period>.zip")
+
+    def handle(self, *args, **options):
+        if options["period"]:
+            period = Period.objects.filter(id=options["period"]).first()
+        else:
+            period = Period.objects.current_or_last()
+        if not period:
+            raise CommandError("No period to export, pass an existing one with --period")
+
+        output = options["output"] or f"rosters-{slugify(period.name)}.zip"
+        with open(output, "wb") as f:
+            for chunk in zip_chunks(roster_files([period])):
+                f.write(chunk)
+        self.stdout.write(f"{period}: rosters written to {output}")
@@ -1,12 +1,31 @@
+import mimetypes
+import os
+import posixpath
+import re
 import threading
+from pathlib import Path
+from urllib.parse import unquote
 
 from django.conf import settings
 from django.contrib import messages
+from django.contrib.messages.storage.base import Message
+from django.contrib.staticfiles.storage import staticfiles_storage
 from django.core.exceptions import ObjectDoesNotExist
+from django.http import FileResponse
 from django.http import Http404
+from django.http import HttpResponseNotModified
+from django.middleware.gzip import GZipMiddleware as DjangoGZipMiddleware
 from django.urls import resolve
 from django.urls import Resolver404
+from django.utils.cache import patch_cache_control
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
 from django.utils.translation import gettext as _
+from django.views.static import was_modified_since
+
+from cayuman.compression import gzip_with_fragments
+
+re_accepts_gzip = re.compile(r"\bgzip\b")
 
 # Crear un objeto local para hilos
 _thread_locals = threading.local()
@@ -20,6 +39,28 @@ def get_current_request():
     return getattr(_thread_locals, "request", None)
 
 
+def has_message(request, level: int, message: str) -> bool:
+    """
+    Tells whether `message` is already queued or stored for this request.
+    Unlike iterating `messages.get_messages(request)` this does not mark the storage as used, so messages are not consumed
+    and the storage is not rewritten (cookie or session) when the response goes out
+    """
+    storage = getattr(request, "_messages", None)
+    if storage is None:
+        return False
+    return Message(level, message) in storage
+
+
+def add_compressed_fragment(html: str, deflated: bytes) -> None:
+    """
+    Tells `GZipMiddleware` the current response embeds `html`, whose compressed copy is `deflated`
+    (see `cayuman.compression`). It's a no-op outside requests
+    """
+    request = get_current_request()
+    if request is not None:
+        request.compressed_fragments = [*getattr(request, "compressed_fragments", []), (html.encode(), deflated)]
+
+
 class ThreadLocalMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -27,9 +68,11 @@ class ThreadLocalMiddleware:
     def __call__(self, request):
         # Almacenar la request actual en el espacio de almacenamiento local del hilo
         _thread_locals.request = request
-        response = self.get_response(request)
-        # Limpiar la request del almacenamiento local del hilo al finalizar la respuesta
-        return response
+        try:
+            return self.get_response(request)
+        finally:
+            # Limpiar la request del almacenamiento local del hilo al finalizar la respuesta
+            _thread_locals.request = None
 
 
 class CayumanMiddleware:
@@ -41,6 +84,7 @@ class CayumanMiddleware:
         self.get_response = get_response
 
     def __call__(self, request):
+        from cayuman.context import StudentContext
         from cayuman.models import Period, Member
 
         # Set member by default if user is authenticated and active
@@ -98,13 +142,19 @@ class CayumanMiddleware:
                         "The period you are viewing is not yet open. "
                         "Please come back later or choose another one from the dropdown menu in the navbar."
                     )
-            if msg and msg not in [msg.message for msg in messages.get_messages(request)]:
+            if msg and not has_message(request, messages.WARNING, msg):
                 messages.warning(request, msg)
 
         except (Http404, Resolver404):
             # For paths that don't match any URL pattern
             request.period = Period.objects.current_or_last()
 
+        # Memoized student state for request.period, shared by decorators, views, permissions and templates
+        request.student_context = None
+        if request.member:
+            request.student_context = StudentContext(request.member, request.period)
+            request.member.student_context = request.student_context
+
         # Continue processing the request
         response = self.get_response(request)
 
@@ -115,3 +165,104 @@ class CayumanMiddleware:
                 request.session.modified = True
 
         return response
+
+
+class StaticFilesMiddleware:
+    """
+    Serves collected static files when there's no front proxy to do it (`settings.SERVE_STATIC`), before any other
+    middleware touches the request. Gzipped copies written by `collectstatic` are preferred when clients accept them,
+    and hashed file names are cached forever, as their content never changes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # hashed file names from the manifest, and the (path, mtime) of the manifest they were read from
+        self.hashed_names = frozenset()
+        self.manifest = None
+
+    def __call__(self, request):
+        if settings.SERVE_STATIC and request.method in ("GET", "HEAD") and request.path.startswith(settings.STATIC_URL):
+            response = self.serve(request, request.path.removeprefix(settings.STATIC_URL))
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, path: str):
+        name = posixpath.normpath(unquote(path)).lstrip("/")
+        root = Path(settings.STATIC_ROOT).resolve()
+        fullpath = (root / name).resolve()
+        if not fullpath.is_relative_to(root) or not fullpath.is_file():
+            return None
+
+        gzipped = fullpath.with_name(f"{fullpath.name}.gz")
+        use_gzip = gzipped.is_file() and re_accepts_gzip.search(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        served = gzipped if use_gzip else fullpath
+        stat = served.stat()
+
+        if not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"), stat.st_mtime):
+            response = HttpResponseNotModified()
+        else:
+            content_type, _encoding = mimetypes.guess_type(fullpath.name)
+            response = FileResponse(served.open("rb"), content_type=content_type or "application/octet-stream", filename=fullpath.name)
+            response.headers["Last-Modified"] = http_date(stat.st_mtime)
+            if use_gzip:
+                response.headers["Content-Encoding"] = "gzip"
+        if gzipped.is_file():
+            patch_vary_headers(response, ("Accept-Encoding",))
+
+        if self.is_hashed(name):
+            patch_cache_control(response, public=True, max_age=settings.STATIC_MAX_AGE, immutable=True)
+        else:
+            # Not hashed, so it may change on next deploy
+            patch_cache_control(response, public=True, max_age=60)
+        return response
+
+    def is_hashed(self, name: str) -> bool:
+        """Tells whether `name` is a hashed file name, reading the manifest again whenever `collectstatic` rewrites it"""
+        manifest_name = getattr(staticfiles_storage, "manifest_name", None)
+        if manifest_name is None:
+            return False
+        path = staticfiles_storage.path(manifest_name)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return False
+        if self.manifest != (path, mtime):
+            hashed_files, _manifest_hash = staticfiles_storage.load_manifest()
+            self.hashed_names = frozenset(hashed_files.values())
+            self.manifest = (path, mtime)
+        return name in self.hashed_names
+
+
+class GZipMiddleware(DjangoGZipMiddleware):
+    """
+    Gzips HTML and JSON responses. Cached fragments embedded in the response (see `add_compressed_fragment`) are
+    spliced in already compressed, so only the rest of the page is compressed per response
+    """
+
+    content_types = ("text/html", "application/json")
+
+    def process_response(self, request, response):
+        if response.get("Content-Type", "").split(";")[0].strip() not in self.content_types:
+            return response
+        fragments = getattr(request, "compressed_fragments", None)
+        if response.streaming or not fragments:
+            return super().process_response(request, response)
+
+        # Same rules as Django's middleware, only the compression differs
+        if len(response.content) < 200 or response.has_header("Content-Encoding"):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if not re_accepts_gzip.search(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+            return response
+
+        compressed = gzip_with_fragments(response.content, fragments, max_random_bytes=self.max_random_bytes)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(response.content))
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "gzip"
+        return response
@@ -14,9 +14,16 @@ from django.contrib.auth.models import User
 from django.contrib.auth.models import UserManager
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import BooleanField
 from django.db.models import Case
+from django.db.models import Count
+from django.db.models import Exists
+from django.db.models import ExpressionWrapper
 from django.db.models import IntegerField
+from django.db.models import OuterRef
+from django.db.models import Q
 from django.db.models import QuerySet
+from django.db.models import Subquery
 from django.db.models import Value
 from django.db.models import When
 from django.db.models.signals import m2m_changed
@@ -24,6 +31,27 @@ from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from cayuman.caching import bump_versions
+from cayuman.caching import bump_workshop_period_versions
+from cayuman.caching import CATALOG_VERSION
+from cayuman.caching import ENROLLMENTS_VERSION
+from cayuman.caching import member_version_name
+from cayuman.caching import SCHEDULES_VERSION
+
+
+class MemberQuerySet(models.QuerySet):
+    def with_roles(self) -> MemberQuerySet:
+        """Annotates `in_students_group` and `in_teachers_group`, read by `Member.is_student` and `Member.is_teacher`"""
+        return self.annotate(
+            in_students_group=Exists(Group.objects.filter(user=OuterRef("pk"), name=settings.STUDENTS_GROUP)),
+            in_teachers_group=Exists(Group.objects.filter(user=OuterRef("pk"), name=settings.TEACHERS_GROUP)),
+        )
+
+    def with_current_cycle_name(self) -> MemberQuerySet:
+        """Annotates `current_cycle_name`, the name of the cycle of each member's current student cycle if any"""
+        latest = StudentCycle.objects.filter(student=OuterRef("pk")).order_by(*StudentCycle.LATEST_FIRST).values("cycle__name")[:1]
+        return self.annotate(current_cycle_name=Subquery(latest))
+
 
 class Member(User):
     """
@@ -32,19 +60,23 @@ class Member(User):
     """
 
     # use manager from User model
-    objects = UserManager()
+    objects = UserManager.from_queryset(MemberQuerySet)()
 
     @property
     def is_student(self) -> Group:
+        if hasattr(self, "in_students_group"):
+            return self.in_students_group
         return self.groups.filter(name=settings.STUDENTS_GROUP).exists()
 
     @property
     def is_teacher(self) -> Group:
+        if hasattr(self, "in_teachers_group"):
+            return self.in_teachers_group
         return self.groups.filter(name=settings.TEACHERS_GROUP).exists()
 
     @property
     def current_student_cycle(self):
-        return StudentCycle.objects.filter(student=self).order_by("-date_joined").first()
+        return StudentCycle.objects.filter(student=self).order_by(*StudentCycle.LATEST_FIRST).first()
 
     def has_perm(self, perm, obj=None):
         from cayuman.permissions import custom_permissions
@@ -460,21 +492,35 @@ class Cycle(models.Model):
 
     def available_workshop_periods_by_schedule(self, period: Period) -> Dict[Schedule, "WorkshopPeriod"]:
         """Returns available workshop periods for a student cycle"""
-        wps_by_schedule = {}
-        for s in Schedule.objects.ordered():
-            for wp in s.workshopperiod_set.filter(period=period):
-                if self in wp.cycles.all():
-                    if s not in wps_by_schedule:
-                        wps_by_schedule[s] = []
-                    wps_by_schedule[s].append(wp)
+        wps_by_schedule_id = {}
+        for wp in WorkshopPeriod.objects.filter(period=period, cycles=self).with_display_relations().order_by("id"):
+            for s in wp.schedules.all():
+                wps_by_schedule_id.setdefault(s.id, []).append(wp)
 
-        return wps_by_schedule
+        return {s: wps_by_schedule_id[s.id] for s in Schedule.objects.ordered() if s.id in wps_by_schedule_id}
 
     class Meta:
         verbose_name = _("Cycle")
         verbose_name_plural = _("Cycles")
 
 
+class WorkshopPeriodQuerySet(models.QuerySet):
+    def with_display_relations(self) -> WorkshopPeriodQuerySet:
+        """Fetches along everything displayed for each workshop period: its workshop, teacher, period, schedules and cycles"""
+        return self.select_related("workshop", "teacher", "period").prefetch_related("schedules", "cycles")
+
+    def with_students_count(self) -> WorkshopPeriodQuerySet:
+        """Annotates `students_count`, read by `WorkshopPeriod.count_students`"""
+        return self.annotate(students_count=Count("studentcycle", distinct=True))
+
+    def with_period_is_current(self, current_period: Optional[Period] = None) -> WorkshopPeriodQuerySet:
+        """Annotates `period_is_current`, computing the current period once instead of once per workshop period"""
+        current_period = current_period or Period.objects.current()
+        if current_period is None:
+            return self.annotate(period_is_current=Value(False))
+        return self.annotate(period_is_current=ExpressionWrapper(Q(period_id=current_period.id), output_field=BooleanField()))
+
+
 class WorkshopPeriod(models.Model):
     workshop = models.ForeignKey(Workshop, on_delete=models.CASCADE, verbose_name=_("Workshop"))
     period = models.ForeignKey(Period, on_delete=models.CASCADE, verbose_name=_("Period"))
@@ -483,6 +529,8 @@ class WorkshopPeriod(models.Model):
     cycles = models.ManyToManyField(Cycle, verbose_name=_("Cycles"))
     schedules = models.ManyToManyField(Schedule, verbose_name=_("Schedules"))
 
+    objects = WorkshopPeriodQuerySet.as_manager()
+
     def __str__(self):
         cycles_list = ", ".join(c.name for c in self.cycles.all())
         return f"{self.workshop.name} ({cycles_list}) @ {self.period}"
@@ -510,6 +558,8 @@ class WorkshopPeriod(models.Model):
 
     def count_students(self, member: Optional[Member] = None) -> int:
         """Counts the number of students associated to self. If `member` is given counts students but excludes `member`"""
+        if member is None and hasattr(self, "students_count"):
+            return self.students_count
         if member:
             return self.studentcycle_set.exclude(student__id=member.id).count()
         else:
@@ -553,7 +603,39 @@ class WorkshopPeriod(models.Model):
         verbose_name_plural = _("Workshops' Periods")
 
 
-class StudentCycleManager(models.Manager):
+class StudentCycleQuerySet(models.QuerySet):
+    def with_current(self) -> StudentCycleQuerySet:
+        """Annotates `current`, telling whether each entry is its student's latest one (see `StudentCycle.is_current`)"""
+        latest = StudentCycle.objects.filter(student=OuterRef("student")).order_by(*StudentCycle.LATEST_FIRST).values("id")[:1]
+        return self.annotate(current=ExpressionWrapper(Q(id=Subquery(latest)), output_field=BooleanField()))
+
+    def with_period_workshops(self, period: Period) -> StudentCycleQuerySet:
+        """
+        Annotates how many workshop periods each entry has during `period` (`period_workshops_count`) and how many
+        schedules they cover (`period_schedules_count`, full when it matches all schedules)
+        """
+        during_period = Q(workshop_periods__period=period)
+        return self.annotate(
+            period_workshops_count=Count("workshop_periods", filter=during_period, distinct=True),
+            period_schedules_count=Count("workshop_periods__schedules", filter=during_period, distinct=True),
+        )
+
+    def filter_current(self, current: bool = True) -> StudentCycleQuerySet:
+        """Entries which are (or are not) their student's latest one, in a single query"""
+        queryset = self if "current" in self.query.annotations else self.with_current()
+        return queryset.filter(current=current)
+
+    def filter_for_period(self, period: Period) -> StudentCycleQuerySet:
+        """Entries which are their student's latest one joined by the end of `period`, in a single query"""
+        latest = (
+            StudentCycle.objects.filter(student=OuterRef("student"), date_joined__lte=period.date_end)
+            .order_by(*StudentCycle.LATEST_FIRST)
+            .values("id")[:1]
+        )
+        return self.filter(id=Subquery(latest))
+
+
+class StudentCycleManager(models.Manager.from_queryset(StudentCycleQuerySet)):
     """
     Manager for the StudentCycle model
     """
@@ -657,6 +739,9 @@ class StudentCycle(models.Model):
 
     objects = StudentCycleManager()
 
+    # Ordering telling which entry is a student's current one
+    LATEST_FIRST = ("-date_joined", "-id")
+
     def __str__(self):
         return f"{self.student} @ {self.cycle}"
 
@@ -692,9 +777,11 @@ class StudentCycle(models.Model):
         return {wp for wp in wps_by_schedule.values()}
 
     def is_current(self):
-        if self.student.current_student_cycle:
-            return self.id == self.student.current_student_cycle.id
-        return False
+        """Whether this is its student's latest entry. Entries from `StudentCycleQuerySet.with_current` don't query again"""
+        if hasattr(self, "current"):
+            return self.current
+        current_student_cycle = self.student.current_student_cycle
+        return current_student_cycle is not None and self.id == current_student_cycle.id
 
     @lru_cache(maxsize=None)
     def is_schedule_full(self, period: Period) -> bool:
@@ -851,3 +938,86 @@ def student_cycle_workshop_period_changed(sender, instance, action, *args, **kwa
                     raise ValidationError(
                         _("Workshop periods `%(w1)s` and `%(w2)s` have colliding schedules.") % {"w1": wp.workshop.name, "w2": wp_2.workshop.name}
                     )
+
+
+@receiver([models.signals.post_save, models.signals.post_delete], sender=WorkshopPeriod)
+def workshop_period_changed(sender, instance, **kwargs):
+    """Invalidate cached fragments showing this workshop period"""
+    bump_workshop_period_versions([instance.id])
+    bump_versions(CATALOG_VERSION)
+
+
+@receiver(m2m_changed, sender=WorkshopPeriod.cycles.through)
+@receiver(m2m_changed, sender=WorkshopPeriod.schedules.through)
+def workshop_period_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalidate cached fragments when cycles or schedules of workshop periods change, from either side of the relation"""
+    if action.startswith("post_"):
+        bump_versions(CATALOG_VERSION)
+        if not reverse:
+            bump_workshop_period_versions([instance.id])
+        elif action == "post_clear":
+            # pk_set is None on clear, so invalidate every workshop period
+            bump_workshop_period_versions(WorkshopPeriod.objects.values_list("id", flat=True))
+        else:
+            bump_workshop_period_versions(pk_set or [])
+
+
+@receiver([models.signals.post_save, models.signals.post_delete], sender=Workshop)
+def workshop_changed(sender, instance, **kwargs):
+    """Invalidate cached fragments of the workshop periods of this workshop"""
+    bump_workshop_period_versions(WorkshopPeriod.objects.filter(workshop_id=instance.id).values_list("id", flat=True))
+    bump_versions(CATALOG_VERSION)
+
+
+@receiver([models.signals.post_save, models.signals.post_delete], sender=Period)
+def period_fragments_changed(sender, instance, **kwargs):
+    """Invalidate cached fragments of the workshop periods of this period"""
+    bump_workshop_period_versions(WorkshopPeriod.objects.filter(period_id=instance.id).values_list("id", flat=True))
+    bump_versions(CATALOG_VERSION)
+
+
+@receiver([models.signals.post_save, models.signals.post_delete], sender=Cycle)
+def cycle_fragments_changed(sender, instance, **kwargs):
+    """Invalidate cached fragments showing cycles"""
+    bump_versions(CATALOG_VERSION)
+
+
+@receiver([models.signals.post_save, models.signals.post_delete], sender=StudentCycle)
+def student_cycle_fragments_changed(sender, instance, **kwargs):
+    """Invalidate cached fragments depending on the student cycles of this student"""
+    bump_versions(member_version_name(instance.student_id), ENROLLMENTS_VERSION)
+
+
+@receiver(m2m_changed, sender=StudentCycle.workshop_periods.through)
+def student_cycle_workshop_periods_fragments_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalidate cached fragments depending on the workshop periods chosen by students"""
+    if not action.startswith("post_"):
+        return
+    bump_versions(ENROLLMENTS_VERSION)
+    if not reverse:
+        bump_versions(member_version_name(instance.student_id))
+    elif action == "post_clear":
+        # pk_set is None on clear, so the affected students are unknown at this point
+        bump_versions(CATALOG_VERSION)
+    else:
+        student_ids = StudentCycle.objects.filter(id__in=pk_set or []).values_list("student_id", flat=True).distinct()
+        bump_versions(*[member_version_name(student_id) for student_id in student_ids])
+
+
+@receiver([models.signals.post_save, models.signals.post_delete], sender=Schedule)
+def schedule_fragments_changed(sender, instance, **kwargs):
+    """Schedules shape every timetable, so invalidate all fragments depending on them"""
+    bump_versions(SCHEDULES_VERSION)
+
+
+@receiver(models.signals.post_save, sender=User)
+@receiver(models.signals.post_save, sender=Member)
+def teacher_name_changed(sender, instance, update_fields=None, **kwargs):
+    """Invalidate cached fragments showing a teacher's name. Logins only update `last_login` so they are skipped"""
+    if update_fields is not None and not {"first_name", "last_name"} & set(update_fields):
+        return
+    workshop_period_ids = list(WorkshopPeriod.objects.filter(teacher_id=instance.id).values_list("id", flat=True))
+    if workshop_period_ids:
+        bump_workshop_period_versions(workshop_period_ids)
+        # cycle timetables show teachers too
+        bump_versions(CATALOG_VERSION)
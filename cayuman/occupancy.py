@@ -0,0 +1,145 @@
+"""
+Enrollment occupancy of a period: seats offered and taken per schedule and cycle, students yet to complete their
+schedule and overflowed workshop periods.
+
+Everything is computed by a few GROUP BY queries and cached for `settings.OCCUPANCY_CACHE_TIMEOUT` seconds, so the
+dashboard can be left open during enrollments without adding load.
+"""
+from collections import Counter
+from collections import defaultdict
+from dataclasses import dataclass
+from dataclasses import field
+from datetime import datetime
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from cayuman.caching import occupancy_cache_key
+from cayuman.models import Cycle
+from cayuman.models import Period
+from cayuman.models import Schedule
+from cayuman.models import StudentCycle
+from cayuman.models import WorkshopPeriod
+
+HEAT_LEVELS = (0.5, 0.75, 0.9, 1.0)  # fill ratios from which cells get hotter
+
+
+@dataclass
+class Cell:
+    """
+    Seats of the workshop periods open to a cycle on a schedule. Seats are shared with other cycles those workshop
+    periods are open to, so `capacity` and `remaining` count them whoever took them, while `enrolled` are this cycle's
+    """
+
+    workshops: int = 0
+    capacity: int = 0
+    taken: int = 0
+    unlimited: bool = False
+    enrolled: int = 0
+
+    @property
+    def remaining(self) -> Optional[int]:
+        """Seats left, None if any workshop period has no limit"""
+        return None if self.unlimited else max(self.capacity - self.taken, 0)
+
+    @property
+    def fill(self) -> Optional[float]:
+        if self.unlimited or not self.capacity:
+            return None
+        return min(self.taken / self.capacity, 1.0)
+
+    @property
+    def heat(self) -> Optional[int]:
+        """0 to 4, from plenty of seats left to full"""
+        if self.fill is None:
+            return None
+        return sum(self.fill >= level for level in HEAT_LEVELS)
+
+
+@dataclass
+class Occupancy:
+    period: str
+    cycles: List[str]
+    rows: List[Tuple[str, List[Cell]]]  # (schedule, a cell per cycle)
+    # (cycle, students without a full schedule, students)
+    incomplete: List[Tuple[str, int, int]]
+    # (workshop, enrolled, max students)
+    overflowed: List[Tuple[str, int, int]]
+    generated_at: datetime = field(default_factory=timezone.now)
+
+
+def compute_occupancy(period: Period) -> Occupancy:
+    """Occupancy of `period` straight from the database"""
+    schedules = list(Schedule.objects.ordered())
+    cycles = list(Cycle.objects.order_by("id"))
+    workshop_periods = WorkshopPeriod.objects.filter(period=period)
+
+    # taken seats per workshop period
+    seats = {}
+    overflowed = []
+    for wp_id, name, max_students, students_count in workshop_periods.with_students_count().values_list(
+        "id", "workshop__name", "max_students", "students_count"
+    ):
+        seats[wp_id] = (max_students, students_count)
+        if 0 < max_students < students_count:
+            overflowed.append((name, students_count, max_students))
+
+    # where each workshop period takes place, and for whom
+    cells = defaultdict(Cell)
+    for wp_id, schedule_id, cycle_id in workshop_periods.values_list("id", "schedules", "cycles"):
+        if schedule_id is None or cycle_id is None:
+            continue
+        cell = cells[schedule_id, cycle_id]
+        max_students, students_count = seats[wp_id]
+        cell.workshops += 1
+        if max_students:
+            cell.capacity += max_students
+            cell.taken += students_count
+        else:
+            cell.unlimited = True
+
+    enrollments = (
+        StudentCycle.workshop_periods.through.objects.filter(workshopperiod__period=period)
+        .values("workshopperiod__schedules", "studentcycle__cycle")
+        .annotate(enrolled=Count("studentcycle", distinct=True))
+        .values_list("workshopperiod__schedules", "studentcycle__cycle", "enrolled")
+        .order_by()
+    )
+    for schedule_id, cycle_id, enrolled in enrollments:
+        if (schedule_id, cycle_id) in cells:
+            cells[schedule_id, cycle_id].enrolled = enrolled
+
+    # students of the period, in the cycle they were in back then, whose workshop periods don't cover every schedule
+    students, incomplete = Counter(), Counter()
+    for cycle_id, schedules_count in (
+        StudentCycle.objects.filter_for_period(period)
+        .filter(student__is_active=True)
+        .with_period_workshops(period)
+        .values_list("cycle_id", "period_schedules_count")
+    ):
+        students[cycle_id] += 1
+        if schedules_count < len(schedules):
+            incomplete[cycle_id] += 1
+
+    return Occupancy(
+        period=str(period),
+        cycles=[cycle.name for cycle in cycles],
+        rows=[(str(schedule), [cells.get((schedule.id, cycle.id)) for cycle in cycles]) for schedule in schedules],
+        incomplete=[(cycle.name, incomplete[cycle.id], students[cycle.id]) for cycle in cycles if students[cycle.id]],
+        overflowed=sorted(overflowed, key=lambda item: item[2] - item[1]),
+    )
+
+
+def get_occupancy(period: Period) -> Occupancy:
+    """Occupancy of `period`, cached for `settings.OCCUPANCY_CACHE_TIMEOUT` seconds"""
+    key = occupancy_cache_key(period.id)
+    occupancy = cache.get(key)
+    if occupancy is None:
+        occupancy = compute_occupancy(period)
+        cache.set(key, occupancy, settings.OCCUPANCY_CACHE_TIMEOUT)
+    return occupancy
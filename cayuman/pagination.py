@@ -0,0 +1,87 @@
+"""
+Keyset (seek) pagination for admin pages listing big rosters.
+
+Pages are read with `WHERE keys > last row keys ORDER BY keys LIMIT n` instead of `OFFSET`, so deep pages cost as much
+as the first one, and no `COUNT(*)` is needed to tell whether there's a next page. Totals are counted on the first page
+and carried over to the next ones in their links.
+"""
+import base64
+import json
+from dataclasses import dataclass
+from functools import reduce
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Type
+
+from django.core.exceptions import ValidationError
+from django.db.models import Model
+from django.db.models import Q
+from django.db.models import QuerySet
+
+CURSOR_VAR = "after"
+# Carries the total count from the first page over to the next ones, so it's only counted once
+COUNT_VAR = "count"
+
+
+@dataclass
+class KeysetPage:
+    object_list: List
+    next_cursor: Optional[str]  # None on the last page
+    is_first: bool
+
+
+def encode_cursor(values: Sequence) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode()
+
+
+def key_field(model: Type[Model], key: str):
+    """Model field a lookup like `student__last_name` points to, starting from `model`"""
+    *relations, name = key.split("__")
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def decode_cursor(cursor: Optional[str], model: Type[Model], keys: Sequence[str]) -> Optional[list]:
+    """Values of a cursor converted to the types of `keys` fields, None if it's missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(keys) or None in values:
+            return None
+        return [key_field(model, key).to_python(value) for key, value in zip(keys, values)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def key_value(obj, key: str):
+    """Value of a lookup like `student__last_name` on `obj`, following (already fetched) relations"""
+    return reduce(getattr, key.split("__"), obj)
+
+
+def keyset_page(queryset: QuerySet, keys: Sequence[str], cursor: Optional[str], per_page: int) -> KeysetPage:
+    """
+    Page of `queryset` ordered by `keys`, which must be unique together (i.e. end with the primary key), starting after
+    the row `cursor` points to. Malformed cursors start over from the first page
+    """
+    queryset = queryset.order_by(*keys)
+    values = decode_cursor(cursor, queryset.model, keys)
+    if values is not None:
+        # (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+        after = Q()
+        for i, key in enumerate(keys):
+            after |= Q(**dict(zip(keys[:i], values[:i])), **{f"{key}__gt": values[i]})
+        queryset = queryset.filter(after)
+
+    rows = list(queryset[: per_page + 1])
+    next_cursor = encode_cursor([key_value(rows[per_page - 1], key) for key in keys]) if len(rows) > per_page else None
+    return KeysetPage(object_list=rows[:per_page], next_cursor=next_cursor, is_first=values is None)
+
+
+def carried_count(queryset: QuerySet, carried: Optional[str]) -> int:
+    """Count of `queryset` carried over from a previous page, counted again only when missing or malformed"""
+    if carried is not None and carried.isdigit():
+        return int(carried)
+    return queryset.count()
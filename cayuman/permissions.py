@@ -1,5 +1,6 @@
 from typing import Callable
 
+from cayuman.context import get_student_context
 from cayuman.models import Member
 from cayuman.models import Period
 
@@ -30,11 +31,11 @@ def can_enroll(user: Member, obj: Period = None) -> bool:
     # if not obj.is_current():
     #    return False
 
-    if not user.is_student:
+    student_context = get_student_context(user, obj)
+    if not student_context.is_student:
         return False
 
-    student_cycle = user.current_student_cycle
-    if not student_cycle:
+    if not student_context.student_cycle:
         return False
 
     # remember that impersonators (i.e. superadmins) can enroll in any moment during the period
@@ -42,7 +43,7 @@ def can_enroll(user: Member, obj: Period = None) -> bool:
         if user.is_impersonate and user.impersonator.is_enabled_to_enroll(obj):
             return True
 
-    return obj.is_enabled_to_enroll() and student_cycle.is_enabled_to_enroll(obj)
+    return obj.is_enabled_to_enroll() and student_context.is_enabled_to_enroll
 
 
 def can_impersonate(request):
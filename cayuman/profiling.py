@@ -0,0 +1,202 @@
+"""
+Opt-in template render profiler.
+
+When `settings.TEMPLATE_PROFILING` is on, every render of a Jinja2 or Django template is timed, both by views and as
+included templates (each one also counting towards the template including it), and so is the `timetable` tag. Stats
+are accumulated in each process and merged into the cache framework every `FLUSH_INTERVAL` seconds, so they're shared
+by every worker. Stats are approximate, as workers flushing at the same time may overwrite each other's. Superusers
+can browse and reset them at the admin's template profile page. A reset bumps a generation counter kept in the cache,
+so every worker drops the stats it hadn't flushed yet.
+"""
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.backends.django import DjangoTemplates as DjangoTemplatesBackend
+from django_jinja.backend import Jinja2 as Jinja2Backend
+
+from cayuman.caching import KEY_PREFIX
+
+PROFILE_CACHE_KEY = f"{KEY_PREFIX}:template_profile"
+PROFILE_GENERATION_KEY = f"{KEY_PREFIX}:template_profile_generation"  # bumped on every reset
+MAX_SAMPLES = 1000  # most recent durations kept per template, to compute percentiles
+FLUSH_INTERVAL = 10  # seconds between merges of this process' stats into the cache
+
+# Stats recorded by this process since its last flush
+_stats: Dict[str, Dict] = {}
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+# Profile generation the stats above belong to, None until this process' first flush
+_generation: Optional[int] = None
+
+
+def is_enabled() -> bool:
+    return settings.TEMPLATE_PROFILING
+
+
+def _add(stats: Dict, name: str, count: int, total: float, samples: List[float]) -> None:
+    entry = stats.setdefault(name, {"count": 0, "total": 0.0, "samples": []})
+    entry["count"] += count
+    entry["total"] += total
+    entry["samples"].extend(samples)
+    del entry["samples"][:-MAX_SAMPLES]
+
+
+def record(name: str, seconds: float) -> None:
+    """Adds a render of `name` lasting `seconds` to the stats"""
+    with _lock:
+        _add(_stats, name, 1, seconds, [seconds])
+        due = time.monotonic() - _last_flush >= FLUSH_INTERVAL
+    if due:
+        flush()
+
+
+def flush() -> None:
+    """
+    Merges the stats recorded by this process into the shared ones in the cache,
+    dropping them instead if the profile was reset by any process since the last flush
+    """
+    global _generation, _last_flush
+    with _lock:
+        local = dict(_stats)
+        _stats.clear()
+        _last_flush = time.monotonic()
+    if not local:
+        return
+    cached = cache.get_many([PROFILE_CACHE_KEY, PROFILE_GENERATION_KEY])
+    generation = cached.get(PROFILE_GENERATION_KEY, 0)
+    stale = _generation is not None and _generation != generation
+    _generation = generation
+    if stale:
+        return
+    stats = cached.get(PROFILE_CACHE_KEY) or {}
+    for name, entry in local.items():
+        _add(stats, name, entry["count"], entry["total"], entry["samples"])
+    cache.set(PROFILE_CACHE_KEY, stats, None)
+
+
+@contextmanager
+def profile(name: str):
+    """Times the block as a render of `name`, if profiling is enabled"""
+    if not is_enabled():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def get_profile() -> List[Dict]:
+    """Stats per template in milliseconds, slowest cumulative time first"""
+    flush()
+    rows = []
+    for name, entry in (cache.get(PROFILE_CACHE_KEY) or {}).items():
+        samples = sorted(entry["samples"])
+        percentiles = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+        rows.append(
+            {
+                "name": name,
+                "count": entry["count"],
+                "total": entry["total"] * 1000,
+                "mean": entry["total"] / entry["count"] * 1000,
+                "p50": percentiles[49] * 1000,
+                "p95": percentiles[94] * 1000,
+                "max": samples[-1] * 1000,
+            }
+        )
+    return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+
+def reset_profile() -> None:
+    """Clears the profile, making every process drop its unflushed stats on its next flush"""
+    global _generation
+    cache.add(PROFILE_GENERATION_KEY, 0, None)
+    try:
+        generation = cache.incr(PROFILE_GENERATION_KEY)
+    except ValueError:
+        # evicted in between
+        generation = 1
+        cache.set(PROFILE_GENERATION_KEY, generation, None)
+    with _lock:
+        _stats.clear()
+        _generation = generation
+    cache.delete(PROFILE_CACHE_KEY)
+
+
+class ProfiledTemplate:
+    """Template timing its renders as `profile_name`. Anything else is the wrapped template's"""
+
+    def __init__(self, template, profile_name: str):
+        self.wrapped = template
+        self.profile_name = profile_name
+
+    def __getattr__(self, attr):
+        return getattr(self.wrapped, attr)
+
+    def render(self, *args, **kwargs):
+        with profile(self.profile_name):
+            return self.wrapped.render(*args, **kwargs)
+
+
+class ProfiledJinja2Template(ProfiledTemplate):
+    """Jinja2 template also timing renders as an included or parent template, which go through `root_render_func`"""
+
+    def root_render_func(self, context):
+        if not is_enabled():
+            yield from self.wrapped.root_render_func(context)
+            return
+        start = time.perf_counter()
+        try:
+            yield from self.wrapped.root_render_func(context)
+        finally:
+            record(self.profile_name, time.perf_counter() - start)
+
+
+class Jinja2(Jinja2Backend):
+    """
+    django-jinja backend whose templates can be profiled. Templates are looked up by name through the environment's
+    `get_template`, whether they're rendered by views or included and extended by other templates
+    """
+
+    def __init__(self, params):
+        super().__init__(params)
+        get_template = self.env.get_template
+
+        def profiled_get_template(name, *args, **kwargs):
+            if isinstance(name, ProfiledTemplate):
+                return name
+            template = get_template(name, *args, **kwargs)
+            return ProfiledJinja2Template(template, f"jinja2:{template.name}")
+
+        self.env.get_template = profiled_get_template
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(super().from_string(template_code), "jinja2:<string>")
+
+
+class DjangoTemplates(DjangoTemplatesBackend):
+    """
+    Django templates backend whose templates can be profiled. Templates are looked up by name through the engine's
+    `get_template`, whether they're rendered by views or included by other templates. Parents of `extends` aren't
+    timed on their own, their time counts towards the extending template
+    """
+
+    def __init__(self, params):
+        super().__init__(params)
+        get_template = self.engine.get_template
+
+        def profiled_get_template(template_name):
+            return ProfiledTemplate(get_template(template_name), f"django:{template_name}")
+
+        self.engine.get_template = profiled_get_template
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(super().from_string(template_code), "django:<string>")
@@ -0,0 +1,61 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Session key holding the timestamp until which a member must keep reading from the primary database
+STICKY_SESSION_KEY = "_cayuman_primary_until"
+
+_state = threading.local()
+
+
+def replica_enabled() -> bool:
+    """Tells whether a replica database has been configured"""
+    return settings.REPLICA_DATABASE in settings.DATABASES
+
+
+@contextmanager
+def use_replica():
+    """Route every read done inside this block to the replica database, if there's one"""
+    previous = getattr(_state, "use_replica", False)
+    _state.use_replica = True
+    try:
+        yield
+    finally:
+        _state.use_replica = previous
+
+
+def stick_to_primary(request) -> None:
+    """
+    Make `request`'s session read from the primary database during the next `REPLICA_STICKINESS` seconds,
+    so members see their own writes even if the replica lags behind
+    """
+    if replica_enabled() and hasattr(request, "session"):
+        request.session[STICKY_SESSION_KEY] = time.time() + settings.REPLICA_STICKINESS
+
+
+def is_sticky(request) -> bool:
+    """Tells whether `request` must keep reading from the primary database after a recent write"""
+    if not hasattr(request, "session"):
+        return False
+    return request.session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+
+class ReplicaRouter:
+    """
+    Database router sending reads done inside `use_replica()` to `settings.REPLICA_DATABASE`.
+    Everything else (writes, and reads from views not marked as read only) goes to the default database.
+    """
+
+    def db_for_read(self, model, **hints):
+        if getattr(_state, "use_replica", False) and replica_enabled():
+            return settings.REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replica holds the same data as default, so objects read from either one can be related
+        return True
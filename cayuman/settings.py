@@ -61,6 +61,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "cayuman.middleware.GZipMiddleware",
+    "cayuman.middleware.StaticFilesMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -75,9 +77,11 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "cayuman.urls"
 
+# Both backends can time renders, see `TEMPLATE_PROFILING` below
 TEMPLATES = [
     {
-        "BACKEND": "django_jinja.jinja2.Jinja2",
+        "NAME": "jinja2",
+        "BACKEND": "cayuman.profiling.Jinja2",
         "DIRS": [
             BASE_DIR / "cayuman/templates",
         ],
@@ -109,6 +113,12 @@ TEMPLATES = [
                 "url_switch_period": "cayuman.templatetags.cayuman.url_switch_period",
             },
             "auto_reload": DEBUG,
+            # Set `JINJA2_BYTECODE_CACHE_DIR` env var to keep compiled templates on disk (see `manage.py precompile_templates`)
+            "bytecode_cache": {
+                "enabled": bool(os.getenv("JINJA2_BYTECODE_CACHE_DIR")),
+                "backend": "cayuman.bytecode_cache.FileSystemBytecodeCache",
+                "name": os.getenv("JINJA2_BYTECODE_CACHE_DIR", ""),
+            },
             "autoescape": True,
             "translation_engine": "django.utils.translation",
             "policies": {
@@ -117,7 +127,8 @@ TEMPLATES = [
         },
     },
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "NAME": "django",
+        "BACKEND": "cayuman.profiling.DjangoTemplates",
         "APP_DIRS": True,
         "DIRS": [
             BASE_DIR / "cayuman/templates",
@@ -137,11 +148,14 @@ WSGI_APPLICATION = "cayuman.wsgi.application"
 
 
 # Caches
+# Set `CACHE` env var (json) to a backend shared by all workers (i.e. memcached, redis or database) in production
 CACHES = {
-    "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "unique-snowflake",
-    }
+    "default": json.loads(
+        os.getenv(
+            "CACHE",
+            '{"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "unique-snowflake"}',
+        )
+    )
 }
 
 
@@ -150,6 +164,13 @@ CACHES = {
 
 DATABASES = {"default": json.loads(os.getenv("DATABASE", "{}"))}
 
+# Optional read replica. Views decorated with `read_only_view` send their reads there (see cayuman/routers.py)
+REPLICA_DATABASE = "replica"
+REPLICA_STICKINESS = int(os.getenv("REPLICA_STICKINESS", 5))  # seconds a member keeps reading from default after saving
+if os.getenv("DATABASE_REPLICA"):
+    DATABASES[REPLICA_DATABASE] = json.loads(os.getenv("DATABASE_REPLICA"))
+    DATABASE_ROUTERS = ["cayuman.routers.ReplicaRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -197,6 +218,30 @@ LOCALE_PATHS = [
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
 STATIC_URL = "static/"
+STATIC_ROOT = os.getenv("STATIC_ROOT", BASE_DIR / "staticfiles")
+
+# With `MANIFEST_STATIC=1`, `collectstatic` writes hashed file names and their gzipped copies to `STATIC_ROOT`.
+# `{% static %}` then fails until `collectstatic` has run, so it's meant for deployments only
+try:
+    MANIFEST_STATIC = True if int(os.getenv("MANIFEST_STATIC", "")) else False
+except ValueError:
+    MANIFEST_STATIC = False
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "cayuman.storage.CompressedManifestStaticFilesStorage"
+        if MANIFEST_STATIC
+        else "django.contrib.staticfiles.storage.StaticFilesStorage"
+    },
+}
+
+# Serve `STATIC_ROOT` from the app itself (see `cayuman.middleware.StaticFilesMiddleware`), for when there's no front proxy
+try:
+    SERVE_STATIC = True if int(os.getenv("SERVE_STATIC", "")) else False
+except ValueError:
+    SERVE_STATIC = False
+# Seconds browsers keep hashed static files
+STATIC_MAX_AGE = 60 * 60 * 24 * 365
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -283,3 +328,21 @@ IMPERSONATE = {
 # Cayuman specific settings
 STUDENTS_GROUP = _("Students")
 TEACHERS_GROUP = _("Teachers")
+
+# Seconds rendered fragments are kept in cache. They are invalidated by version anyway, so this only bounds cache usage
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv("FRAGMENT_CACHE_TIMEOUT", 60 * 60 * 24))
+
+# Record template render times, browsable by superusers at the admin's template profile page
+try:
+    TEMPLATE_PROFILING = True if int(os.getenv("TEMPLATE_PROFILING", "")) else False
+except ValueError:
+    TEMPLATE_PROFILING = False
+
+# Stream big admin pages (full rosters, cycle timetables) as they're rendered instead of building them in memory first
+try:
+    STREAM_ADMIN_PAGES = True if int(os.getenv("STREAM_ADMIN_PAGES", "")) else False
+except ValueError:
+    STREAM_ADMIN_PAGES = False
+
+# Seconds the admin occupancy dashboard is cached for, and refreshes itself after
+OCCUPANCY_CACHE_TIMEOUT = int(os.getenv("OCCUPANCY_CACHE_TIMEOUT", 30))
@@ -0,0 +1,41 @@
+"""
+Static files storage for production: hashed file names from `ManifestStaticFilesStorage`, plus a gzipped copy of each
+compressible file written by `collectstatic`, ready to be served by `cayuman.middleware.StaticFilesMiddleware`.
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".map", ".svg", ".txt", ".html", ".json", ".xml", ".ttf", ".eot", ".ico")
+MIN_COMPRESS_SIZE = 256  # bytes. Gzip headers outweigh the gains on tinier files
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage also writing `<name>.gz` next to compressible files, for both hashed and original names"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted({*paths, *self.hashed_files.values()}):
+            if compressed_name := self.compress(name):
+                yield name, compressed_name, True
+
+    def compress(self, name: str):
+        """Writes a gzipped copy of `name` if worth it, returning its name"""
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return None
+        path = self.path(name)
+        with open(path, "rb") as f:
+            content = f.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return None
+        # Fixed mtime so builds are reproducible
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) >= len(content):
+            return None
+        with open(f"{path}.gz", "wb") as f:
+            f.write(compressed)
+        os.utime(f"{path}.gz", (os.path.getatime(path), os.path.getmtime(path)))
+        return f"{name}.gz"
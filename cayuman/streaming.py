@@ -0,0 +1,46 @@
+"""
+Helpers to stream big pages: everything before their bulky part is sent right away, and the bulky part is rendered
+in chunks as it's sent, so memory per request doesn't grow with the page.
+"""
+from itertools import islice
+from typing import Iterable
+from typing import Iterator
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.template.loader import get_template
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
+from django.utils.safestring import mark_safe
+
+# Placeholder rendered where chunks go, so the page can be split around it
+STREAM_SLOT = "<!-- cayuman:stream-slot -->"
+
+
+def render_rows(template_name: str, rows: Iterable, chunk_size: int = 100, **context) -> Iterator[str]:
+    """Lazily renders `template_name` once per `chunk_size` items of `rows`, passed to it as `rows`"""
+    template = get_template(template_name)
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        yield template.render({**context, "rows": chunk})
+
+
+def render_with_chunks(request, template_name: str, context: dict, slot: str, chunks: Iterable[str]):
+    """
+    Renders `template_name` with `context[slot]` made of `chunks`, lazily rendered HTML strings.
+
+    If `settings.STREAM_ADMIN_PAGES` is on, returns a streaming response sending everything before the slot first,
+    then each chunk as soon as it's rendered and then the rest of the page. Otherwise chunks are joined and the page
+    is rendered as usual. Both ways output the same HTML.
+    """
+    if not settings.STREAM_ADMIN_PAGES:
+        return TemplateResponse(request, template_name, {**context, slot: mark_safe("".join(chunks))})
+
+    head, tail = render_to_string(template_name, {**context, slot: mark_safe(STREAM_SLOT)}, request=request).split(STREAM_SLOT, 1)
+
+    def stream():
+        yield head
+        yield from chunks
+        yield tail
+
+    return StreamingHttpResponse(stream(), content_type="text/html; charset=utf-8")
@@ -1,20 +1,24 @@
 import random
+from collections import defaultdict
 from dataclasses import dataclass
+from datetime import time
+from functools import cached_property
 from functools import lru_cache
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
 
 import jinja2
-from django.template import Context
+from django.db.models import prefetch_related_objects
 from django.template import Library
 from django.template import Node
-from django.template import Template
 from django.template import TemplateSyntaxError
 from django.template.base import kwarg_re
 from django.template.loader import render_to_string
 from django.utils.safestring import mark_safe
-from django.utils.safestring import SafeString
 from django_jinja import library
 from jinja2 import nodes
-from jinja2 import Template as JinjaTemplate
 from jinja2.ext import Extension
 from jinja2.ext import Markup
 
@@ -23,21 +27,19 @@ register = Library()
 
 
 BLOCK_TPL_JINJA2 = """
-{% for block in blocks %}
+{% for block, cells in rows %}
 <tr{% if tr_class %} class="{{tr_class}}"{% endif %}>
     <th{% if th_class %} class="{{th_class}}"{% endif %} scope="row">
         {{ block.0.strftime('%H:%M') }} - {{ block.1.strftime('%H:%M') }}
     </th>
 
-    {% for schedule in schedules %}
-        {% if schedule.time_start == block.0 %}
-            {% if results[schedule.id|string] %}
-            <td{% if td_class %} class="{{td_class}}"{% endif %}>
-                {{results[schedule.id|string]}}
-            </td>
-            {% else %}
-            <td></td>
-            {% endif %}
+    {% for cell in cells %}
+        {% if cell %}
+        <td{% if td_class %} class="{{td_class}}"{% endif %}>
+            {{cell}}
+        </td>
+        {% else %}
+        <td></td>
         {% endif %}
     {% endfor %}
 </tr>
@@ -45,64 +47,128 @@ BLOCK_TPL_JINJA2 = """
 
 
 BLOCK_TPL_DJANGO = """
-{% for block in blocks %}
+{% for block, cells in rows %}
 <tr{% if tr_class %} class="{{tr_class}}"{% endif %}>
     <th{% if th_class %} class="{{th_class}}"{% endif %} scope="row">
         {{ block.0|date:'H:i' }} - {{ block.1|date:'H:i' }}
     </th>
 
-    {% for schedule in schedules %}
-        {% if schedule.time_start == block.0 %}
-            {% with key=schedule.id|stringformat:"d" %}
-                {% if key in results %}
-                    {% for k, v in results.items %}
-                        {# TO-DO: make more efficient #}
-                        {% if k == key %}
-                        <td{% if td_class %} class="{{td_class}}"{% endif %}>
-                            {{v|default:''}}
-                        </td>
-                        {% endif %}
-                    {% endfor %}
-                {% else %}
-                    <td></td>
-                {% endif %}
-            {% endwith %}
+    {% for cell in cells %}
+        {% if cell %}
+        <td{% if td_class %} class="{{td_class}}"{% endif %}>
+            {{cell}}
+        </td>
+        {% else %}
+        <td></td>
         {% endif %}
     {% endfor %}
 </tr>
 {% endfor %}"""
 
 
-@lru_cache
-def get_scheduling_data():
+@dataclass
+class ScheduleGrid:
+    """Weekly grid every timetable is drawn on"""
+
+    schedules: List  # ordered by week day and time_start
+    blocks: List[Tuple[time, time]]  # distinct (time_start, time_end) pairs, in order of appearance
+    slots: List[List[int]]  # ids of the schedules laid out on each block's row
+
+    @property
+    def days(self):
+        from cayuman.models import Schedule
+
+        return list(Schedule.CHOICES)
+
+    @classmethod
+    def build(cls, schedules) -> "ScheduleGrid":
+        """Builds the grid out of ordered schedules in linear time"""
+        schedules = list(schedules)
+        blocks = list(dict.fromkeys((schedule.time_start, schedule.time_end) for schedule in schedules))
+
+        by_time_start = defaultdict(list)
+        for schedule in schedules:
+            by_time_start[schedule.time_start].append(schedule.id)
+
+        return cls(schedules=schedules, blocks=blocks, slots=[by_time_start[block[0]] for block in blocks])
+
+
+def get_schedule_grid() -> ScheduleGrid:
+    """
+    Returns the schedule grid, shared by every worker through the cache framework.
+    It's rebuilt only when a schedule changes, as the `Schedule` signals bump the version its key embeds
+    """
+    from django.conf import settings
+    from django.core.cache import cache
+    from cayuman.caching import schedule_grid_cache_key
     from cayuman.models import Schedule
 
-    schedules = Schedule.objects.ordered()
-    days = [t for t in Schedule.CHOICES]
-    raw_blocks = [(block.time_start, block.time_end) for block in schedules]
-    blocks = []
-    [blocks.append(item) for item in raw_blocks if item not in blocks]
+    key = schedule_grid_cache_key()
+    grid = cache.get(key)
+    if grid is None:
+        grid = ScheduleGrid.build(Schedule.objects.ordered())
+        cache.set(key, grid, settings.FRAGMENT_CACHE_TIMEOUT)
+    return grid
+
+
+@lru_cache
+def get_block_template_django():
+    """`BLOCK_TPL_DJANGO` compiled once per process by the Django templates engine"""
+    from django.template import engines
+
+    return engines["django"].from_string(BLOCK_TPL_DJANGO)
+
 
-    return days, blocks, schedules
+def index_by_schedule(workshop_periods) -> Dict[int, List]:
+    """Maps each schedule id to the workshop periods taking place on it, in a single pass over prefetched schedules"""
+    from cayuman.models import WorkshopPeriod
 
+    # no-op for workshop periods whose schedules were already prefetched
+    prefetch_related_objects([wp for wp in workshop_periods if isinstance(wp, WorkshopPeriod)], "schedules")
 
-def django_render_string(template_string, context_dict):
-    # Create a Template object
-    template = Template(template_string)
+    index = defaultdict(list)
+    for workshop_period in workshop_periods:
+        for schedule in workshop_period.schedules.all():
+            index[schedule.id].append(workshop_period)
+    return index
 
-    # Create a Context object
-    context = Context(context_dict)
 
-    # Render the template with the context
-    return template.render(context)
+def render_timetable_cells(workshop_periods, schedules, render_body: Callable) -> Dict[int, str]:
+    """
+    Renders the contents of each timetable cell as `{schedule_id: content}`, leaving out empty cells.
+    `render_body(schedule, workshop_period)` is only called for workshop periods actually taking place on `schedule`
+    """
+    index = index_by_schedule(list(workshop_periods))
+    cells = {}
+    for schedule in schedules:
+        contents = [render_body(schedule, workshop_period).strip() for workshop_period in index.get(schedule.id, [])]
+        contents = [content for content in contents if content]
+        if contents:
+            cells[schedule.id] = "".join(contents)
+    return cells
+
 
+def timetable_rows(grid: ScheduleGrid, cells: Dict[int, str]) -> List[Tuple]:
+    """Lays `cells` out as `(block, [cell for each schedule starting at block])` rows, ready for the block templates"""
+    return [(block, [cells.get(schedule_id) for schedule_id in slot]) for block, slot in zip(grid.blocks, grid.slots)]
 
-def jinja2_render_string(template_string, context_dict):
-    # Create a Template object
-    template = JinjaTemplate(template_string)
 
-    # Render the template with the context dictionary
-    return template.render(context_dict)
+def cached_timetable(workshop_periods, kwargs: dict, render: Callable):
+    """
+    Returns `render(workshop_periods, kwargs)`. If the tag was given a `cache` name, the output is cached and shared
+    by every timetable showing the same workshop periods with the same arguments
+    """
+    from cayuman.caching import get_or_render_fragment
+    from cayuman.caching import timetable_cache_key
+    from cayuman.profiling import profile
+
+    name = kwargs.pop("cache", None)
+    with profile(f"timetable:{name or '<not cached>'}"):
+        if not name:
+            return render(workshop_periods, kwargs)
+
+        workshop_periods = list(workshop_periods)
+        return get_or_render_fragment(timetable_cache_key(name, workshop_periods, **kwargs), lambda: render(workshop_periods, kwargs))
 
 
 @register.tag("timetable")
@@ -117,14 +183,19 @@ def do_timetable(parser, token):
         {% endif %}
     {% endtimetable %}
 
-    The content of the `timetable` block will be rendered for each item in the `workshop_periods` list.
+    The content of the `timetable` block will be rendered for each item in the `workshop_periods` list, once per schedule
+    it takes place on. Schedules are prefetched if `workshop_periods` didn't already.
 
         ==========================  ================================================
         Variable                    Description
         ==========================  ================================================
         ``workshop_period``         Current `workshop_period` object
+        ``schedule``                Current `schedule` object
         ``key``                     Pass keyword args to the template
         ==========================  ================================================
+
+    Pass `cache="name"` to cache the rendered timetable, shared by every timetable named `name` showing the same
+    workshop periods with the same keyword args. Anything else the body depends on must be passed as a keyword arg.
     """
     bits = token.split_contents()
     if len(bits) < 2:
@@ -163,34 +234,23 @@ class TimetableNode(Node):
     def render(self, context):
         workshop_periods = self.workshop_periods.resolve(context)
         kwargs = {k: v.resolve(context) for k, v in self.kwargs.items()}
-        days, blocks, schedules = get_scheduling_data()
-
-        results = {}
-
-        for block in blocks:
-            for schedule in schedules:
-                if schedule.time_start == block[0]:
-                    if schedule.id not in results:
-                        results[f"{schedule.id}"] = []
-                    for workshop_period in workshop_periods:
-                        # Manually update the context for each iteration
-                        temp_ctx = {"schedule": schedule, "workshop_period": workshop_period}
-                        with context.push(**temp_ctx):
-                            rendered_content = self.nodelist.render(context)
-                            if rendered_content.strip():
-                                results[f"{schedule.id}"].append(mark_safe(rendered_content.strip()))
-                            else:
-                                results[f"{schedule.id}"].append("")
-
-        for key, val in results.items():
-            if any(isinstance(v, SafeString) for v in val):
-                results[key] = mark_safe("".join([v.strip() for v in val]))
-            else:
-                results[key] = None
+        return cached_timetable(
+            workshop_periods, kwargs, lambda workshop_periods, kwargs: self._render_timetable(context, workshop_periods, **kwargs)
+        )
+
+    def _render_timetable(self, context, workshop_periods, **kwargs):
+        grid = get_schedule_grid()
+
+        def render_body(schedule, workshop_period):
+            with context.push(schedule=schedule, workshop_period=workshop_period):
+                return self.nodelist.render(context)
+
+        cells = render_timetable_cells(workshop_periods, grid.schedules, render_body)
+        cells = {schedule_id: mark_safe(content) for schedule_id, content in cells.items()}
 
-        params_tbody = {"results": results, "blocks": blocks, "schedules": schedules}
+        params_tbody = {"rows": timetable_rows(grid, cells)}
         params_tbody.update(kwargs)
-        params = {"tbody": django_render_string(BLOCK_TPL_DJANGO, params_tbody), "days": days}
+        params = {"tbody": get_block_template_django().render(params_tbody), "days": grid.days}
         params.update(kwargs)
         return render_to_string("timetable_template.html", params)
 
@@ -231,8 +291,13 @@ class TimetableExtension(Extension):
 
         return nodes.CallBlock(self.call_method("_render_timetable", [workshop_periods], kwargs), [wp, sc], [], body).set_lineno(lineno)
 
+    @cached_property
+    def block_template(self):
+        """`BLOCK_TPL_JINJA2` compiled once by this extension's environment, so its autoescape and i18n settings apply"""
+        return self.environment.from_string(BLOCK_TPL_JINJA2)
+
     def _render_block(self, context_dict):
-        return Markup(jinja2_render_string(BLOCK_TPL_JINJA2, context_dict))
+        return Markup(self.block_template.render(context_dict))
 
     def _render_template(self, template_path, context):
         # Load and render the template with the given context
@@ -240,61 +305,54 @@ class TimetableExtension(Extension):
         return Markup(template.render(context))
 
     def _render_timetable(self, workshop_periods, **kwargs):
-        results = {}
-        days, blocks, schedules = get_scheduling_data()
         caller = kwargs.pop("caller")
+        return cached_timetable(workshop_periods, kwargs, lambda workshop_periods, kwargs: self._render_grid(caller, workshop_periods, **kwargs))
 
-        for block in blocks:
-            for schedule in schedules:
-                if schedule.time_start == block[0]:
-                    if schedule.id not in results:
-                        results[f"{schedule.id}"] = []
-                    for workshop_period in workshop_periods:
-                        # Manually update the context for each iteration
-                        temp_context = {"schedule": schedule, "workshop_period": workshop_period}
-
-                        # Call the body of the block with the updated context
-                        rendered_content = caller(**temp_context)
-                        if rendered_content.strip():
-                            results[f"{schedule.id}"].append(Markup(rendered_content.strip()))
-                        else:
-                            results[f"{schedule.id}"].append("")
-
-        for key, val in results.items():
-            if any(isinstance(v, Markup) for v in val):
-                results[key] = Markup("".join(val))
-            else:
-                results[key] = None
+    def _render_grid(self, caller, workshop_periods, **kwargs):
+        grid = get_schedule_grid()
+
+        # Call the body of the block for each workshop period taking place on each schedule
+        cells = render_timetable_cells(
+            workshop_periods, grid.schedules, lambda schedule, workshop_period: caller(schedule=schedule, workshop_period=workshop_period)
+        )
+        cells = {schedule_id: Markup(content) for schedule_id, content in cells.items()}
 
-        params_tbody = {"results": results, "blocks": blocks, "schedules": schedules}
+        params_tbody = {"rows": timetable_rows(grid, cells)}
         params_tbody.update(kwargs)
-        params = {"tbody": self._render_block(params_tbody), "days": days}
+        params = {"tbody": self._render_block(params_tbody), "days": grid.days}
         params.update(kwargs)
         return self._render_template("timetable_template.html", params)
 
 
-@library.global_function
-@jinja2.pass_context
-def url_switch_period(context, period_id: int):
-    """Simple jinja2 filters that transforms any url to the same one but switched to the given period"""
-    from django.urls import reverse, resolve
+def _switch_period_url(match, period_id: int) -> str:
+    """Reverse the url resolved by `match` switched to the given period"""
+    from django.urls import reverse
     from django.urls.exceptions import NoReverseMatch
 
-    request = context.get("request")
-
-    # Get the current URL path and its resolver match
-    match = resolve(request.path_info)
-
     # Prepare new kwargs for URL reversing
     new_kwargs = {**match.kwargs, "period_id": period_id}
 
     # Create the new URL
     try:
-        new_url = reverse(match.view_name, args=match.args, kwargs=new_kwargs)
+        return reverse(match.view_name, args=match.args, kwargs=new_kwargs)
     except NoReverseMatch:
         # if url does not use period_id kwarg then just return the same url
-        new_url = reverse(match.view_name, kwargs=match.kwargs)
-    return new_url
+        return reverse(match.view_name, kwargs=match.kwargs)
+
+
+def _resolver_match(request):
+    """Get the resolver match of the request, resolving its path only if it wasn't resolved already"""
+    from django.urls import resolve
+
+    return getattr(request, "resolver_match", None) or resolve(request.path_info)
+
+
+@library.global_function
+@jinja2.pass_context
+def url_switch_period(context, period_id: int):
+    """Simple jinja2 filters that transforms any url to the same one but switched to the given period"""
+    request = context.get("request")
+    return _switch_period_url(_resolver_match(request), period_id)
 
 
 @library.global_function
@@ -308,6 +366,43 @@ def other_periods(context):
         return Period.objects.other_periods(request.period, order="-id")
 
 
+@library.global_function
+@jinja2.pass_context
+def other_periods_with_urls(context):
+    """Get a list of `(period, url)` tuples for other periods than request.period, resolving the current url only once"""
+    request = context.get("request")
+    periods = other_periods(context) or []
+    if not periods:
+        return []
+    match = _resolver_match(request)
+    return [(period, _switch_period_url(match, period.id)) for period in periods]
+
+
+@library.global_function
+def fragment_cache_timeout():
+    """Timeout for fragments cached with the `{% cache %}` tag"""
+    from django.conf import settings
+
+    return settings.FRAGMENT_CACHE_TIMEOUT
+
+
+@library.global_function
+@jinja2.pass_context
+def navbar_cache_key(context):
+    """
+    Key for the cached navbar fragment. The fragment depends on the member, the period being viewed,
+    the route (for period switching urls), the catalog of periods, and today's date (as periods become current or past)
+    """
+    from django.utils import timezone
+    from cayuman.caching import CATALOG_VERSION, get_versions, make_key, member_version_name
+
+    request = context.get("request")
+    match = _resolver_match(request)
+    route_kwargs = ",".join(f"{k}={v}" for k, v in sorted(match.kwargs.items()) if k != "period_id")
+    versions = get_versions(CATALOG_VERSION, member_version_name(request.member.id))
+    return make_key("navbar", request.member.id, request.period.id, match.view_name, route_kwargs, timezone.localdate().isoformat(), *versions)
+
+
 @dataclass
 class FakeWorkshop:
     """Helpful class to represent fake workshop data"""
@@ -4,6 +4,7 @@ from django.contrib.auth import views as auth_views
 from django.urls import include
 from django.urls import path
 
+from .admin import template_profile_view
 from .views import EnrollmentView
 from .views import home
 from .views import StudentLoginView
@@ -12,6 +13,7 @@ from .views import workshop_period
 from .views import workshop_periods
 
 urlpatterns = [
+    path("admin/template-profile/", admin.site.admin_view(template_profile_view), name="template_profile"),
     path("admin/", admin.site.urls),
     path("accounts/login/", StudentLoginView.as_view(), name="login"),
     path("accounts/logout/", auth_views.LogoutView.as_view(next_page="login"), name="logout"),
@@ -1,23 +1,31 @@
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.http import Http404
 from django.http import HttpResponseRedirect
 from django.shortcuts import render
+from django.template.loader import render_to_string
 from django.urls import reverse_lazy as reverse
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext as _
 from django.views import View
 
+from .caching import workshop_period_cache_key
+from .compression import deflate_fragment
 from .decorators import enrollment_access_required
+from .decorators import read_only_view
 from .decorators import student_required
 from .decorators import studentcycle_required
 from .forms import StudentLoginForm
 from .forms import WorkshopSelectionForm
+from .middleware import add_compressed_fragment
 from .models import WorkshopPeriod
+from .routers import stick_to_primary
 
 
 class StudentLoginView(LoginView):
@@ -38,10 +46,10 @@ class EnrollmentView(LoginRequiredMixin, View):
 
     def get(self, request, period_id: int):
         """GET view for the enrollment form"""
-        student_cycle = request.member.current_student_cycle
+        student_cycle = request.student_context.student_cycle
 
         # current data
-        wps_by_schedule = student_cycle.available_workshop_periods_by_schedule(request.period)
+        wps_by_schedule = request.student_context.available_workshop_periods_by_schedule
         initial_data = {f"schedule_{sched.id}": wp.id for sched, wp in student_cycle.workshop_periods_by_schedule(period=request.period).items()}
         form = WorkshopSelectionForm(initial=initial_data, schedules_with_workshops=wps_by_schedule, member=request.member)
 
@@ -49,10 +57,10 @@ class EnrollmentView(LoginRequiredMixin, View):
 
     def post(self, request, period_id: int):
         """Save workshop periods for current student cycle"""
-        student_cycle = request.member.current_student_cycle
+        student_cycle = request.student_context.student_cycle
 
         # Pass schedules_with_workshops when instantiating the form for POST
-        wps_by_schedule = student_cycle.available_workshop_periods_by_schedule(request.period)
+        wps_by_schedule = request.student_context.available_workshop_periods_by_schedule
         initial_data = {f"schedule_{sched.id}": wp.id for sched, wp in student_cycle.workshop_periods_by_schedule(period=request.period).items()}
         form = WorkshopSelectionForm(
             request.POST, initial=initial_data, schedules_with_workshops=wps_by_schedule, member=request.member, period=request.period
@@ -86,6 +94,7 @@ class EnrollmentView(LoginRequiredMixin, View):
                     student_cycle.is_schedule_full.cache_clear()
                     student_cycle.workshop_periods_by_period.cache_clear()
                     # student_cycle.is_enabled_to_enroll.cache_clear()
+                    request.student_context.invalidate()
             except ValidationError as e:
                 # If a ValidationError occurs, the transaction will be rolled back automatically
                 form.add_error(None, e)
@@ -93,6 +102,8 @@ class EnrollmentView(LoginRequiredMixin, View):
             if form.errors:
                 return render(request, "enrollment.html", {"form": form})
             else:
+                # Keep reading from the primary database for a while so the student sees the workshops just saved
+                stick_to_primary(request)
                 messages.success(request, _("Your workshops have been saved"))
                 return HttpResponseRedirect(reverse("weekly_schedule", kwargs={"period_id": request.period.id}))
         else:
@@ -109,7 +120,7 @@ def home(request):
     - if studentcycle.is_full_schedule(request.period) - redirect to schedule view
     - else - redirect to workshops view
     """
-    if request.member.is_schedule_full(request.period):
+    if request.student_context.is_schedule_full:
         return HttpResponseRedirect(reverse("weekly_schedule", kwargs={"period_id": request.period.id}))
     else:
         return HttpResponseRedirect(reverse("workshop_periods", kwargs={"period_id": request.period.id}))
@@ -118,9 +129,10 @@ def home(request):
 @login_required(login_url=reverse("login"))
 @student_required
 @studentcycle_required
+@read_only_view
 def weekly_schedule(request, period_id: int):
     """Show users their weekly time table for the given period"""
-    wps = request.member.current_student_cycle.workshop_periods.filter(period=request.period)
+    wps = request.student_context.student_cycle.workshop_periods.filter(period=request.period).with_display_relations().order_by("id")
     return render(
         request,
         "weekly_schedule.html",
@@ -129,30 +141,47 @@ def weekly_schedule(request, period_id: int):
 
 
 @login_required(login_url=reverse("login"))
+@read_only_view
 def workshop_period(request, workshop_period_id: int):
-    """View detailed information about a workshop period"""
-    try:
-        wp = WorkshopPeriod.objects.get(id=workshop_period_id)
-    except WorkshopPeriod.DoesNotExist:
-        raise Http404
-    return render(request, "workshop_period.html", {"wp": wp})
+    """
+    View detailed information about a workshop period.
+    Its body is the same for every viewer, so it's rendered once and cached until the workshop period changes
+    """
+    key = workshop_period_cache_key(workshop_period_id)
+    page = cache.get(key)
+    if page is None:
+        try:
+            wp = WorkshopPeriod.objects.with_display_relations().get(id=workshop_period_id)
+        except WorkshopPeriod.DoesNotExist:
+            raise Http404
+        body = render_to_string("workshop_period_body.html", {"wp": wp})
+        page = {
+            "title": f"{wp.workshop.name} {wp.period.date_start} - {wp.period.date_end}",
+            "body": body,
+            "body_deflated": deflate_fragment(body),
+        }
+        cache.set(key, page, settings.FRAGMENT_CACHE_TIMEOUT)
+    if "body_deflated" in page:
+        add_compressed_fragment(page["body"], page["body_deflated"])
+    return render(request, "workshop_period.html", {"page": page})
 
 
 @login_required(login_url=reverse("login"))
 @student_required
+@read_only_view
 def workshop_periods(request, period_id: int):
     """View showing the list of all available workshops for the given logged in student"""
-    wps = set()
+    wps = []
     show_workshop_periods = False  # By default do not show anything
 
-    current_student_cycle = request.member.current_student_cycle
     # Get all available workshop periods for this student and return
-    if current_student_cycle:
+    if request.student_context.student_cycle:
         # calculate show_workshop_periods according if the period is current, or is in the past or member is enabled to enroll
         show_workshop_periods = request.period.is_enabled_to_preview() or request.period.is_in_the_past()
         if show_workshop_periods:
-            wps_by_schedule = current_student_cycle.available_workshop_periods_by_schedule(request.period)
-            wps = {wp for sublist in wps_by_schedule.values() for wp in sublist}
+            wps_by_schedule = request.student_context.available_workshop_periods_by_schedule
+            # workshop periods taking place on several schedules show up once, in schedules order
+            wps = list(dict.fromkeys(wp for sublist in wps_by_schedule.values() for wp in sublist))
     else:
         messages.warning(request, _("Your student account is not associated with any Cycle. Please ask your teachers to fix this."))
 
@@ -115,6 +115,9 @@ def deploy(ctx):
         print("\n4. Compiling translation messages...")
         ctx.run("poetry run python manage.py compilemessages")
 
+        print("\n5. Collecting and compressing static files...")
+        ctx.run("poetry run python manage.py collectstatic --noinput")
+
         print("\n✨ Deployment completed successfully!")
         print("Remember that the changes are not actual until the webapp is reloaded in PythonAnywhere")
 
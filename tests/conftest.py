@@ -1,6 +1,7 @@
 from datetime import datetime
 from datetime import time
 from unittest.mock import Mock
+from unittest.mock import patch
 
 import pytest
 from django.conf import settings
@@ -8,6 +9,10 @@ from django.contrib.auth.models import Group
 from django.contrib.messages.middleware import MessageMiddleware
 from django.contrib.messages.storage.fallback import FallbackStorage
 from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
+from django.db import connections
+from django.db import router
+from django.db.utils import ConnectionRouter
 from django.test import RequestFactory
 from django.utils import timezone
 
@@ -16,11 +21,39 @@ from cayuman.models import Cycle
 from cayuman.models import Member
 from cayuman.models import Period
 from cayuman.models import Schedule
+from cayuman.models import StudentCycle
 
 
 def pytest_configure():
-    """Set language to English for tests"""
+    """
+    Set language to English for tests, and add a separate SQLite database standing in for the replica when there's
+    none, so routing is checked against a real second connection
+    """
     settings.LANGUAGE_CODE = "en"
+    if settings.REPLICA_DATABASE not in settings.DATABASES:
+        settings.DATABASES[settings.REPLICA_DATABASE] = {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}
+        settings.DATABASE_ROUTERS = ["cayuman.routers.ReplicaRouter"]
+        # connections and routers were already set up from settings when apps were loaded
+        connections.settings = connections.configure_settings(settings.DATABASES)
+        router.routers = ConnectionRouter().routers
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Start every test with an empty cache so cached fragments never leak between tests"""
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def single_database():
+    """
+    Tests run against the default database only, as the replica test database is a separate one that doesn't get the
+    data fixtures create. Tests about replicas enable it explicitly
+    """
+    with patch("cayuman.routers.replica_enabled", return_value=False):
+        yield
 
 
 @pytest.fixture
@@ -67,6 +100,34 @@ def create_student():
     return user
 
 
+@pytest.fixture
+def enroll_students():
+    """
+    Factory adding `count` students on `cycle`, enrolled in `workshop_periods` and joined on `date_joined` if given
+    (today otherwise). Returns their student cycles
+    """
+    from django.contrib.auth.hashers import make_password
+
+    group, _ = Group.objects.get_or_create(name=settings.STUDENTS_GROUP)
+    password = make_password("12345")
+
+    def enroll(count, cycle, workshop_periods, date_joined=None):
+        start = Member.objects.count()
+        student_cycles = []
+        for i in range(start, start + count):
+            student = Member.objects.create(username=f"{i:08}", password=password, first_name=f"Student{i:03}", last_name="Test")
+            student.groups.add(group)
+            student_cycle = StudentCycle.objects.create(student=student, cycle=cycle)
+            student_cycle.workshop_periods.add(*workshop_periods)
+            student_cycles.append(student_cycle)
+        if date_joined is not None:
+            # `date_joined` is set on creation
+            StudentCycle.objects.filter(id__in=[sc.id for sc in student_cycles]).update(date_joined=date_joined)
+        return student_cycles
+
+    return enroll
+
+
 @pytest.fixture
 def create_teacher():
     """Fixture to create a teacher"""
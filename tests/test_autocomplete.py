@@ -0,0 +1,76 @@
+from datetime import time
+
+import pytest
+from django.core.paginator import UnorderedObjectListWarning
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from cayuman.models import Schedule
+from cayuman.models import StudentCycle
+from cayuman.models import WorkshopPeriod
+
+pytestmark = pytest.mark.django_db
+
+
+def _autocomplete(client, model_name, field_name, term="", **params):
+    response = client.get(
+        reverse("admin:autocomplete"), {"app_label": "cayuman", "model_name": model_name, "field_name": field_name, "term": term, **params}
+    )
+    assert response.status_code == 200
+    return {int(result["id"]) for result in response.json()["results"]}
+
+
+@pytest.fixture
+def offering(create_period, create_teacher, create_workshops, create_cycles):
+    """A workshop period per cycle, on different schedules"""
+    workshop_periods = []
+    for i, cycle in enumerate(create_cycles):
+        wp = WorkshopPeriod.objects.create(workshop=create_workshops[i], period=create_period, teacher=create_teacher)
+        wp.cycles.add(cycle)
+        wp.schedules.add(Schedule.objects.create(day="monday", time_start=time(8 + i, 0), time_end=time(8 + i, 30)))
+        workshop_periods.append(wp)
+    return workshop_periods
+
+
+def test_autocomplete_members_by_role(client_authenticated_superuser, create_student, create_teacher):
+    """Test student fields only offer students and teacher fields only teachers, searched by name or RUT"""
+    client = client_authenticated_superuser
+    assert _autocomplete(client, "studentcycle", "student") == {create_student.id}
+    assert _autocomplete(client, "studentcycle", "student", term=create_student.username[:4]) == {create_student.id}
+    assert _autocomplete(client, "studentcycle", "student", term="nobody") == set()
+    assert _autocomplete(client, "workshopperiod", "teacher") == {create_teacher.id}
+    assert _autocomplete(client, "workshopperiod", "teacher", term=create_teacher.first_name) == {create_teacher.id}
+
+
+def test_autocomplete_workshop_periods(client_authenticated_superuser, offering, create_cycles):
+    """Test student cycles workshop periods are looked up in the current period, for the given cycle only"""
+    client = client_authenticated_superuser
+    assert _autocomplete(client, "studentcycle", "workshop_periods") == {wp.id for wp in offering}
+    assert _autocomplete(client, "studentcycle", "workshop_periods", cycle=create_cycles[1].id) == {offering[1].id}
+    assert _autocomplete(client, "studentcycle", "workshop_periods", term=offering[2].workshop.name) == {offering[2].id}
+
+
+def test_student_cycle_change_form_size(client_authenticated_superuser, offering, create_student, create_cycles):
+    """Test the change form only renders chosen workshop periods, and looks others up for the student cycle's cycle"""
+    student_cycle = StudentCycle.objects.create(student=create_student, cycle=create_cycles[0])
+    student_cycle.workshop_periods.add(offering[0])
+
+    content = client_authenticated_superuser.get(reverse("admin:cayuman_studentcycle_change", args=[student_cycle.id])).content.decode()
+
+    assert f'<option value="{offering[0].id}" selected>' in content
+    assert all(f'<option value="{wp.id}"' not in content for wp in offering[1:])
+    assert f"autocomplete/?cycle={create_cycles[0].id}" in content
+
+
+def test_autocomplete_workshop_periods_ordered_without_counts(client_authenticated_superuser, offering, recwarn):
+    """Test workshop periods are looked up in a stable order, without counting students"""
+    with CaptureQueriesContext(connection) as queries:
+        response = client_authenticated_superuser.get(
+            reverse("admin:autocomplete"), {"app_label": "cayuman", "model_name": "studentcycle", "field_name": "workshop_periods"}
+        )
+
+    ids = [int(result["id"]) for result in response.json()["results"]]
+    assert ids == [wp.id for wp in sorted(offering, key=lambda wp: (wp.workshop.name, wp.id))]
+    assert not any("GROUP BY" in query["sql"] for query in queries.captured_queries)
+    assert not any(issubclass(warning.category, UnorderedObjectListWarning) for warning in recwarn)
@@ -0,0 +1,41 @@
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.template import engines
+
+from cayuman.bytecode_cache import FileSystemBytecodeCache
+
+
+@pytest.fixture
+def jinja_env(monkeypatch, tmp_path):
+    """Jinja2 environment using a bytecode cache in a temporary directory"""
+    env = engines["jinja2"].env
+    monkeypatch.setattr(env, "bytecode_cache", FileSystemBytecodeCache(str(tmp_path / "jinja2")))
+    # don't leave templates loaded from the temporary bytecode cache behind
+    monkeypatch.setattr(env, "cache", env.cache.copy())
+    return env
+
+
+def test_precompile_templates(jinja_env, tmp_path):
+    """Test templates are compiled into the bytecode cache and then loaded without compiling them again"""
+    out = StringIO()
+    call_command("precompile_templates", stdout=out)
+
+    assert "Compiled" in out.getvalue()
+    assert len(list((tmp_path / "jinja2").iterdir())) >= 10
+
+    jinja_env.cache.clear()
+    with patch.object(jinja_env, "compile", wraps=jinja_env.compile) as mock_compile:
+        jinja_env.get_template("weekly_schedule.html")
+        jinja_env.get_template("base_internal.html")
+    mock_compile.assert_not_called()
+
+
+def test_precompile_templates_needs_bytecode_cache(monkeypatch):
+    """Test the command fails if there's no bytecode cache to fill"""
+    monkeypatch.setattr(engines["jinja2"].env, "bytecode_cache", None)
+    with pytest.raises(CommandError, match="JINJA2_BYTECODE_CACHE_DIR"):
+        call_command("precompile_templates")
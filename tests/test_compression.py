@@ -0,0 +1,124 @@
+import gzip
+import re
+from datetime import time
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.template import engines
+from django.urls import reverse
+
+from cayuman.compression import deflate
+from cayuman.compression import deflate_fragment
+from cayuman.compression import gzip_with_fragments
+from cayuman.models import Schedule
+from cayuman.models import Workshop
+from cayuman.models import WorkshopPeriod
+
+CONTENT = b"<html><body>" + b"<p>header</p>" * 30 + b"<table>cached</table>" * 40 + b"<p>footer</p>" * 30 + b"</body></html>"
+FRAGMENT = b"<table>cached</table>" * 40
+
+
+@pytest.fixture
+def workshop_period(create_period, create_teacher):
+    schedule = Schedule.objects.create(day="monday", time_start=time(10, 15), time_end=time(11, 15))
+    wp = WorkshopPeriod.objects.create(
+        workshop=Workshop.objects.create(name="Comics", description="Drawing stories " * 20), period=create_period, teacher=create_teacher
+    )
+    wp.schedules.add(schedule)
+    return wp
+
+
+@pytest.mark.parametrize(
+    "fragments",
+    [
+        [],
+        [(FRAGMENT, deflate(FRAGMENT))],
+        # missing fragments are ignored
+        [(b"<missing/>", b"garbage"), (FRAGMENT, deflate(FRAGMENT))],
+        # overlapping fragments are compressed along with the rest
+        [(FRAGMENT, deflate(FRAGMENT)), (FRAGMENT[:10], b"garbage")],
+        # fragment at the very end
+        [(FRAGMENT + b"<p>footer</p>" * 30 + b"</body></html>", deflate(FRAGMENT + b"<p>footer</p>" * 30 + b"</body></html>"))],
+    ],
+)
+@pytest.mark.parametrize("max_random_bytes", [None, 100])
+def test_gzip_with_fragments(fragments, max_random_bytes):
+    """Test gzipped content with spliced fragments decompresses to the original content"""
+    compressed = gzip_with_fragments(CONTENT, fragments, max_random_bytes=max_random_bytes)
+    assert gzip.decompress(compressed) == CONTENT
+    assert len(compressed) < len(CONTENT)
+
+
+def _html(response):
+    content = gzip.decompress(response.content) if response.get("Content-Encoding") == "gzip" else response.content
+    # csrf tokens are masked differently on every render
+    return re.sub(rb"""name=["']csrfmiddlewaretoken["'] value=["'][^"']+["']""", b"", content)
+
+
+@pytest.mark.django_db
+def test_workshop_period_body_compressed_once(client_authenticated_student, workshop_period):
+    """Test the cached workshop period body is compressed on cache fill only, and responses decompress to the page"""
+    url = reverse("workshop_period", args=[workshop_period.id])
+    plain = client_authenticated_student.get(url)
+    assert "Content-Encoding" not in plain
+
+    with patch("cayuman.views.deflate_fragment", wraps=deflate_fragment) as mock_deflate:
+        first = client_authenticated_student.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        second = client_authenticated_student.get(url, HTTP_ACCEPT_ENCODING="gzip")
+    mock_deflate.assert_not_called()
+
+    for response in (first, second):
+        assert response["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response["Vary"]
+        assert len(response.wsgi_request.compressed_fragments) == 1
+        assert _html(response) == _html(plain)
+
+
+@pytest.mark.django_db
+def test_cached_timetable_spliced(workshop_period, rf):
+    """Test cached timetables hand their compressed copy to the current response, on cache fills and hits alike"""
+    template = engines["jinja2"].from_string(
+        '<p>{{ "header" * 50 }}</p>{% timetable workshop_periods, cache="test" %}{{ workshop_period.workshop.name }}{% endtimetable %}'
+    )
+    for _ in range(2):
+        request = rf.get("/")
+        with patch("cayuman.middleware.get_current_request", return_value=request):
+            content = template.render({"workshop_periods": [workshop_period]}).encode()
+
+        [(raw, _deflated)] = request.compressed_fragments
+        assert b"Comics" in raw
+        assert gzip.decompress(gzip_with_fragments(content, request.compressed_fragments)) == content
+
+
+@pytest.mark.django_db
+def test_admin_cycle_timetable_gzipped(client_authenticated_superuser, workshop_period, create_cycles, create_period):
+    """Test the admin cycle timetable, rendered on every view, is gzipped whole"""
+    workshop_period.cycles.add(create_cycles[0])
+    url = reverse("admin:cayuman_cycle_timetable", args=[create_cycles[0].id, create_period.id])
+    plain = client_authenticated_superuser.get(url)
+    response = client_authenticated_superuser.get(url, HTTP_ACCEPT_ENCODING="gzip")
+
+    assert response["Content-Encoding"] == "gzip"
+    assert _html(response) == _html(plain)
+
+
+@pytest.mark.django_db
+def test_only_html_and_json_compressed(client, settings, tmp_path):
+    """Test other content types are left alone"""
+    settings.STATIC_ROOT = tmp_path
+    settings.SERVE_STATIC = True
+    (tmp_path / "site.css").write_text("body { color: #333; }\n" * 100)
+    response = client.get("/static/site.css", HTTP_ACCEPT_ENCODING="gzip")
+    assert "Content-Encoding" not in response
+
+
+@pytest.mark.django_db
+def test_benchmark_compression_command(create_superuser, workshop_period, create_cycles):
+    """Test the compression benchmark command runs"""
+    workshop_period.cycles.add(create_cycles[0])
+    out = StringIO()
+    call_command("benchmark_compression", iterations=1, stdout=out)
+    assert "gzip with cached fragments" in out.getvalue()
+    assert "1 cached fragments" in out.getvalue()
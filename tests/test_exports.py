@@ -0,0 +1,134 @@
+import csv
+import zipfile
+from io import BytesIO
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.utils.text import slugify
+
+from cayuman.exports import CHUNK_SIZE
+from cayuman.exports import Column
+from cayuman.exports import column_rows
+from cayuman.exports import stream_csv
+from cayuman.models import Member
+from cayuman.models import Schedule
+from cayuman.models import StudentCycle
+from cayuman.models import WorkshopPeriod
+from cayuman.routers import ReplicaRouter
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def workshop_periods(create_period, create_teacher, create_workshops, create_cycles):
+    """A workshop period on every cycle and another one on none"""
+    on_all = WorkshopPeriod.objects.create(workshop=create_workshops[0], period=create_period, teacher=create_teacher)
+    on_all.cycles.add(*create_cycles)
+    on_all.schedules.add(Schedule.objects.create(day="monday", time_start="10:15", time_end="11:15"))
+    on_none = WorkshopPeriod.objects.create(workshop=create_workshops[1], period=create_period, teacher=create_teacher)
+    return [on_all, on_none]
+
+
+def test_column_rows(workshop_periods, create_cycles, django_assert_num_queries):
+    """Test rows are read in one query, merging to-many values of each entry"""
+    columns = [
+        Column("Workshop", "workshop__name"),
+        Column("Cycles", "cycles__name", many=True),
+        Column("Days", "schedules__day", many=True, transform=str.upper),
+    ]
+    with django_assert_num_queries(1):
+        rows = list(column_rows(WorkshopPeriod.objects.order_by("-workshop__name"), columns))
+
+    by_workshop = {row[0]: row[1:] for row in rows}
+    on_all, on_none = (by_workshop[wp.workshop.name] for wp in workshop_periods)
+    assert sorted(on_all[0].split(", ")) == sorted(cycle.name for cycle in create_cycles)
+    assert on_all[1] == "MONDAY"
+    assert on_none == ["", ""]
+    assert [row[0] for row in rows] == sorted((wp.workshop.name for wp in workshop_periods), reverse=True)
+
+
+def test_stream_csv_chunks():
+    """Test rows are sent in chunks as they're produced"""
+    rows = ([i, f"row {i}"] for i in range(CHUNK_SIZE + 1))
+    response = stream_csv("test", ["id", "name"], rows)
+    chunks = [chunk.decode() for chunk in response.streaming_content]
+
+    assert response["Content-Disposition"] == "attachment; filename=test.csv"
+    assert len(chunks) == 3
+    assert list(csv.reader("".join(chunks).splitlines()))[-1] == [str(CHUNK_SIZE), f"row {CHUNK_SIZE}"]
+
+
+def test_stream_csv_reads_from_replica():
+    """Test rows are produced inside a replica block, as they're read after the view returns"""
+    router = ReplicaRouter()
+
+    def rows():
+        yield [router.db_for_read(WorkshopPeriod)]
+
+    with patch("cayuman.routers.replica_enabled", return_value=True):
+        content = stream_csv("test", ["db"], rows()).getvalue().decode()
+
+    assert content.splitlines()[1] == settings.REPLICA_DATABASE
+
+
+def test_benchmark_export_command(create_period):
+    """Test the export benchmark command runs and leaves no rows behind"""
+    out = StringIO()
+    call_command("benchmark_export", rows=5, stdout=out)
+    assert "5 student cycles" in out.getvalue()
+    assert "values() columns" in out.getvalue()
+    assert not StudentCycle.objects.exists()
+
+
+def _rosters(response):
+    archive = zipfile.ZipFile(BytesIO(response.getvalue()))
+    return {name: list(csv.reader(archive.read(name).decode().splitlines())) for name in archive.namelist()}
+
+
+def test_export_rosters_action(client_authenticated_superuser, workshop_periods, create_period, create_cycles, enroll_students):
+    """Test rosters are streamed in a ZIP with a CSV per workshop period, in the same queries whatever the number of students"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.urls import reverse
+
+    on_all, on_none = workshop_periods
+    url = reverse("admin:cayuman_period_changelist")
+    data = {"action": "export_rosters", "_selected_action": [str(create_period.id)]}
+
+    def export():
+        client_authenticated_superuser.post(url, data).getvalue()  # warm up per process caches
+        with CaptureQueriesContext(connection) as queries:
+            response = client_authenticated_superuser.post(url, data)
+            rosters = _rosters(response)
+        assert response.streaming
+        assert response["Content-Type"] == "application/zip"
+        return len(queries), rosters
+
+    enroll_students(2, create_cycles[0], [on_all])
+    few, _ = export()
+    enroll_students(20, create_cycles[1], [on_all])
+    many, rosters = export()
+
+    assert many == few
+    period = slugify(create_period.name)
+    roster = rosters[f"{period}/{slugify(on_all.workshop.name)}-{on_all.id}.csv"]
+    assert roster[0] == ["Student", "Cycle", "Schedules"]
+    assert [row[0] for row in roster[1:]] == [f"Student{i:03} Test" for i in range(Member.objects.count() - 22, Member.objects.count())]
+    assert {row[1] for row in roster[1:]} == {create_cycles[0].name, create_cycles[1].name}
+    assert all(row[2] == str(on_all.schedules.get()) for row in roster[1:])
+    assert rosters[f"{period}/{slugify(on_none.workshop.name)}-{on_none.id}.csv"] == [["Student", "Cycle", "Schedules"]]
+
+
+def test_export_rosters_command(workshop_periods, create_period, create_cycles, tmp_path, enroll_students):
+    """Test the rosters command writes the same bundle to a file"""
+    on_all, _on_none = workshop_periods
+    enroll_students(3, create_cycles[0], [on_all])
+    output = tmp_path / "rosters.zip"
+    call_command("export_rosters", period=create_period.id, output=str(output), stdout=StringIO())
+
+    archive = zipfile.ZipFile(output)
+    assert len(archive.namelist()) == 2
+    assert archive.read(f"{slugify(create_period.name)}/{slugify(on_all.workshop.name)}-{on_all.id}.csv").decode().count("\n") == 4
@@ -163,3 +163,58 @@ def test_get_studentcycle_for_date_or_none(create_student, create_period, create
     # Test getting studentcycle for date not in any period
     future_date = period.date_end + timezone.timedelta(days=1)
     assert student.get_studentcycle_for_date_or_none(future_date) is None
+
+
+@pytest.fixture
+def many_members(create_groups, create_cycles):
+    """100 members: students with and without a cycle, teachers and members with no role"""
+    from django.contrib.auth.hashers import make_password
+    from cayuman.models import Member
+
+    student_group, teacher_group = create_groups
+    password = make_password("12345")
+    members = Member.objects.bulk_create(Member(username=f"{i:08}", password=password, first_name=f"Member{i}", last_name="Test") for i in range(100))
+    for i, member in enumerate(members):
+        if i % 4 in (0, 1):
+            member.groups.add(student_group)
+        elif i % 4 == 2:
+            member.groups.add(teacher_group)
+    for member in members[::4]:
+        StudentCycle.objects.create(student=member, cycle=create_cycles[0])
+        StudentCycle.objects.create(student=member, cycle=create_cycles[1])
+    return members
+
+
+def test_annotated_roles_and_cycle(many_members, django_assert_num_queries):
+    """Test annotated members tell their roles and current cycle without querying"""
+    from cayuman.models import Member
+
+    with django_assert_num_queries(1):
+        annotated = {m.id: m for m in Member.objects.with_roles().with_current_cycle_name()}
+        for member in many_members:
+            assert annotated[member.id].is_student is (int(member.username) % 4 in (0, 1))
+            assert annotated[member.id].is_teacher is (int(member.username) % 4 == 2)
+
+    for member in many_members:
+        current = member.current_student_cycle
+        assert annotated[member.id].current_cycle_name == (current.cycle.name if current else None)
+
+
+def test_admin_changelist_queries(client_authenticated_superuser, many_members, django_assert_num_queries):
+    """Test a 100 members changelist page runs a fixed number of queries"""
+    from unittest.mock import patch
+    from django.contrib import admin
+    from django.urls import reverse
+    from cayuman.models import Member
+
+    url = reverse("admin:cayuman_member_changelist")
+    with patch.object(admin.site._registry[Member], "list_per_page", 100):
+        client_authenticated_superuser.get(url)  # warm up per process caches
+        # session, user, member, count (the full count is skipped), page and the groups filter
+        with django_assert_num_queries(6):
+            response = client_authenticated_superuser.get(url)
+
+    assert response.status_code == 200
+    assert len(response.context["cl"].result_list) == 100
+    content = response.content.decode()
+    assert content.count("Avellanos") == 0 and content.count("Ulmos") == 25
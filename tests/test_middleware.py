@@ -2,10 +2,13 @@ from unittest.mock import Mock
 from unittest.mock import patch
 
 import pytest
+from django.contrib import messages
 from django.core.exceptions import ObjectDoesNotExist
 from django.http import Http404
 from django.urls import Resolver404
 
+from cayuman.middleware import has_message
+
 pytestmark = pytest.mark.django_db
 
 
@@ -140,3 +143,29 @@ def test_failed_impersonation_cleanup(middleware, mock_request, create_student,
     assert mock_request.member.is_impersonate is False
     assert not hasattr(mock_request.member, "impersonator")
     assert mock_request.impersonator is None
+
+
+def test_period_warning_does_not_consume_messages(middleware, mock_request, create_student, create_period):
+    """
+    Test the warning for a past period is added only once and checking for it doesn't mark the message storage as used.
+    A used storage gets rewritten on every response, which with session based storages means a write per page view.
+    """
+    mock_request.user = Mock(id=create_student.id, is_authenticated=True, is_active=True, is_impersonate=False)
+
+    middleware(mock_request)
+    middleware(mock_request)
+
+    storage = mock_request._messages
+    assert storage.used is False
+    assert len(storage) == 1
+    assert "has already ended" in str(list(storage)[0])
+
+
+def test_has_message(mock_request):
+    """Test `has_message` finds queued messages by level and text without consuming them"""
+    messages.info(mock_request, "Hello")
+
+    assert has_message(mock_request, messages.INFO, "Hello")
+    assert not has_message(mock_request, messages.WARNING, "Hello")
+    assert not has_message(mock_request, messages.INFO, "Bye")
+    assert mock_request._messages.used is False
@@ -0,0 +1,120 @@
+from datetime import date
+from datetime import datetime
+from datetime import time
+from functools import partial
+
+import pytest
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from cayuman.models import Period
+from cayuman.models import Schedule
+from cayuman.models import StudentCycle
+from cayuman.models import WorkshopPeriod
+from cayuman.occupancy import compute_occupancy
+from cayuman.occupancy import get_occupancy
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def offering(create_period, create_teacher, create_workshops, create_cycles):
+    """
+    Two schedules: on the first one a workshop period for the first cycle limited to 2 students, on the second one an
+    unlimited workshop period for the first two cycles
+    """
+    schedules = [Schedule.objects.create(day=day, time_start=time(10, 15), time_end=time(11, 15)) for day in ("monday", "tuesday")]
+    limited = WorkshopPeriod.objects.create(workshop=create_workshops[0], period=create_period, teacher=create_teacher, max_students=2)
+    limited.cycles.add(create_cycles[0])
+    limited.schedules.add(schedules[0])
+    unlimited = WorkshopPeriod.objects.create(workshop=create_workshops[1], period=create_period, teacher=create_teacher)
+    unlimited.cycles.add(create_cycles[0], create_cycles[1])
+    unlimited.schedules.add(schedules[1])
+    return limited, unlimited
+
+
+@pytest.fixture
+def enroll(enroll_students, create_period):
+    """Enrolls students who joined when the period started"""
+    return partial(enroll_students, date_joined=create_period.date_start)
+
+
+def test_occupancy(offering, create_period, create_cycles, enroll):
+    """Test seats, incomplete students and overflowed workshop periods"""
+    limited, unlimited = offering
+    enroll(1, create_cycles[0], [limited, unlimited])
+    enroll(1, create_cycles[0], [limited])
+    enroll(2, create_cycles[1], [unlimited])
+    # quotas are enforced on enrollment, so overflow by lowering it afterwards
+    limited.max_students = 1
+    limited.save()
+
+    occupancy = compute_occupancy(create_period)
+
+    assert occupancy.cycles == [cycle.name for cycle in create_cycles]
+    (_, first_row), (_, second_row) = occupancy.rows
+    assert (first_row[0].enrolled, first_row[0].capacity, first_row[0].remaining, first_row[0].heat) == (2, 1, 0, 4)
+    assert first_row[1] is None and first_row[2] is None
+    assert (second_row[0].enrolled, second_row[0].unlimited, second_row[0].remaining, second_row[0].heat) == (1, True, None, None)
+    assert second_row[1].enrolled == 2
+    assert occupancy.incomplete == [(create_cycles[0].name, 1, 2), (create_cycles[1].name, 2, 2)]
+    assert occupancy.overflowed == [(limited.workshop.name, 2, 1)]
+
+
+def test_occupancy_student_cycle_of_the_period(offering, create_period, create_cycles, create_teacher, create_workshops, enroll):
+    """Test students are counted in the cycle they were in during each period, not in their latest one"""
+    limited, unlimited = offering
+    enroll(2, create_cycles[0], [limited, unlimited])
+    next_period = Period.objects.create(
+        name="Period 2",
+        date_start=date(2024, 3, 1),
+        date_end=date(2024, 12, 31),
+        enrollment_start=timezone.make_aware(datetime(2024, 2, 20)),
+        enrollment_end=date(2024, 2, 27),
+    )
+    next_wp = WorkshopPeriod.objects.create(workshop=create_workshops[2], period=next_period, teacher=create_teacher)
+    next_wp.cycles.add(create_cycles[1])
+    next_wp.schedules.add(*Schedule.objects.all())
+    # students moved up a cycle for the next period
+    for student_cycle in StudentCycle.objects.all():
+        StudentCycle.objects.create(student=student_cycle.student, cycle=create_cycles[1])
+    StudentCycle.objects.filter(cycle=create_cycles[1]).update(date_joined=next_period.date_start)
+
+    assert compute_occupancy(create_period).incomplete == [(create_cycles[0].name, 0, 2)]
+    assert compute_occupancy(next_period).incomplete == [(create_cycles[1].name, 2, 2)]
+
+
+def test_occupancy_queries(offering, create_period, create_cycles, django_assert_num_queries, enroll):
+    """Test occupancy is computed in the same few queries whatever the number of students, and then read from cache"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    limited, unlimited = offering
+    enroll(2, create_cycles[0], [unlimited])
+    with CaptureQueriesContext(connection) as few:
+        compute_occupancy(create_period)
+    enroll(20, create_cycles[1], [unlimited])
+    with CaptureQueriesContext(connection) as many:
+        occupancy = compute_occupancy(create_period)
+
+    assert len(many) == len(few) <= 6
+    assert occupancy.rows[1][1][1].enrolled == 20
+
+    get_occupancy(create_period)
+    with django_assert_num_queries(0):
+        get_occupancy(create_period)
+
+
+def test_admin_occupancy_view(client_authenticated_superuser, offering, create_period, create_cycles, enroll):
+    """Test the dashboard is linked from the periods changelist and renders"""
+    limited, _unlimited = offering
+    enroll(1, create_cycles[0], [limited])
+    url = reverse("admin:cayuman_period_occupancy", args=[create_period.id])
+    assert url in client_authenticated_superuser.get(reverse("admin:cayuman_period_changelist")).content.decode()
+
+    response = client_authenticated_superuser.get(url)
+    content = response.content.decode()
+    assert response.status_code == 200
+    assert "1 / 2" in content and "1 seat left" in content
+    assert f'content="{settings.OCCUPANCY_CACHE_TIMEOUT}"' in content
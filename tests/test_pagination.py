@@ -0,0 +1,63 @@
+import base64
+
+import pytest
+from django.contrib.auth.hashers import make_password
+
+from cayuman.models import Member
+from cayuman.pagination import encode_cursor
+from cayuman.pagination import keyset_page
+
+pytestmark = pytest.mark.django_db
+
+KEYS = ("last_name", "id")
+
+
+@pytest.fixture
+def members():
+    """25 members sharing 5 last names, created out of last name order"""
+    password = make_password("12345")
+    Member.objects.bulk_create(Member(username=f"{i:08}", password=password, last_name=f"Name{4 - i % 5}") for i in range(25))
+    return list(Member.objects.order_by(*KEYS))
+
+
+def test_keyset_pages(members, django_assert_num_queries):
+    """Test pages follow each other in key order, ties included, each in a single query without OFFSET"""
+    seen, cursor = [], None
+    while True:
+        with django_assert_num_queries(1) as queries:
+            page = keyset_page(Member.objects.all(), KEYS, cursor, 10)
+        assert "OFFSET" not in queries.captured_queries[0]["sql"]
+        assert page.is_first is (cursor is None)
+        seen.extend(page.object_list)
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+
+    assert seen == members
+    assert len(page.object_list) == 5
+
+
+def test_keyset_page_exact_fit(members):
+    """Test there's no next page when the last one is exactly full"""
+    page = keyset_page(Member.objects.all(), KEYS, encode_cursor([members[14].last_name, members[14].id]), 10)
+    assert page.object_list == members[15:]
+    assert page.next_cursor is None
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "garbage",
+        encode_cursor({"id": 1}),
+        encode_cursor([1]),
+        encode_cursor(["Name1", "abc"]),
+        encode_cursor(["Name1", {"id": 1}]),
+        encode_cursor(["Name1", None]),
+        base64.urlsafe_b64encode(b'{"id": 1}').decode(),
+    ],
+)
+def test_keyset_page_malformed_cursor(members, cursor):
+    """Test malformed cursors start over from the first page"""
+    page = keyset_page(Member.objects.all(), KEYS, cursor, 10)
+    assert page.is_first
+    assert page.object_list == members[:10]
@@ -0,0 +1,140 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from django.core.cache import cache
+from django.template import engines
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from cayuman import profiling as profiling_module
+from cayuman.profiling import flush
+from cayuman.profiling import get_profile
+from cayuman.profiling import PROFILE_CACHE_KEY
+from cayuman.profiling import PROFILE_GENERATION_KEY
+from cayuman.profiling import record
+from cayuman.profiling import reset_profile
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def fresh_process(monkeypatch):
+    """Starts every test with the profiling state of a freshly started process"""
+    monkeypatch.setattr(profiling_module, "_stats", {})
+    monkeypatch.setattr(profiling_module, "_last_flush", time.monotonic())
+    monkeypatch.setattr(profiling_module, "_generation", None)
+
+
+@pytest.fixture
+def profiling(settings):
+    settings.TEMPLATE_PROFILING = True
+
+
+def profiled_names():
+    return {row["name"]: row for row in get_profile()}
+
+
+def test_jinja2_renders_are_profiled(profiling):
+    """Test jinja2 renders are recorded, included and extended templates getting their own rows"""
+    engines["jinja2"].from_string('{% include "timetable_template.html" %}').render({})
+    engines["jinja2"].from_string('{% include "timetable_template.html" %}').render({})
+    engines["jinja2"].get_template("timetable_template.html").render({})
+    engines["jinja2"].from_string('{% extends "timetable_template.html" %}').render({})
+
+    names = profiled_names()
+    assert names["jinja2:<string>"]["count"] == 3
+    assert names["jinja2:timetable_template.html"]["count"] == 4
+
+
+def test_django_renders_are_profiled(profiling):
+    """Test Django template renders are recorded, included templates getting their own rows"""
+    render_to_string("admin/periods_dropdown.html", {"periods": []})
+    engines["django"].from_string('{% include "admin/periods_dropdown.html" %}').render({"periods": []})
+
+    names = profiled_names()
+    assert names["django:admin/periods_dropdown.html"]["count"] == 2
+    assert names["django:<string>"]["count"] == 1
+
+
+def test_timetable_renders_are_profiled(profiling, create_schedule):
+    """Test the timetable tag is recorded on its own, by cache name"""
+    engines["jinja2"].from_string('{% timetable [], cache="test" %}{% endtimetable %}').render({})
+    names = profiled_names()
+    assert names["timetable:test"]["count"] == 1
+    assert names["jinja2:<string>"]["count"] == 1
+    assert names["jinja2:timetable_template.html"]["count"] == 1
+
+
+def test_nothing_recorded_when_disabled(settings):
+    """Test profiling is opt-in"""
+    settings.TEMPLATE_PROFILING = False
+    engines["jinja2"].from_string("hello").render({})
+    render_to_string("admin/periods_dropdown.html", {"periods": []})
+    assert get_profile() == []
+
+
+def test_profile_stats():
+    """Test stats are aggregated with percentiles, slowest templates first, and can be reset"""
+    for ms in range(1, 101):
+        record("slow.html", ms / 1000)
+    record("fast.html", 0.001)
+
+    rows = get_profile()
+    assert [row["name"] for row in rows] == ["slow.html", "fast.html"]
+    assert rows[0]["count"] == 100
+    assert rows[0]["total"] == pytest.approx(5050)
+    assert rows[0]["p50"] == pytest.approx(50.5)
+    assert rows[0]["p95"] == pytest.approx(95.05)
+    assert rows[0]["max"] == pytest.approx(100)
+    assert rows[1]["p95"] == pytest.approx(1)
+
+    reset_profile()
+    assert get_profile() == []
+
+
+def test_stats_flushed_periodically(profiling):
+    """Test stats are kept in process memory and merged into the shared ones in the cache every `FLUSH_INTERVAL`"""
+    with patch("cayuman.profiling.FLUSH_INTERVAL", 60), patch("cayuman.profiling.cache") as mock_cache:
+        for _ in range(10):
+            render_to_string("admin/periods_dropdown.html", {"periods": []})
+    mock_cache.get.assert_not_called()
+    mock_cache.set.assert_not_called()
+
+    with patch("cayuman.profiling.FLUSH_INTERVAL", 0):
+        record("admin/periods_dropdown.html", 0.001)
+    assert cache.get(PROFILE_CACHE_KEY)["django:admin/periods_dropdown.html"]["count"] == 10
+
+
+def test_reset_by_another_worker_drops_unflushed_stats(profiling):
+    """Test stats recorded before another worker reset the profile are dropped, and later ones kept"""
+    record("weekly_schedule.html", 0.01)
+    flush()
+    record("weekly_schedule.html", 0.01)
+
+    # another worker resets the profile
+    cache.delete(PROFILE_CACHE_KEY)
+    cache.set(PROFILE_GENERATION_KEY, 1, None)
+
+    assert get_profile() == []
+    record("weekly_schedule.html", 0.01)
+    assert [row["count"] for row in get_profile()] == [1]
+
+
+def test_template_profile_page(profiling, client_authenticated_superuser):
+    """Test superusers can see and reset the profile"""
+    url = reverse("template_profile")
+    record("weekly_schedule.html", 0.01)
+
+    response = client_authenticated_superuser.get(url)
+    assert response.status_code == 200
+    assert "weekly_schedule.html" in response.content.decode()
+
+    response = client_authenticated_superuser.post(url)
+    assert response.status_code == 302
+    assert "weekly_schedule.html" not in profiled_names()
+
+
+def test_template_profile_page_superuser_only(client_authenticated_staff):
+    """Test staff members who are not superusers can't see the profile"""
+    assert client_authenticated_staff.get(reverse("template_profile")).status_code == 403
@@ -0,0 +1,123 @@
+import time
+from datetime import date
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from cayuman import routers
+from cayuman.decorators import read_only_view
+from cayuman.models import Period
+from cayuman.models import Workshop
+from cayuman.routers import is_sticky
+from cayuman.routers import ReplicaRouter
+from cayuman.routers import stick_to_primary
+from cayuman.routers import STICKY_SESSION_KEY
+from cayuman.routers import use_replica
+
+pytestmark = pytest.mark.django_db
+
+# `single_database` fixture patches this one, keep a reference to the real thing
+real_replica_enabled = routers.replica_enabled
+
+
+@pytest.fixture
+def replica_enabled():
+    """Pretend a replica database is configured"""
+    with patch("cayuman.routers.replica_enabled", return_value=True):
+        yield
+
+
+@pytest.fixture
+def routed_view():
+    """A read only view reporting which database its reads are routed to"""
+
+    @read_only_view
+    def view(request):
+        return HttpResponse(ReplicaRouter().db_for_read(Period) or "default")
+
+    return view
+
+
+def test_reads_go_to_default_outside_replica_block(replica_enabled):
+    """Test reads are not routed anywhere unless inside `use_replica`"""
+    router = ReplicaRouter()
+    assert router.db_for_read(Period) is None
+
+    with use_replica():
+        assert router.db_for_read(Period) == settings.REPLICA_DATABASE
+        # writes always go to default
+        assert router.db_for_write(Period) == "default"
+
+    assert router.db_for_read(Period) is None
+
+
+def test_reads_go_to_default_without_replica(settings):
+    """Test `use_replica` is harmless when no replica is configured"""
+    settings.REPLICA_DATABASE = "missing"
+    with patch("cayuman.routers.replica_enabled", real_replica_enabled), use_replica():
+        assert ReplicaRouter().db_for_read(Period) is None
+
+
+def test_read_only_view_uses_replica(replica_enabled, routed_view, mock_request):
+    """Test views marked as read only send their reads to the replica"""
+    assert routed_view(mock_request).content.decode() == settings.REPLICA_DATABASE
+
+
+def test_read_only_view_sticks_to_primary_after_write(replica_enabled, routed_view, mock_request):
+    """Test members keep reading from default for a few seconds after saving something"""
+    stick_to_primary(mock_request)
+    assert is_sticky(mock_request)
+    assert routed_view(mock_request).content.decode() == "default"
+
+    # stickiness expires
+    mock_request.session[STICKY_SESSION_KEY] = time.time() - 1
+    assert not is_sticky(mock_request)
+    assert routed_view(mock_request).content.decode() == settings.REPLICA_DATABASE
+
+
+def test_stick_to_primary_without_replica(mock_request):
+    """Test no session data is written when there's no replica"""
+    stick_to_primary(mock_request)
+    assert STICKY_SESSION_KEY not in mock_request.session
+
+
+def _period(name, year, using="default"):
+    return Period.objects.using(using).create(
+        name=name,
+        date_start=date(year, 3, 1),
+        date_end=date(year, 7, 31),
+        enrollment_start=timezone.make_aware(datetime(year, 2, 20)),
+        enrollment_end=date(year, 2, 27),
+    )
+
+
+@pytest.mark.django_db(databases=["default", settings.REPLICA_DATABASE])
+def test_read_only_view_reads_from_replica_database(mock_request):
+    """Test reads in read only views run on the replica connection, and writes on the default one"""
+    _period("Primary", 2023)
+    _period("Replica", 2024, using=settings.REPLICA_DATABASE)
+
+    @read_only_view
+    def view(request):
+        names = list(Period.objects.order_by("name").values_list("name", flat=True))
+        Workshop.objects.create(name="Written")
+        return HttpResponse(",".join(names))
+
+    with patch("cayuman.routers.replica_enabled", real_replica_enabled):
+        with CaptureQueriesContext(connections["default"]) as default, CaptureQueriesContext(connections[settings.REPLICA_DATABASE]) as replica:
+            assert view(mock_request).content.decode() == "Replica"
+        assert any(query["sql"].startswith("SELECT") for query in replica.captured_queries)
+        assert not any(query["sql"].startswith("INSERT") for query in replica.captured_queries)
+        assert any(query["sql"].startswith("INSERT") for query in default.captured_queries)
+        assert Workshop.objects.filter(name="Written").exists()
+        assert not Workshop.objects.using(settings.REPLICA_DATABASE).exists()
+
+        # after saving something, the member reads their own writes from default
+        stick_to_primary(mock_request)
+        assert view(mock_request).content.decode() == "Primary"
@@ -0,0 +1,88 @@
+import gzip
+import os
+from io import StringIO
+
+import pytest
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+
+CSS = "body { color: #333; }\n" * 100
+
+
+@pytest.fixture
+def collected(settings, tmp_path):
+    """Collects a single css file with the production storage"""
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "site.css").write_text(CSS)
+    (source / "tiny.js").write_text("x")
+    settings.STATICFILES_DIRS = [source]
+    settings.STATIC_ROOT = tmp_path / "static"
+    settings.STORAGES = {**settings.STORAGES, "staticfiles": {"BACKEND": "cayuman.storage.CompressedManifestStaticFilesStorage"}}
+    settings.STATICFILES_FINDERS = ["django.contrib.staticfiles.finders.FileSystemFinder"]
+    settings.SERVE_STATIC = True
+    call_command("collectstatic", interactive=False, verbosity=0, stdout=StringIO())
+    return settings.STATIC_ROOT
+
+
+def test_collectstatic_writes_hashed_gzipped_files(collected):
+    """Test hashed names are used and compressible files get a gzipped copy"""
+    hashed = staticfiles_storage.stored_name("site.css")
+    assert hashed != "site.css"
+    for name in ("site.css", hashed):
+        assert gzip.decompress((collected / f"{name}.gz").read_bytes()).decode() == CSS
+    # too small to be worth it
+    assert not (collected / "tiny.js.gz").exists()
+
+
+def test_serves_gzipped_hashed_file(client, collected):
+    """Test hashed files are served gzipped to clients accepting it, and cached forever"""
+    url = staticfiles_storage.url("site.css")
+    response = client.get(url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+
+    assert response.status_code == 200
+    assert response["Content-Encoding"] == "gzip"
+    assert response["Content-Type"] == "text/css"
+    assert "immutable" in response["Cache-Control"] and "max-age=31536000" in response["Cache-Control"]
+    assert response["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(b"".join(response.streaming_content)).decode() == CSS
+
+    response = client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"], HTTP_ACCEPT_ENCODING="gzip")
+    assert response.status_code == 304
+
+
+def test_hashed_names_reloaded_with_manifest(client, collected, settings):
+    """Test files hashed by a later `collectstatic` are cached forever too, without restarting"""
+    assert "immutable" in client.get(staticfiles_storage.url("site.css"))["Cache-Control"]
+
+    (settings.STATICFILES_DIRS[0] / "site.css").write_text(CSS + "p { margin: 0; }\n")
+    call_command("collectstatic", interactive=False, verbosity=0, stdout=StringIO())
+    manifest = collected / staticfiles_storage.manifest_name
+    os.utime(manifest, (manifest.stat().st_atime, manifest.stat().st_mtime + 1))
+
+    url = staticfiles_storage.url("site.css")
+    assert "immutable" in client.get(url)["Cache-Control"]
+
+
+def test_serves_plain_unhashed_file(client, collected):
+    """Test clients not accepting gzip get the plain file, and unhashed names are not cached for long"""
+    response = client.get("/static/site.css")
+
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response
+    assert b"".join(response.streaming_content).decode() == CSS
+    assert "immutable" not in response["Cache-Control"]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("path", ["/static/missing.css", "/static/../source/site.css", "/static/%2e%2e/source/site.css"])
+def test_does_not_serve_outside_static_root(client, collected, path):
+    """Test only existing files inside STATIC_ROOT are served"""
+    assert client.get(path).status_code == 404
+
+
+@pytest.mark.django_db
+def test_disabled(client, collected, settings):
+    """Test nothing is served unless enabled"""
+    settings.SERVE_STATIC = False
+    assert client.get("/static/site.css").status_code == 404
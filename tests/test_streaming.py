@@ -0,0 +1,115 @@
+import re
+from datetime import time
+
+import pytest
+from django.contrib.auth.hashers import make_password
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+
+from cayuman.models import Member
+from cayuman.models import Schedule
+from cayuman.models import StudentCycle
+from cayuman.models import Workshop
+from cayuman.models import WorkshopPeriod
+from cayuman.pagination import COUNT_VAR
+from cayuman.pagination import CURSOR_VAR
+from cayuman.pagination import encode_cursor
+from cayuman.streaming import render_rows
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def roster(create_period, create_teacher, create_cycles):
+    """A workshop period with 150 students, more than a page"""
+    schedule = Schedule.objects.create(day="monday", time_start=time(10, 15), time_end=time(11, 15))
+    wp = WorkshopPeriod.objects.create(workshop=Workshop.objects.create(name="Comics"), period=create_period, teacher=create_teacher)
+    wp.schedules.add(schedule)
+    wp.cycles.add(create_cycles[0])
+    password = make_password("12345")
+    students = Member.objects.bulk_create(
+        Member(username=f"{i:08}", password=password, first_name=f"Student{i:03}", last_name="Test") for i in range(150)
+    )
+    student_cycles = StudentCycle.objects.bulk_create(
+        StudentCycle(student=student, cycle=create_cycles[0], date_joined=create_period.date_start) for student in students
+    )
+    for student_cycle in student_cycles:
+        student_cycle.workshop_periods.add(wp)
+    return wp
+
+
+def _get(client, url, settings, stream):
+    settings.STREAM_ADMIN_PAGES = stream
+    response = client.get(url)
+    assert response.status_code == 200
+    assert isinstance(response, StreamingHttpResponse) is stream
+    content = b"".join(response.streaming_content) if stream else response.content
+    # csrf tokens are masked differently on every render
+    return re.sub(rb'name="csrfmiddlewaretoken" value="[^"]+"', b"", content).decode()
+
+
+@pytest.mark.parametrize("query", ["", "next", "?all"])
+def test_workshop_period_students_streamed(client_authenticated_superuser, roster, settings, query):
+    """Test the streamed roster is the same as the buffered one"""
+    if query == "next":
+        last = StudentCycle.objects.order_by("student__last_name", "id")[99]
+        query = f"?{CURSOR_VAR}={encode_cursor([last.student.last_name, last.id])}"
+    url = reverse("admin:cayuman_workshopperiod_student_cycles", args=[roster.id]) + query
+    streamed = _get(client_authenticated_superuser, url, settings, stream=True)
+    buffered = _get(client_authenticated_superuser, url, settings, stream=False)
+
+    assert streamed == buffered
+    shown = {"": 100, "?all": 150}.get(query, 50)
+    assert streamed.count("<td>Student") == shown
+    assert ("Show all" in streamed) is (query != "?all")
+
+
+@pytest.mark.parametrize("cursor", [encode_cursor(["Test", "abc"]), encode_cursor(["Test", {"id": 1}]), "%%%"])
+def test_workshop_period_students_tampered_cursor(client_authenticated_superuser, roster, settings, cursor):
+    """Test tampered cursors show the first page instead of failing"""
+    url = reverse("admin:cayuman_workshopperiod_student_cycles", args=[roster.id]) + f"?{CURSOR_VAR}={cursor}"
+    content = _get(client_authenticated_superuser, url, settings, stream=False)
+
+    assert content.count("<td>Student") == 100
+    assert "Student000" in content
+
+
+def test_workshop_period_students_counted_once(client_authenticated_superuser, roster, settings):
+    """Test the total is counted on the first page and carried over to the next one in its link"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    url = reverse("admin:cayuman_workshopperiod_student_cycles", args=[roster.id])
+    first = _get(client_authenticated_superuser, url, settings, stream=False)
+    [next_query] = re.findall(rf'href="\?({CURSOR_VAR}=[^"]+)" class="end"', first)
+    next_query = next_query.replace("&amp;", "&")
+    assert f"{COUNT_VAR}=150" in next_query
+
+    with CaptureQueriesContext(connection) as queries:
+        second = _get(client_authenticated_superuser, url + "?" + next_query, settings, stream=False)
+    assert not any('AS "__count"' in query["sql"] for query in queries.captured_queries)
+    assert "150 entries" in second and second.count("<td>Student") == 50
+
+    # malformed counts are counted again
+    tampered = next_query.replace(f"{COUNT_VAR}=150", f"{COUNT_VAR}=abc")
+    assert "150 entries" in _get(client_authenticated_superuser, url + "?" + tampered, settings, stream=False)
+
+
+def test_cycle_timetable_streamed(client_authenticated_superuser, roster, create_cycles, create_period, settings):
+    """Test the streamed cycle timetable is the same as the buffered one"""
+    url = reverse("admin:cayuman_cycle_timetable", args=[create_cycles[0].id, create_period.id])
+    streamed = _get(client_authenticated_superuser, url, settings, stream=True)
+    buffered = _get(client_authenticated_superuser, url, settings, stream=False)
+
+    assert streamed == buffered
+    assert "Comics" in streamed and "(150)" in streamed
+
+
+def test_render_rows_is_lazy(roster):
+    """Test rows are read and rendered a chunk at a time"""
+    rows = iter(StudentCycle.objects.select_related("student", "cycle").order_by("id"))
+    chunks = render_rows("admin/workshop_period_students_rows.html", rows, chunk_size=100)
+
+    assert next(chunks).count("<tr>") == 100
+    assert next(chunks).count("<tr>") == 50
+    assert next(chunks, None) is None
@@ -0,0 +1,61 @@
+import pytest
+
+from cayuman.context import get_student_context
+from cayuman.context import StudentContext
+from cayuman.models import StudentCycle
+
+pytestmark = pytest.mark.django_db
+
+
+def test_student_context_memoizes_student_cycle(create_student, create_period, create_cycles, django_assert_num_queries):
+    """Test current student cycle is queried only once no matter how many times it's read"""
+    sc = StudentCycle.objects.create(student=create_student, cycle=create_cycles[0])
+    context = StudentContext(create_student, create_period)
+
+    with django_assert_num_queries(1):
+        for _ in range(5):
+            assert context.student_cycle == sc
+
+    with django_assert_num_queries(0):
+        assert context.student_cycle == sc
+
+
+def test_student_context_without_student_cycle(create_student, create_period):
+    """Test a student with no student cycle gets empty values instead of errors"""
+    context = StudentContext(create_student, create_period)
+    assert context.is_student
+    assert context.student_cycle is None
+    assert context.cycle is None
+    assert context.is_schedule_full is False
+    assert context.is_enabled_to_enroll is False
+    assert context.available_workshop_periods_by_schedule == {}
+
+
+def test_student_context_invalidate(create_student, create_period, create_cycles):
+    """Test `invalidate` forgets memoized values"""
+    context = StudentContext(create_student, create_period)
+    assert context.student_cycle is None
+
+    sc = StudentCycle.objects.create(student=create_student, cycle=create_cycles[0])
+    assert context.student_cycle is None
+
+    context.invalidate()
+    assert context.student_cycle == sc
+
+
+def test_get_student_context_reuses_attached_context(create_student, create_period):
+    """Test the context attached to a member is reused only for its own period"""
+    context = StudentContext(create_student, create_period)
+    create_student.student_context = context
+
+    assert get_student_context(create_student, create_period) is context
+    assert get_student_context(create_student, None) is not context
+
+
+def test_middleware_attaches_student_context(client_authenticated_student, create_period, create_cycles):
+    """Test every internal page gets a student context for request.period"""
+    response = client_authenticated_student.get("/")
+    request = response.wsgi_request
+    assert isinstance(request.student_context, StudentContext)
+    assert request.student_context.period == request.period
+    assert request.member.student_context is request.student_context
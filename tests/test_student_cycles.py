@@ -499,3 +499,147 @@ def test_studentcycle_manager_get_by_date_or_none(create_student, create_period,
     )
 
     assert StudentCycle.objects.get_studentcycle_by_date_or_none(student, past_period.date_start) is None
+
+
+@pytest.fixture
+def student_cycles_history(create_cycles):
+    """Two students who changed cycles: one on a later date, the other on the same date"""
+    group, _ = Group.objects.get_or_create(name=settings.STUDENTS_GROUP)
+    history = {}
+    for username in ("11111111", "22222222"):
+        student = Member.objects.create_user(username=username, password="12345", first_name=username, last_name="Student")
+        student.groups.add(group)
+        history[username] = [StudentCycle.objects.create(student=student, cycle=cycle) for cycle in create_cycles[:2]]
+    first = history["11111111"][0]
+    StudentCycle.objects.filter(id=first.id).update(date_joined=first.date_joined.replace(year=first.date_joined.year - 1))
+    return history
+
+
+def test_filter_current(student_cycles_history, django_assert_num_queries):
+    """Test current entries are filtered in SQL and agree with `is_current`"""
+    with django_assert_num_queries(1):
+        current = {sc.id for sc in StudentCycle.objects.filter_current()}
+    with django_assert_num_queries(1):
+        not_current = {sc.id for sc in StudentCycle.objects.filter_current(False)}
+
+    assert current == {entries[1].id for entries in student_cycles_history.values()}
+    assert not_current == {entries[0].id for entries in student_cycles_history.values()}
+    for sc in StudentCycle.objects.all():
+        assert sc.is_current() is (sc.id in current)
+
+
+def test_annotated_is_current_does_not_query(student_cycles_history, django_assert_num_queries):
+    """Test `is_current` reads the annotation when present"""
+    student_cycles = list(StudentCycle.objects.with_current())
+    with django_assert_num_queries(0):
+        assert sum(sc.is_current() for sc in student_cycles) == 2
+
+
+@pytest.mark.parametrize("status,expected", [("", 1), ("current", 1), ("not_current", 0)])
+def test_admin_status_filter(client_authenticated_superuser, create_period, student_cycles_history, status, expected):
+    """Test the admin status filter lists current entries by default"""
+    from django.urls import reverse
+
+    response = client_authenticated_superuser.get(reverse("admin:cayuman_studentcycle_changelist"), {"status": status} if status else {})
+    assert response.status_code == 200
+    shown = {sc.id for sc in response.context["cl"].result_list}
+    assert shown == {entries[expected].id for entries in student_cycles_history.values()}
+
+
+def test_admin_changelist_queries(client_authenticated_superuser, create_period, create_teacher, create_workshops, create_cycles, enroll_students):
+    """Test the student cycles changelist runs the same queries whatever the number of rows"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.urls import reverse
+
+    other_period = Period.objects.create(
+        name="Period 0",
+        date_start=timezone.make_aware(datetime(2022, 1, 1)).date(),
+        date_end=timezone.make_aware(datetime(2022, 12, 31)).date(),
+        enrollment_start=timezone.make_aware(datetime(2021, 12, 23)),
+        enrollment_end=timezone.make_aware(datetime(2021, 12, 27)).date(),
+    )
+    wp = WorkshopPeriod.objects.create(workshop=create_workshops[0], period=create_period, teacher=create_teacher)
+    wp.cycles.add(create_cycles[0])
+    wp.schedules.add(Schedule.objects.create(day="monday", time_start=time(10, 15), time_end=time(11, 15)))
+    Schedule.objects.create(day="tuesday", time_start=time(10, 15), time_end=time(11, 15))
+    url = reverse("admin:cayuman_studentcycle_changelist")
+
+    def get():
+        client_authenticated_superuser.get(url)  # warm up per process caches
+        with CaptureQueriesContext(connection) as queries:
+            response = client_authenticated_superuser.get(url)
+        assert response.status_code == 200
+        return len(queries), response
+
+    enroll_students(2, create_cycles[0], [wp])
+    few, _ = get()
+    enroll_students(18, create_cycles[0], [wp])
+    many, response = get()
+
+    assert many == few <= 15
+    content = response.content.decode()
+    assert content.count("Partial schedule (1)") == 20
+    assert "__object_id__" not in content
+    # other periods dropdown
+    for sc in response.context["cl"].result_list:
+        assert reverse("admin:cayuman_studentcycle_workshops", kwargs={"object_id": sc.id, "period_id": other_period.id}) in content
+
+
+def test_admin_csv_export(client_authenticated_superuser, create_period, create_teacher, create_workshops, create_cycles, enroll_students):
+    """Test exported student cycles are streamed with their current period workshops, in the same queries whatever their number"""
+    import csv
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.urls import reverse
+
+    wps = [WorkshopPeriod.objects.create(workshop=workshop, period=create_period, teacher=create_teacher) for workshop in create_workshops[:2]]
+    for wp in wps:
+        wp.cycles.add(create_cycles[0])
+    url = reverse("admin:cayuman_studentcycle_changelist")
+
+    def export():
+        data = {"action": "export_to_csv", "_selected_action": [str(sc_id) for sc_id in StudentCycle.objects.values_list("id", flat=True)]}
+        client_authenticated_superuser.post(url, data).getvalue()  # warm up per process caches
+        with CaptureQueriesContext(connection) as queries:
+            response = client_authenticated_superuser.post(url, data)
+            content = response.getvalue().decode()
+        assert response.streaming
+        return len(queries), list(csv.reader(content.splitlines()))
+
+    enroll_students(3, create_cycles[0], wps)
+    few, _ = export()
+    enroll_students(30, create_cycles[0], wps)
+    many, rows = export()
+
+    print("QUERIES", few, many)
+    assert many == few
+    assert len(rows) == 34
+    assert rows[0][:2] == ["Student", "Cycle"] and rows[0][3] == f"Workshops {create_period}"
+    names = f"{create_workshops[0].name}, {create_workshops[1].name}"
+    assert all(row[3] == names and row[4] == "1" for row in rows[1:])
+    assert sorted(row[0] for row in rows[1:]) == sorted(sc.student.get_full_name() for sc in StudentCycle.objects.all())
+
+
+def test_admin_workshop_periods_view(
+    enroll_students, client_authenticated_superuser, create_period, create_teacher, create_workshops, create_cycles, django_assert_max_num_queries
+):
+    """Test a student cycle's workshop periods are listed along their relations, without pagination"""
+    from django.urls import reverse
+
+    wps = []
+    for i, workshop in enumerate(create_workshops):
+        wp = WorkshopPeriod.objects.create(workshop=workshop, period=create_period, teacher=create_teacher)
+        wp.cycles.add(create_cycles[0])
+        wp.schedules.add(Schedule.objects.create(day="monday", time_start=time(8 + i, 0), time_end=time(8 + i, 30)))
+        wps.append(wp)
+    enroll_students(1, create_cycles[0], wps)
+    student_cycle = StudentCycle.objects.get()
+    url = reverse("admin:cayuman_studentcycle_workshops", kwargs={"object_id": student_cycle.id, "period_id": create_period.id})
+    client_authenticated_superuser.get(url)  # warm up per process caches
+
+    with django_assert_max_num_queries(9):
+        content = client_authenticated_superuser.get(url).content.decode()
+
+    assert all(content.count(wp.workshop.name) == 2 for wp in wps)  # list and timetable
+    assert "3 entries" in content
@@ -0,0 +1,292 @@
+from datetime import time
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.template import engines
+
+from cayuman.models import Schedule
+from cayuman.models import Workshop
+from cayuman.models import WorkshopPeriod
+from cayuman.templatetags.cayuman import get_block_template_django
+from cayuman.templatetags.cayuman import get_schedule_grid
+from cayuman.templatetags.cayuman import index_by_schedule
+from cayuman.templatetags.cayuman import render_timetable_cells
+from cayuman.templatetags.cayuman import TimetableExtension
+
+pytestmark = pytest.mark.django_db
+
+JINJA_TPL = """{% timetable workshop_periods, td_class=td_class %}
+{% if schedule in workshop_period.schedules.all() %}{{workshop_period.workshop.name}}{% endif %}
+{% endtimetable %}"""
+
+DJANGO_TPL = """{% load cayuman %}{% timetable workshop_periods %}
+{% if schedule in workshop_period.schedules.all %}{{workshop_period.workshop.name}}{% endif %}
+{% endtimetable %}"""
+
+
+@pytest.fixture
+def workshop_periods(create_period, create_teacher):
+    schedule = Schedule.objects.create(day="Lunes", time_start=time(10, 15), time_end=time(11, 15))
+    wp = WorkshopPeriod.objects.create(workshop=Workshop.objects.create(name="Comics"), period=create_period, teacher=create_teacher)
+    wp.schedules.add(schedule)
+    return [wp]
+
+
+def test_jinja2_block_template_compiled_once(workshop_periods):
+    """Test the jinja2 timetable body is compiled once by the configured environment and reused"""
+    env = engines["jinja2"].env
+    extension = next(ext for ext in env.extensions.values() if isinstance(ext, TimetableExtension))
+    template = env.from_string(JINJA_TPL)
+    extension.__dict__.pop("block_template", None)
+
+    with patch.object(env, "from_string", wraps=env.from_string) as from_string:
+        first = template.render({"workshop_periods": workshop_periods, "td_class": "cell"})
+        second = template.render({"workshop_periods": workshop_periods, "td_class": "cell"})
+
+    assert first == second
+    assert "Comics" in first
+    from_string.assert_called_once()
+    assert extension.block_template.environment is env
+
+
+def test_jinja2_block_template_autoescapes(workshop_periods):
+    """Test the jinja2 timetable body honours the environment's autoescape setting"""
+    html = engines["jinja2"].from_string(JINJA_TPL).render({"workshop_periods": workshop_periods, "td_class": '"><script>'})
+    assert "<script>" not in html
+    assert "&#34;&gt;&lt;script&gt;" in html
+
+
+def test_django_block_template_compiled_once(workshop_periods):
+    """Test the django timetable body is compiled once and reused"""
+    template = engines["django"].from_string(DJANGO_TPL)
+    first = template.render({"workshop_periods": workshop_periods})
+
+    with patch("django.template.engine.Engine.from_string") as from_string:
+        second = template.render({"workshop_periods": workshop_periods})
+
+    assert first == second
+    assert "Comics" in first
+    from_string.assert_not_called()
+    assert get_block_template_django() is get_block_template_django()
+
+
+def test_benchmark_timetable_command(workshop_periods, create_period):
+    """Test the timetable benchmark command runs"""
+    out = StringIO()
+    call_command("benchmark_timetable", period=create_period.id, iterations=1, stdout=out)
+    assert "weekly schedule render (jinja2)" in out.getvalue()
+    assert "cycle timetable render (django)" in out.getvalue()
+
+
+@pytest.fixture
+def weekly_grid(create_period, create_teacher):
+    """Two time blocks on two days, with a workshop period on each schedule and one spanning two days"""
+    schedules = [
+        Schedule.objects.create(day=day, time_start=start, time_end=end)
+        for day in ("monday", "tuesday")
+        for start, end in ((time(10, 15), time(11, 15)), (time(12, 30), time(13, 30)))
+    ]
+    workshop_periods = []
+    for i, schedule in enumerate(schedules):
+        wp = WorkshopPeriod.objects.create(workshop=Workshop.objects.create(name=f"Workshop {i}"), period=create_period, teacher=create_teacher)
+        wp.schedules.add(schedule)
+        workshop_periods.append(wp)
+    spanning = WorkshopPeriod.objects.create(workshop=Workshop.objects.create(name="Spanning"), period=create_period, teacher=create_teacher)
+    spanning.schedules.add(schedules[0], schedules[2])
+    return schedules
+
+
+def test_index_by_schedule(weekly_grid, django_assert_num_queries):
+    """Test workshop periods are indexed by schedule with a single prefetch query"""
+    workshop_periods = list(WorkshopPeriod.objects.order_by("id"))
+    with django_assert_num_queries(1):
+        index = index_by_schedule(workshop_periods)
+
+    assert [wp.workshop.name for wp in index[weekly_grid[0].id]] == ["Workshop 0", "Spanning"]
+    assert [wp.workshop.name for wp in index[weekly_grid[1].id]] == ["Workshop 1"]
+    assert [wp.workshop.name for wp in index[weekly_grid[2].id]] == ["Workshop 2", "Spanning"]
+
+
+def test_body_rendered_only_for_hits(weekly_grid):
+    """Test the body is only rendered for workshop periods taking place on each schedule"""
+    workshop_periods = WorkshopPeriod.objects.order_by("id")
+    calls = []
+
+    def render_body(schedule, workshop_period):
+        calls.append((schedule.id, workshop_period.id))
+        return workshop_period.workshop.name
+
+    cells = render_timetable_cells(workshop_periods, weekly_grid, render_body)
+    # 4 single schedule workshop periods plus one on 2 schedules
+    assert len(calls) == 6
+    assert cells[weekly_grid[0].id] == "Workshop 0Spanning"
+    assert cells[weekly_grid[3].id] == "Workshop 3"
+
+
+@pytest.mark.parametrize("engine,tpl", [("jinja2", JINJA_TPL), ("django", DJANGO_TPL)])
+def test_timetable_grid(weekly_grid, engine, tpl, django_assert_max_num_queries):
+    """Test cells land on their row and column, and queries don't grow with the number of workshop periods"""
+    template = engines[engine].from_string(tpl)
+    workshop_periods = WorkshopPeriod.objects.select_related("workshop").order_by("id")
+    get_schedule_grid()
+    # workshop periods and their prefetched schedules
+    with django_assert_max_num_queries(2):
+        html = template.render({"workshop_periods": workshop_periods, "td_class": "cell"})
+
+    rows = html.split("</tr>")
+    assert "10:15 - 11:15" in rows[1] and "Workshop 0" in rows[1] and "Spanning" in rows[1] and "Workshop 2" in rows[1]
+    assert "12:30 - 13:30" in rows[2] and "Workshop 1" in rows[2] and "Workshop 3" in rows[2]
+    assert "Spanning" not in rows[2]
+    assert rows[1].index("Workshop 0") < rows[1].index("Workshop 2")
+
+
+def test_schedule_grid(weekly_grid):
+    """Test the grid dedupes time blocks and lays schedules out on their rows"""
+    grid = get_schedule_grid()
+    assert [s.id for s in grid.schedules] == [weekly_grid[i].id for i in (0, 1, 2, 3)]
+    assert grid.blocks == [(time(10, 15), time(11, 15)), (time(12, 30), time(13, 30))]
+    assert grid.slots == [[weekly_grid[0].id, weekly_grid[2].id], [weekly_grid[1].id, weekly_grid[3].id]]
+
+
+def test_schedule_grid_is_cached(weekly_grid, django_assert_num_queries):
+    """Test the grid is built once and then read from cache"""
+    get_schedule_grid()
+    with django_assert_num_queries(0):
+        grid = get_schedule_grid()
+    assert len(grid.schedules) == 4
+
+
+@pytest.mark.parametrize("change", ["create", "update", "delete"])
+def test_schedule_grid_invalidation(weekly_grid, change):
+    """Test schedule changes are reflected in the grid without restarting"""
+    get_schedule_grid()
+    if change == "create":
+        Schedule.objects.create(day="Lunes", time_start=time(15, 0), time_end=time(16, 0))
+        expected = 3
+    elif change == "update":
+        weekly_grid[1].time_start, weekly_grid[1].time_end = time(15, 0), time(16, 0)
+        weekly_grid[1].save()
+        expected = 3
+    elif change == "delete":
+        for schedule in weekly_grid[1::2]:
+            schedule.delete()
+        expected = 1
+
+    assert len(get_schedule_grid().blocks) == expected
+
+
+CACHED_JINJA_TPL = """{% timetable workshop_periods, cache="test", td_class="cell" %}
+{% if schedule in workshop_period.schedules.all() %}{{workshop_period.workshop.name}}{% endif %}
+{% endtimetable %}"""
+
+
+def test_timetable_cache(weekly_grid):
+    """Test timetables showing the same workshop periods are rendered once"""
+    template = engines["jinja2"].from_string(CACHED_JINJA_TPL)
+    with patch("cayuman.templatetags.cayuman.render_timetable_cells", wraps=render_timetable_cells) as mock_render:
+        first = template.render({"workshop_periods": WorkshopPeriod.objects.order_by("id")})
+        # same set in another order, as for another student
+        second = template.render({"workshop_periods": list(WorkshopPeriod.objects.order_by("-id"))})
+        assert mock_render.call_count == 1
+
+        template.render({"workshop_periods": WorkshopPeriod.objects.order_by("id")[:2]})
+        assert mock_render.call_count == 2
+
+    assert first == second
+    assert "Workshop 3" in first
+
+
+@pytest.mark.parametrize("change", ["workshop", "schedule"])
+def test_timetable_cache_invalidation(weekly_grid, change):
+    """Test cached timetables are refreshed when workshops or schedules change"""
+    template = engines["jinja2"].from_string(CACHED_JINJA_TPL)
+    template.render({"workshop_periods": WorkshopPeriod.objects.all()})
+
+    if change == "workshop":
+        workshop = Workshop.objects.get(name="Workshop 3")
+        workshop.name = "Robotica"
+        workshop.save()
+        expected = "Robotica"
+    elif change == "schedule":
+        weekly_grid[3].time_start, weekly_grid[3].time_end = time(15, 0), time(16, 0)
+        weekly_grid[3].save()
+        expected = "15:00 - 16:00"
+
+    assert expected in template.render({"workshop_periods": WorkshopPeriod.objects.all()})
+
+
+def test_admin_cycle_timetable_cache(client_authenticated_superuser, weekly_grid, create_period, create_cycles, create_student):
+    """Test the admin cycle timetable workshop periods are cached, and student counts refresh on enrollments without clearing them"""
+    from django.core.cache import cache
+    from django.urls import reverse
+    from cayuman.caching import cycle_timetable_cache_key
+    from cayuman.models import StudentCycle
+
+    cycle = create_cycles[0]
+    wp = WorkshopPeriod.objects.get(workshop__name="Workshop 0")
+    wp.cycles.add(cycle)
+    url = reverse("admin:cayuman_cycle_timetable", args=[cycle.id, create_period.id])
+
+    assert "(0)" in client_authenticated_superuser.get(url).content.decode()
+    key = cycle_timetable_cache_key(cycle.id, create_period.id)
+    assert [cached.id for cached in cache.get(key)] == [wp.id]
+
+    student_cycle = StudentCycle.objects.create(student=create_student, cycle=cycle, date_joined=create_period.date_start)
+    student_cycle.workshop_periods.add(wp)
+    assert cycle_timetable_cache_key(cycle.id, create_period.id) == key
+    assert "(1)" in client_authenticated_superuser.get(url).content.decode()
+
+
+def _cycle_timetable_queries(client, url):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    return [query["sql"] for query in queries], response.content.decode()
+
+
+def test_admin_cycle_timetable_queries(client_authenticated_superuser, weekly_grid, create_period, create_cycles):
+    """
+    Test the cycle timetable is rendered in the same queries whatever its workshop periods, and served from cache
+    with a single query on them, counting their students
+    """
+    from django.urls import reverse
+
+    cycle = create_cycles[0]
+    url = reverse("admin:cayuman_cycle_timetable", args=[cycle.id, create_period.id])
+    workshop_periods = list(WorkshopPeriod.objects.order_by("id"))
+    workshop_periods[0].cycles.add(cycle)
+    client_authenticated_superuser.get(url)  # warm up per process caches (i.e. schedule grid)
+    workshop_periods[1].cycles.add(cycle)
+    few, _ = _cycle_timetable_queries(client_authenticated_superuser, url)
+    cached, _ = _cycle_timetable_queries(client_authenticated_superuser, url)
+
+    for wp in workshop_periods[2:]:
+        wp.cycles.add(cycle)
+    many, html = _cycle_timetable_queries(client_authenticated_superuser, url)
+
+    assert len(many) == len(few)
+    assert all(wp.workshop.name in html for wp in workshop_periods)
+    assert len(cached) < len(few)
+    [counts] = [sql for sql in cached if "cayuman_workshopperiod" in sql]
+    assert "COUNT" in counts
+
+
+def test_admin_cycle_timetable_invalidation(client_authenticated_superuser, weekly_grid, create_period, create_cycles, create_teacher):
+    """Test cached cycle timetables are refreshed when teachers are renamed, and say so when empty"""
+    from django.urls import reverse
+
+    cycle = create_cycles[0]
+    url = reverse("admin:cayuman_cycle_timetable", args=[cycle.id, create_period.id])
+    assert "No timetable for this cycle" in client_authenticated_superuser.get(url).content.decode()
+
+    WorkshopPeriod.objects.get(workshop__name="Workshop 0").cycles.add(cycle)
+    assert "No timetable for this cycle" not in client_authenticated_superuser.get(url).content.decode()
+
+    create_teacher.first_name = "Renamed"
+    create_teacher.save()
+    assert "Renamed" in client_authenticated_superuser.get(url).content.decode()
@@ -460,3 +460,112 @@ def test_url(
     # clean up
     if assign_student_cycle_workshop_period:
         student_cycle.workshop_periods.clear()
+
+
+def test_navbar_fragment_is_cached(client_authenticated_student, create_student_cycle, create_period):
+    """Test the navbar's period dropdown and cycle pill are rendered once and then served from cache"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    url = reverse("workshop_periods", kwargs={"period_id": create_period.id})
+    with CaptureQueriesContext(connection) as first:
+        response = client_authenticated_student.get(url)
+    assert "Cycle 1" in response.content.decode()
+
+    with CaptureQueriesContext(connection) as second:
+        response = client_authenticated_student.get(url)
+    assert "Cycle 1" in response.content.decode()
+    assert len(second) < len(first)
+
+
+def test_navbar_fragment_invalidation(client_authenticated_student, create_student_cycle, create_period):
+    """Test the cached navbar reflects changes to cycles, student cycles and periods"""
+    url = reverse("workshop_periods", kwargs={"period_id": create_period.id})
+    client_authenticated_student.get(url)
+
+    # cycle renamed
+    create_student_cycle.cycle.name = "Renamed Cycle"
+    create_student_cycle.cycle.save()
+    assert "Renamed Cycle" in client_authenticated_student.get(url).content.decode()
+
+    # student moved to another cycle
+    create_student_cycle.cycle = Cycle.objects.create(name="Another Cycle")
+    create_student_cycle.save()
+    assert "Another Cycle" in client_authenticated_student.get(url).content.decode()
+
+    # new period shows up in the dropdown with a url switched to it
+    period_2 = Period.objects.create(
+        name="Period 2",
+        enrollment_start=timezone.make_aware(datetime(2024, 7, 1)),
+        date_start=timezone.make_aware(datetime(2024, 7, 10)).date(),
+        date_end=timezone.make_aware(datetime(2024, 8, 10)).date(),
+    )
+    content = client_authenticated_student.get(url).content.decode()
+    assert reverse("workshop_periods", kwargs={"period_id": period_2.id}) in content
+
+
+def _count_queries(client, url):
+    """Number of queries run to render `url` from a cold fragment cache"""
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    # warm up per process caches (i.e. current period), then drop cached fragments
+    client.get(url)
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(queries), response.content.decode()
+
+
+def _add_workshop_periods(period, teacher, cycle, student_cycle=None):
+    """Adds workshop periods on schedules sorting before `create_schedule`'s, returning their workshop names in schedules order"""
+    from datetime import time
+    from cayuman.models import Schedule
+
+    names = []
+    for day in ("thursday", "tuesday", "wednesday", "monday"):
+        wp = WorkshopPeriod.objects.create(workshop=Workshop.objects.create(name=f"Workshop {day}"), period=period, teacher=teacher)
+        wp.cycles.add(cycle)
+        wp.schedules.add(Schedule.objects.create(day=day, time_start=time(10, 15), time_end=time(11, 15)))
+        if student_cycle:
+            student_cycle.workshop_periods.add(wp)
+        names.append(wp.workshop.name)
+    return sorted(names, key=lambda name: ("monday", "tuesday", "wednesday", "thursday").index(name.split()[1]))
+
+
+@pytest.fixture
+def during_period():
+    """Pretend today is a day within `create_period`"""
+    with patch("cayuman.models.timezone") as mock_datetime:
+        mock_datetime.now.return_value = timezone.make_aware(datetime(2024, 5, 10))
+        yield
+
+
+def test_workshop_periods_queries(during_period, client_authenticated_student, create_student_cycle, create_period, create_teacher, create_cycle):
+    """Test the workshop periods page runs the same queries whatever the number of workshop periods, in a stable order"""
+    url = reverse("workshop_periods", kwargs={"period_id": create_period.id})
+    num_queries, _ = _count_queries(client_authenticated_student, url)
+
+    names = _add_workshop_periods(create_period, create_teacher, create_cycle)
+    more_queries, content = _count_queries(client_authenticated_student, url)
+
+    assert more_queries == num_queries
+    positions = [content.index(name) for name in names + ["Fractangulos"]]
+    assert positions == sorted(positions)
+
+
+def test_weekly_schedule_queries(
+    during_period, client_authenticated_student, create_student_cycle, create_workshops_period, create_period, create_teacher, create_cycle
+):
+    """Test the weekly schedule runs the same queries whatever the number of workshop periods"""
+    create_student_cycle.workshop_periods.add(create_workshops_period)
+    url = reverse("weekly_schedule", kwargs={"period_id": create_period.id})
+    num_queries, _ = _count_queries(client_authenticated_student, url)
+
+    names = _add_workshop_periods(create_period, create_teacher, create_cycle, student_cycle=create_student_cycle)
+    more_queries, content = _count_queries(client_authenticated_student, url)
+
+    assert more_queries == num_queries
+    assert all(name in content for name in names)
@@ -1,8 +1,10 @@
 from datetime import datetime
 from datetime import time
+from unittest.mock import patch
 
 import pytest
 from django.core.exceptions import ValidationError
+from django.template.loader import render_to_string
 from django.utils import timezone
 
 from cayuman.models import Period
@@ -106,3 +108,137 @@ def test_workshop_period_overlapping(create_workshops, create_teacher, create_pe
 
     # there's overlapping because both wp have schedule at Lunes, same time
     assert wp1 & wp2
+
+
+@pytest.fixture
+def workshop_period(create_teacher, create_workshops, create_period, create_schedule, create_cycles):
+    wp = WorkshopPeriod.objects.create(workshop=create_workshops[0], period=create_period, teacher=create_teacher)
+    wp.cycles.add(create_cycles[0])
+    wp.schedules.add(create_schedule)
+    return wp
+
+
+def test_workshop_period_page_is_cached(client_authenticated_student, workshop_period):
+    """Test the workshop period page body is rendered once and then served from cache"""
+    url = workshop_period.get_absolute_url()
+    with patch("cayuman.views.render_to_string", wraps=render_to_string) as mock_render:
+        response_1 = client_authenticated_student.get(url)
+        response_2 = client_authenticated_student.get(url)
+
+    assert response_1.status_code == response_2.status_code == 200
+    assert mock_render.call_count == 1
+    assert "Fractangulos" in response_2.content.decode()
+    assert "Test Teacher" in response_2.content.decode()
+
+
+@pytest.mark.parametrize("change", ["workshop", "teacher", "period", "schedules", "schedule"])
+def test_workshop_period_page_cache_invalidation(change, client_authenticated_student, workshop_period):
+    """Test the cached workshop period page is refreshed when anything it shows changes"""
+    url = workshop_period.get_absolute_url()
+    client_authenticated_student.get(url)
+
+    if change == "workshop":
+        workshop_period.workshop.name = "Robotica"
+        workshop_period.workshop.save()
+        expected = "Robotica"
+    elif change == "teacher":
+        workshop_period.teacher.last_name = "Renamed"
+        workshop_period.teacher.save()
+        expected = "Renamed"
+    elif change == "period":
+        workshop_period.period.date_end = timezone.make_aware(datetime(2023, 11, 30)).date()
+        workshop_period.period.save()
+        expected = "2023-11-30"
+    elif change == "schedules":
+        workshop_period.schedules.add(Schedule.objects.create(day="tuesday", time_start=time(12, 30), time_end=time(13, 30)))
+        expected = "12:30 - 13:30"
+    elif change == "schedule":
+        schedule = workshop_period.schedules.get()
+        schedule.time_start, schedule.time_end = time(8, 0), time(9, 0)
+        schedule.save()
+        expected = "08:00 - 09:00"
+
+    response = client_authenticated_student.get(url)
+    assert expected in response.content.decode()
+
+
+def test_workshop_period_page_not_cached_on_login(client, create_student, workshop_period):
+    """Test logins (which only save `last_login`) do not invalidate cached pages"""
+    from cayuman.caching import workshop_period_cache_key
+
+    client.force_login(create_student)
+    client.get(workshop_period.get_absolute_url())
+    key = workshop_period_cache_key(workshop_period.id)
+
+    client.force_login(workshop_period.teacher)
+    assert workshop_period_cache_key(workshop_period.id) == key
+
+
+def _add_enrolled_workshop_periods(count, period, teacher, cycle, student):
+    """Adds `count` workshop periods on `cycle`, each on its own schedule and with `student` enrolled"""
+    from cayuman.models import StudentCycle
+    from cayuman.models import Workshop
+
+    student_cycle = StudentCycle.objects.filter(student=student).first() or StudentCycle.objects.create(student=student, cycle=cycle)
+    start = WorkshopPeriod.objects.count()
+    for i in range(start, start + count):
+        wp = WorkshopPeriod.objects.create(workshop=Workshop.objects.create(name=f"Workshop {i}"), period=period, teacher=teacher)
+        wp.cycles.add(cycle)
+        day, hour = ("tuesday", "wednesday", "thursday", "friday")[i // 10], 8 + i % 10
+        wp.schedules.add(Schedule.objects.create(day=day, time_start=time(hour, 0), time_end=time(hour, 30)))
+        student_cycle.workshop_periods.add(wp)
+
+
+def _admin_queries(client, url, **data):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    method = client.post if data else client.get
+    method(url, data)  # warm up per process caches (i.e. current period)
+    with CaptureQueriesContext(connection) as queries:
+        response = method(url, data)
+        # streamed responses query while they're sent
+        content = response.getvalue().decode()
+    assert response.status_code == 200
+    return len(queries), response, content
+
+
+def test_admin_changelist_queries(client_authenticated_superuser, create_period, create_teacher, create_cycles, create_student):
+    """Test the workshop periods changelist runs the same queries whatever the number of rows"""
+    from django.urls import reverse
+
+    url = reverse("admin:cayuman_workshopperiod_changelist") + f"?period__id__exact={create_period.id}"
+    _add_enrolled_workshop_periods(2, create_period, create_teacher, create_cycles[0], create_student)
+    few, _, _ = _admin_queries(client_authenticated_superuser, url)
+
+    _add_enrolled_workshop_periods(15, create_period, create_teacher, create_cycles[0], create_student)
+    many, response, _ = _admin_queries(client_authenticated_superuser, url)
+
+    assert many == few
+    assert len(response.context["cl"].result_list) == 17
+    assert all(wp.count_students() == 1 for wp in response.context["cl"].result_list)
+
+
+def test_admin_csv_export_queries(client_authenticated_superuser, create_period, create_teacher, create_cycles, create_student):
+    """Test the CSV export runs the same queries whatever the number of rows"""
+    import csv
+    from django.urls import reverse
+
+    url = reverse("admin:cayuman_workshopperiod_changelist") + f"?period__id__exact={create_period.id}"
+
+    def export():
+        ids = [str(wp_id) for wp_id in WorkshopPeriod.objects.values_list("id", flat=True)]
+        return _admin_queries(client_authenticated_superuser, url, action="export_to_csv", _selected_action=ids)
+
+    _add_enrolled_workshop_periods(2, create_period, create_teacher, create_cycles[0], create_student)
+    few, _, _ = export()
+
+    _add_enrolled_workshop_periods(15, create_period, create_teacher, create_cycles[0], create_student)
+    many, response, content = export()
+
+    assert many == few
+    assert response.streaming
+    rows = list(csv.reader(content.splitlines()))
+    assert len(rows) == 18
+    # enrolled students and active
+    assert {(row[5], row[7]) for row in rows[1:]} == {("1", "0")}